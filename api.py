@@ -1,23 +1,160 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import asyncio
+import json
 import os
 import time
-import requests
-import json
-from dotenv import load_dotenv
-from typing import Optional, List, Dict
-from browser_use_download import get_browser_use_download_url
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+from env import load_env
+
+_import_started = time.perf_counter()
+# Before the imports below, which read their settings at import time
+load_env()
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from browser_use_agent_download_url import extract_download_url_from_agent, extract_download_button_headers
-from elevenlabs_download import download_elevenlabs_history_audio
-import boto3
-from botocore.exceptions import ClientError
-import datetime
+from models import ScriptRequest, ScriptResponse, SpeechRequest, BatchRequest, JobStatus, JobListResponse
+from pipeline import (
+    run_enhancement,
+    open_speech,
+    job_key,
+    result_cache,
+    task_poller,
+    session_pool,
+    history_index,
+    uploads_cache,
+    warm_up,
+)
+from jobs import Job, JobManager
+from job_store import JobStore
+from http_client import client_for, close_clients, BROWSER_USE_BASE_URL, ELEVENLABS_BASE_URL, warm_up as http_warm_up
+from history_index import run_periodic_sync
+from audio_serving import audio_response, serve_audio_file
+from s3_storage import s3_uploader
+from task_webhooks import (
+    InvalidWebhook, SIGNATURE_HEADER, STATUS_EVENT, TIMESTAMP_HEADER, WEBHOOK_SECRET, verify_event,
+)
+from rate_limits import BATCH_PRIORITY, limiter_for, limiter_stats
+from coordination import coordinator
+from metrics import (
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS, log_event, log_message, register_gauge, render_metrics, request_id_var,
+)
 
-# Load environment variables
-load_dotenv()
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+
+job_manager = JobManager(run_enhancement, key_func=job_key, store=JobStore(), coordinator=coordinator)
+
+register_gauge('tts_jobs_queued', 'Jobs waiting for a worker.', lambda: job_manager.counts()['queued'])
+register_gauge('tts_jobs_running', 'Jobs being processed.', lambda: job_manager.counts()['running'])
+register_gauge('tts_job_workers', 'Size of the job worker pool.', lambda: job_manager.workers)
+register_gauge('tts_jobs_resumed_total', 'Unfinished jobs resumed from the job store.',
+               lambda: job_manager.resumed_total)
+register_gauge('tts_jobs_adopted_total', 'Unfinished jobs taken over from a worker process that stopped.',
+               lambda: job_manager.adopted_total)
+register_gauge('tts_job_store_pending_writes', 'Job snapshots waiting for the next store flush.',
+               lambda: job_manager.store.stats()['pending'])
+register_gauge('tts_jobs_coalesced_total', 'Requests attached to an identical in-flight job.',
+               lambda: job_manager.coalesced_total)
+register_gauge('tts_task_poller_in_flight', 'browser-use tasks being polled.', lambda: len(task_poller.watches))
+register_gauge('tts_task_poller_polls_total', 'browser-use task polls.', lambda: task_poller.polls_total)
+register_gauge('tts_task_poller_rate_limited_total', 'Polls answered with 429/503.', lambda: task_poller.rate_limited)
+register_gauge('tts_task_webhook_events_total', 'browser-use webhook events received.',
+               lambda: task_poller.events_total)
+register_gauge('tts_task_pushed_completions_total', 'Tasks completed by a webhook event rather than a poll.',
+               lambda: task_poller.pushed_completions)
+register_gauge('tts_task_expected_duration_seconds', 'Learned browser-use task duration driving the poll schedule.',
+               lambda: task_poller.expected_duration)
+register_gauge('tts_browser_sessions_leased', 'Pooled browser profiles leased by jobs.',
+               lambda: session_pool.stats()['leased'] if session_pool.enabled else None)
+register_gauge('tts_browser_session_waiting', 'Jobs waiting for a pooled browser profile.',
+               lambda: session_pool.waiting if session_pool.enabled else None)
+register_gauge('tts_browser_session_relogins_total', 'Logins run because a pooled profile expired.',
+               lambda: session_pool.relogins if session_pool.enabled else None)
+for _service in ('browser_use', 'elevenlabs'):
+    register_gauge(f'tts_{_service}_slots_in_use', f'{_service} concurrency slots held.',
+                   lambda service=_service: limiter_for(service).in_use)
+    register_gauge(f'tts_{_service}_admission_waiting', f'Callers waiting for a {_service} token or slot.',
+                   lambda service=_service: limiter_for(service).stats()['waiting_for_token']
+                   + limiter_for(service).stats()['waiting_for_slot'])
+    register_gauge(f'tts_{_service}_rate_limited_total', f'429/503 answers from {_service} that were retried.',
+                   lambda service=_service: limiter_for(service).rate_limited)
+register_gauge('tts_result_cache_hits_total', 'Result cache hits.', lambda: result_cache.hits)
+register_gauge('tts_result_cache_misses_total', 'Result cache misses.', lambda: result_cache.misses)
+register_gauge('tts_uploads_cache_bytes', 'Bytes held in the uploads cache.', lambda: uploads_cache.stats()['bytes'])
+register_gauge('tts_warm_up_seconds', 'Duration of the post-startup warm-up, once it finished.',
+               lambda: startup['warm_up_seconds'])
+
+# Cold start timings (seconds): module import, import start to lifespan ready, background warm-up
+startup = {'import_seconds': None, 'ready_seconds': None, 'warm_up_seconds': None}
+
+
+async def _forward_task_events():
+    """With several workers: apply webhook events that another worker received for our tasks."""
+    while True:
+        await asyncio.sleep(0.5)
+        try:
+            events = await asyncio.to_thread(coordinator.take_events, list(task_poller.watches))
+        except Exception as e:
+            log_message(f"Reading forwarded task events failed: {e}", level='error')
+            continue
+        for task_id, status, details in events:
+            task_poller.notify(task_id, status, details)
 
-app = FastAPI(title="ElevenLabs TTS Enhancement API", version="1.0.0")
+
+async def _warm_up():
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(http_warm_up)
+        # Shared clients belong to the serving event loop; with the SSL context ready this is cheap
+        for base_url in (BROWSER_USE_BASE_URL, ELEVENLABS_BASE_URL):
+            client_for(base_url)
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        log_message(f"Warm-up failed, first requests will do the work instead: {e}", level='error')
+    startup['warm_up_seconds'] = round(time.perf_counter() - started, 3)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await coordinator.start()
+    await job_manager.start()
+    # With several workers, each background loop below runs in only one of them (coordination.py)
+    history_sync = None
+    sync_interval = float(os.getenv('HISTORY_SYNC_INTERVAL', '300'))
+    if os.getenv('ELEVENLABS_API_KEY') and sync_interval > 0:
+        history_sync = asyncio.create_task(coordinator.singleton('history-sync', lambda: run_periodic_sync(
+            history_index, os.getenv('ELEVENLABS_API_KEY'), sync_interval
+        )))
+    session_checks = None
+    if session_pool.enabled and os.getenv('BROWSER_USE_API_KEY'):
+        session_checks = asyncio.create_task(coordinator.singleton('session-health', lambda: (
+            session_pool.run_health_checks(os.getenv('BROWSER_USE_API_KEY'), os.getenv('ELEVENLABS_EMAIL'),
+                                           os.getenv('ELEVENLABS_PASSWORD'))
+        )))
+    eviction = asyncio.create_task(coordinator.singleton('uploads-eviction', lambda: uploads_cache.run_eviction(
+        float(os.getenv('UPLOADS_CACHE_EVICT_INTERVAL', '60'))
+    )))
+    forwarding = asyncio.create_task(_forward_task_events()) if coordinator.enabled else None
+    # Everything /health does not need happens after the server is accepting requests
+    warming = asyncio.create_task(_warm_up())
+    startup['ready_seconds'] = round(time.perf_counter() - _import_started, 3)
+    yield
+    warming.cancel()
+    eviction.cancel()
+    if forwarding is not None:
+        forwarding.cancel()
+    if session_checks is not None:
+        session_checks.cancel()
+    if history_sync is not None:
+        history_sync.cancel()
+    await job_manager.stop()
+    await coordinator.stop()
+    await close_clients()
+
+
+app = FastAPI(title="ElevenLabs TTS Enhancement API", version="1.0.0", lifespan=lifespan)
 
 # Enable CORS for all origins
 app.add_middleware(
@@ -28,281 +165,185 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class ScriptRequest(BaseModel):
-    script: str
-    voice_id: Optional[str] = None
-
-class ScriptResponse(BaseModel):
-    enhanced_script: Optional[str] = None
-    audio_url: Optional[str] = None
-    audio_file_path: Optional[str] = None
-    audio_id: Optional[str] = None
-    latest_history_item_id: Optional[str] = None
-    browser_use_download_url: Optional[str] = None
-    agent_ui_download_url: Optional[str] = None
-    agent_ui_download_button_headers: Optional[list[dict[str, str]]] = None
-    elevenlabs_downloaded_audio_path: Optional[str] = None
-    s3_audio_url: Optional[str] = None
-    task_id: str
-    status: str
-    message: str
-
-def create_task(instructions: str, api_key: str):
-    url = 'https://api.browser-use.com/api/v1/run-task'
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
-    response = requests.post(url, headers=headers, json={'task': instructions})
-    if response.status_code != 200:
-        print("Status code:", response.status_code)
-        print("Response text:", response.text)
-    response.raise_for_status()
-    return response.json()['id']
-
-def get_task_details(task_id: str, api_key: str):
-    url = f'https://api.browser-use.com/api/v1/task/{task_id}'
-    headers = {'Authorization': f'Bearer {api_key}'}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
-
-def wait_for_completion(task_id: str, api_key: str, poll_interval: int = 3, timeout_minutes: int = 10):
-    start_time = time.time()
-    timeout_seconds = timeout_minutes * 60
-    
-    while True:
-        # Check if we've exceeded the timeout
-        if time.time() - start_time > timeout_seconds:
-            raise Exception(f"Task timed out after {timeout_minutes} minutes")
-            
-        details = get_task_details(task_id, api_key)
-        status = details['status']
-        print(f"Task status: {status}")
-        if status in ['finished', 'failed', 'stopped']:
-            return details
-        time.sleep(poll_interval)
-
-def download_file(url, save_path):
-    response = requests.get(url)
-    response.raise_for_status()
-    with open(save_path, 'wb') as f:
-        f.write(response.content)
-    print(f"Downloaded file to {save_path}")
-
-def get_latest_history_item_id():
-    api_key = os.getenv('ELEVENLABS_API_KEY')
-    if not api_key:
-        raise Exception('ELEVENLABS_API_KEY is not set in the environment.')
-    url = 'https://api.elevenlabs.io/v1/history'
-    headers = {
-        'xi-api-key': api_key,
-        'Accept': 'application/json'
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    latest_item_id = data.get('history', [{}])[0].get('history_item_id')
-    print(f'🆕 Latest history_item_id: {latest_item_id}')
-    return latest_item_id
-
-def upload_file_to_s3(file_path, bucket, object_name, expiration=3600):
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_DEFAULT_REGION')
-    )
-    try:
-        s3_client.upload_file(file_path, bucket, object_name)
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket, 'Key': object_name},
-            ExpiresIn=expiration
-        )
-        return url
-    except ClientError as e:
-        print(f"S3 upload error: {e}")
-        return None
-
-def get_elevenlabs_history_ids() -> list:
-    api_key = os.getenv('ELEVENLABS_API_KEY')
-    if not api_key:
-        print('ELEVENLABS_API_KEY is not set in the environment.')
-        return []
-    url = 'https://api.elevenlabs.io/v1/history'
-    headers = {
-        'xi-api-key': api_key,
-        'Accept': 'application/json'
-    }
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    # Tag everything done for this request (jobs, logs, outbound calls) with one id
+    request_id = request.headers.get('x-request-id') or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    status_code = 500
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        return [item.get('history_item_id') for item in data.get('history', []) if 'history_item_id' in item]
-    except Exception as e:
-        print(f'Error fetching ElevenLabs history: {e}')
-        return []
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers['X-Request-ID'] = request_id
+        return response
+    finally:
+        seconds = time.perf_counter() - started
+        route = request.scope.get('route')
+        # The route template, not the raw path, keeps label cardinality bounded
+        route_path = getattr(route, 'path', 'unmatched')
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+        HTTP_REQUEST_SECONDS.observe(seconds, route=route_path)
+        if route_path != '/metrics':
+            log_event('http_request', method=request.method, path=request.url.path, status=status_code,
+                      seconds=round(seconds, 3))
+        request_id_var.reset(token)
 
 @app.post("/enhance-script/", response_model=ScriptResponse)
 async def enhance_script(request: ScriptRequest):
+    # Runs through the same worker pool as /jobs, but waits for the result
+    job = await job_manager.submit(request)
+    await job.done.wait()
+    if job.error is not None:
+        raise HTTPException(status_code=job.error_status, detail=f"Error processing script: {job.error}")
+    return job.result
+
+def _batch_event(event: str, data: dict, sse: bool) -> str:
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return json.dumps({"event": event, **data}, default=str) + "\n"
+
+def _batch_item(index: int, job: Job) -> dict:
+    return {
+        "index": index,
+        "job_id": job.id,
+        "status": job.status,
+        "result": job.result.model_dump() if job.result is not None else None,
+        "error": job.error,
+        "error_status": job.error_status if job.error is not None else None,
+    }
+
+@app.post("/enhance-script/batch")
+async def enhance_script_batch(batch: BatchRequest, request: Request):
+    """
+    Queue every item at batch priority and stream each result as soon as its job finishes:
+    NDJSON by default, server-sent events when the client accepts text/event-stream.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=422, detail="Batch has no items")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch has more than {BATCH_MAX_ITEMS} items")
+    priority = batch.priority if batch.priority is not None else BATCH_PRIORITY
+    jobs = [await job_manager.submit(item, priority=priority) for item in batch.items]
+    sse = 'text/event-stream' in request.headers.get('accept', '')
+
+    async def events():
+        yield _batch_event("accepted", {"jobs": [job.id for job in jobs]}, sse)
+        waits = {asyncio.create_task(job.done.wait()): index for index, job in enumerate(jobs)}
+        failed = 0
+        try:
+            while waits:
+                done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in done:
+                    index = waits.pop(waiter)
+                    failed += jobs[index].error is not None
+                    yield _batch_event("result", _batch_item(index, jobs[index]), sse)
+            yield _batch_event("done", {"completed": len(jobs) - failed, "failed": failed}, sse)
+        finally:
+            # Client went away: the jobs keep running and stay available at /jobs/{id}
+            for waiter in waits:
+                waiter.cancel()
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.post("/tts/stream")
+async def tts_stream(request: SpeechRequest, http_request: Request):
+    # Fast path without the enhancement step: audio is forwarded as ElevenLabs produces it
     try:
-        # Get environment variables
-        api_key = os.getenv('BROWSER_USE_API_KEY')
-        elevenlabs_email = os.getenv('ELEVENLABS_EMAIL')
-        elevenlabs_password = os.getenv('ELEVENLABS_PASSWORD')
-        env_voice_id = os.getenv('VOICE_ID')  # Get voice_id from environment as fallback
-        
-        if not api_key:
-            raise HTTPException(status_code=500, detail="BROWSER_USE_API_KEY is not set in the environment.")
-        if not elevenlabs_email or not elevenlabs_password:
-            raise HTTPException(status_code=500, detail="ELEVENLABS_EMAIL and ELEVENLABS_PASSWORD must be set in the environment.")
-
-        # Use voice_id from request, or fallback to environment variable
-        voice_id_to_use = request.voice_id if request.voice_id else env_voice_id
-        
-        # Debug: Print which voice ID is being used
-        print(f"Using voice ID: {voice_id_to_use}")
-        print(f"Script length: {len(request.script)} characters")
-        
-        # Build instructions for task 1 (audio generation)
-        if voice_id_to_use:
-            voice_selection = f"first, click on the voice dropdown and select the voice with ID '{voice_id_to_use}', wait for the voice to be selected, then "
-        else:
-            voice_selection = ""
-        
-        instructions_task1 = (
-            f"Go to https://elevenlabs.io/app/speech-synthesis/text-to-speech, "
-            f"if redirected to login or signup, log in using email: {elevenlabs_email} and password: {elevenlabs_password}, "
-            f"after successful login, go to the text-to-speech section, "
-            f"{voice_selection}"
-            f"paste the following script EXACTLY as provided into the text input area (do not modify, shorten, or change the script in any way): \"{request.script}\", "
-            "click the 'Enhance (alpha)' button, "
-            "wait for the enhanced script to appear in the text area, "
-            "verify that the enhanced script contains the full original content, "
-            "click the 'Generate speech' button, "
-            "wait for the audio to be generated, "
-            "do not download or fetch the audio file yet."
-        )
-
-        # Fetch history before task 1
-        history_before = get_elevenlabs_history_ids()
-
-        # Task 1 logic remains unchanged
-        print("Creating task 1 (audio generation)...")
-        task1_id = create_task(instructions_task1, api_key)
-        print(f"Task 1 created with ID: {task1_id}")
-        print("Waiting for task 1 completion...")
-        details = wait_for_completion(task1_id, api_key, timeout_minutes=20)
-        print("Task 1 completed!")
-
-        # Process the results from task 1
-        enhanced_script = None
-        audio_id = None
-        message = "Audio generated and uploaded to S3."
-
-        # Try to extract enhanced script from output
-        steps = details.get('steps', [])
-        output_text = details.get('output', '')
-        enhanced_script = None
-        if output_text and len(output_text) > len(request.script):
-            enhanced_script = output_text
-            print(f"Found enhanced script in main output: {len(enhanced_script)} characters")
-        if not enhanced_script:
-            for i, step in enumerate(steps):
-                step_output = step.get('output', '')
-                if step_output and len(step_output) > len(request.script):
-                    enhanced_script = step_output
-                    print(f"Found enhanced script in step {i}: {len(enhanced_script)} characters")
-                    break
-        if not enhanced_script:
-            for step in steps:
-                step_output = step.get('output', '')
-                if step_output and len(step_output) > 50 and any(word in step_output.lower() for word in ['enhanced', 'script', 'text']):
-                    enhanced_script = step_output
-                    print(f"Found potential enhanced script: {len(enhanced_script)} characters")
-                    break
-        if enhanced_script:
-            print(f"Final enhanced script length: {len(enhanced_script)} characters")
-        else:
-            print("No enhanced script found in output")
-            enhanced_script = output_text  # Fallback to main output
-
-        # Try to extract the audio's unique id from the steps using the selector
-        audio_id = None
-        for step in steps:
-            step_output = step.get('output', '')
-            import re
-            match = re.search(r'<button[^>]*data-type=["\ ](list-item-trigger-overlay)["\ ][^>]*id=["\ ]([\w-]+)["\ ]', step_output)
-            if match:
-                audio_id = match.group(2)
-                print(f"Found audio_id: {audio_id}")
-                break
-
-        # Fetch history before task 1
-        history_before = get_elevenlabs_history_ids()
-
-        # Poll for new history item
-        latest_history_item_id = None
-        poll_start = datetime.datetime.now()
-        max_wait = 30  # seconds
-        while (datetime.datetime.now() - poll_start).total_seconds() < max_wait:
-            history_after = get_elevenlabs_history_ids()
-            new_ids = [hid for hid in history_after if hid not in history_before]
-            if new_ids:
-                latest_history_item_id = new_ids[0]
-                print(f"New history item found: {latest_history_item_id}")
-                break
-            time.sleep(2)
-        if not latest_history_item_id:
-            print("No new history item found after polling, falling back to most recent.")
-            history_after = get_elevenlabs_history_ids()
-            if history_after:
-                latest_history_item_id = history_after[0]
-
-        # Download the audio file to /uploads
-        elevenlabs_downloaded_audio_path = None
-        if latest_history_item_id:
-            os.makedirs('uploads', exist_ok=True)
-            audio_filename = f"{latest_history_item_id}.mp3"
-            audio_path = os.path.join('uploads', audio_filename)
-            success = download_elevenlabs_history_audio(latest_history_item_id, audio_path)
-            if success:
-                elevenlabs_downloaded_audio_path = audio_path
-                print(f"Downloaded ElevenLabs audio to {audio_path}")
-            else:
-                print(f"Failed to download ElevenLabs audio for history id {latest_history_item_id}")
-
-        # Upload to S3
-        s3_audio_url = None
-        if elevenlabs_downloaded_audio_path and os.path.exists(elevenlabs_downloaded_audio_path):
-            s3_bucket = os.getenv('S3_BUCKET_NAME')
-            s3_folder = os.getenv('S3_AUDIO_FOLDER', '')
-            import pathlib
-            file_name = pathlib.Path(elevenlabs_downloaded_audio_path).name
-            s3_key = f"{s3_folder}{file_name}" if s3_folder else file_name
-            s3_audio_url = upload_file_to_s3(elevenlabs_downloaded_audio_path, s3_bucket, s3_key)
-            if s3_audio_url:
-                print(f"S3 download link: {s3_audio_url}")
-
-        return ScriptResponse(
-            enhanced_script=enhanced_script,
-            audio_url=None,
-            audio_file_path=None,
-            audio_id=audio_id,
-            latest_history_item_id=latest_history_item_id,
-            browser_use_download_url=None,
-            agent_ui_download_url=None,
-            agent_ui_download_button_headers=None,
-            elevenlabs_downloaded_audio_path=elevenlabs_downloaded_audio_path,
-            s3_audio_url=s3_audio_url,
-            task_id=task1_id,
-            status=details.get('status', 'unknown'),
-            message="Audio generated and uploaded to S3."
-        )
+        source = await open_speech(request)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"ElevenLabs TTS failed with status {e.response.status_code}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"ElevenLabs TTS failed: {e}")
+    headers = {"X-Audio-Id": source.audio_id}
+    if source.path:
+        response = serve_audio_file(http_request, source.path)
+        response.headers.update(headers)
+        return response
+    if source.url:
+        return RedirectResponse(source.url, status_code=307, headers=headers)
+    if source.history_item_id:
+        headers["X-History-Item-Id"] = source.history_item_id
+    return StreamingResponse(source.chunks, media_type="audio/mpeg", headers=headers)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing script: {str(e)}")
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: ScriptRequest):
+    job = await job_manager.submit(request)
+    return job.to_status()
+
+@app.get("/jobs", response_model=JobListResponse)
+async def list_jobs():
+    return JobListResponse(
+        jobs=[job.to_status() for job in job_manager.list()],
+        **job_manager.counts()
+    )
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job = await job_manager.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_status()
+
+@app.post("/webhooks/browser-use")
+async def browser_use_webhook(request: Request):
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled (BROWSER_USE_WEBHOOK_SECRET is not set)")
+    body = await request.body()
+    try:
+        event = verify_event(body, request.headers.get(SIGNATURE_HEADER), request.headers.get(TIMESTAMP_HEADER),
+                             secret=WEBHOOK_SECRET)
+    except InvalidWebhook as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    payload = event['payload']
+    if event.get('type') != STATUS_EVENT or not payload.get('task_id'):
+        # Test deliveries and other event types are acknowledged and ignored
+        return {"ok": True, "matched": False}
+    matched = task_poller.notify(payload['task_id'], payload.get('status'), payload.get('details'))
+    if not matched and coordinator.enabled:
+        # The task may be watched by another worker process: leave the event for it
+        await asyncio.to_thread(coordinator.publish_event, payload['task_id'], payload.get('status'),
+                                payload.get('details'))
+    return {"ok": True, "matched": matched}
+
+@app.get("/history/search")
+async def search_history(text: Optional[str] = None, voice_id: Optional[str] = None, q: Optional[str] = None,
+                         stored_only: bool = False, limit: int = Query(50, ge=1, le=500)):
+    results = await asyncio.to_thread(history_index.search, text=text, voice_id=voice_id, q=q,
+                                      stored_only=stored_only, limit=limit)
+    return {
+        "results": results,
+        "indexed": await asyncio.to_thread(history_index.count),
+    }
+
+@app.api_route("/audio/{history_item_id}", methods=["GET", "HEAD"])
+async def get_audio(history_item_id: str, request: Request):
+    # Supports Range, ETag/Last-Modified and conditional requests so players can seek and resume
+    cached_path = await asyncio.to_thread(uploads_cache.lookup, history_item_id)
+    if cached_path is None:
+        indexed = await asyncio.to_thread(history_index.get, history_item_id)
+        cached_path = indexed.get('downloaded_path') if indexed else None
+    return audio_response(request, history_item_id, cached_path)
+
+@app.get("/stats")
+async def stats():
+    return {
+        "jobs": job_manager.counts(),
+        "job_store": job_manager.store.stats(),
+        "task_poller": task_poller.stats(),
+        "browser_sessions": session_pool.stats(),
+        "result_cache": {"hits": result_cache.hits, "misses": result_cache.misses},
+        "uploads_cache": await asyncio.to_thread(uploads_cache.stats),
+        "s3": s3_uploader.stats(),
+        "rate_limits": limiter_stats(),
+        "startup": startup,
+        "coordination": await asyncio.to_thread(coordinator.stats),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
@@ -314,10 +355,20 @@ async def root():
         "message": "ElevenLabs TTS Enhancement API",
         "endpoints": {
             "enhance_script": "/enhance-script/",
+            "enhance_script_batch": "/enhance-script/batch",
+            "tts_stream": "/tts/stream",
+            "jobs": "/jobs",
+            "browser_use_webhook": "/webhooks/browser-use",
+            "stats": "/stats",
+            "metrics": "/metrics",
+            "history_search": "/history/search",
+            "audio": "/audio/{history_item_id}",
             "health": "/health"
         }
     }
 
+startup['import_seconds'] = round(time.perf_counter() - _import_started, 3)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000) 
@@ -0,0 +1,127 @@
+import email.utils
+import mmap
+import os
+import re
+from typing import Iterator, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+AUDIO_DIR = 'uploads'
+STREAM_CHUNK_SIZE = 64 * 1024
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def local_audio_path(history_item_id: str, directory: str = AUDIO_DIR) -> Optional[str]:
+    """Path of the stored MP3 for `history_item_id`, or None if the id is invalid or the file is missing."""
+    if history_item_id.endswith('.mp3'):
+        history_item_id = history_item_id[:-4]
+    if not _SAFE_ID.match(history_item_id):
+        return None
+    path = os.path.join(directory, f"{history_item_id}.mp3")
+    return path if os.path.isfile(path) else None
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into an inclusive (start, end) pair.
+    Returns None when the header is absent or unsupported (e.g. multiple ranges), in which case
+    the whole file is served; raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('range not satisfiable')
+    return start, min(end, size - 1)
+
+
+def _iter_mmap(path: str, start: int, end: int) -> Iterator[bytes]:
+    # The kernel pages the file in on demand; only one chunk is copied out at a time
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = start
+            while position <= end:
+                stop = min(position + STREAM_CHUNK_SIZE, end + 1)
+                yield mapped[position:stop]
+                position = stop
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def _range_applies(request: Request, etag: str, last_modified: str) -> bool:
+    # If-Range: only honour Range when the client's copy is still current
+    if_range = request.headers.get('if-range')
+    return if_range is None or if_range.strip() in (etag, last_modified)
+
+
+def serve_audio_file(request: Request, path: str, media_type: str = 'audio/mpeg') -> Response:
+    """
+    Serve `path` with Range, ETag/Last-Modified and conditional GET support.
+    The body is streamed from a memory map, never read into memory whole.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': last_modified,
+        'Cache-Control': 'public, max-age=3600',
+    }
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    status_code = 200
+    start, end = 0, size - 1
+    if size and _range_applies(request, etag, last_modified):
+        try:
+            requested = parse_range(request.headers.get('range'), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1 if size else 0)
+
+    if request.method == 'HEAD' or size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_mmap(path, start, end), status_code=status_code, headers=headers,
+                             media_type=media_type)
+
+
+def audio_response(request: Request, history_item_id: str, fallback_path: Optional[str] = None) -> Response:
+    path = local_audio_path(history_item_id)
+    if path is None and fallback_path and os.path.isfile(fallback_path):
+        path = fallback_path
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No local audio for {history_item_id}")
+    return serve_audio_file(request, path)
@@ -0,0 +1,124 @@
+"""
+Compare the single-pass agent page parser with the previous BeautifulSoup implementation.
+
+Usage:
+    python benchmarks/bench_agent_page_parser.py                     # synthetic pages of several sizes
+    python benchmarks/bench_agent_page_parser.py page1.html page2.html  # recorded agent pages
+
+Reports the best wall time over a few runs and the peak traced memory of one run. Requires bs4
+for the reference implementation.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup, Tag  # noqa: E402
+from browser_use_agent_download_url import parse_agent_page  # noqa: E402
+
+
+def bs4_extract(html: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """The previous implementation: two full soups, buttons then links."""
+    soup = BeautifulSoup(html, 'html.parser')
+    download_url = None
+    for button in soup.find_all('button'):
+        if button.has_attr('data-download-url'):
+            val = button.get('data-download-url')
+            if isinstance(val, str) and val.startswith('http'):
+                download_url = val
+                break
+        found = None
+        for attr, attr_val in button.attrs.items():
+            if 'download' in attr and isinstance(attr_val, str) and attr_val.startswith('http'):
+                found = attr_val
+                break
+        if found:
+            download_url = found
+            break
+        if button.text and 'download' in button.text.lower():
+            link = button.find('a', href=True)
+            if link and isinstance(link, Tag):
+                href = link.get('href')
+                if isinstance(href, str) and href.startswith('http'):
+                    download_url = href
+                    break
+    if download_url is None:
+        for link in soup.find_all('a', href=True):
+            if 'download' in link.text.lower():
+                href = link.get('href')
+                if isinstance(href, str) and href.startswith('http'):
+                    download_url = href
+                    break
+    soup = BeautifulSoup(html, 'html.parser')
+    buttons = [{str(attr): str(val) for attr, val in button.attrs.items()} for button in soup.find_all('button')]
+    return download_url, buttons
+
+
+def single_pass_extract(html: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    info = parse_agent_page(html)
+    return info.download_url, info.buttons
+
+
+def synthetic_page(steps: int) -> str:
+    """An agent page with `steps` logged steps, each with a few buttons, links and a code block."""
+    parts = ['<!doctype html><html><head><title>Agent</title><style>.x{color:red}</style></head><body>']
+    for i in range(steps):
+        parts.append(
+            f'<div class="step" id="step-{i}"><h3>Step {i}</h3>'
+            f'<p>Clicked element &lt;div&gt; number {i} and waited for the page to settle.</p>'
+            f'<pre><code>{{"action": "click", "index": {i}, "text": "Generate speech"}}</code></pre>'
+            f'<button type="button" data-step="{i}" aria-label="Expand step {i}">Expand</button>'
+            f'<a href="https://cloud.browser-use.com/step/{i}">Step details</a>'
+            f'<img src="https://cdn.browser-use.com/shot/{i}.png" alt="screenshot"/></div>'
+        )
+    parts.append(
+        '<div class="result"><button class="btn primary" data-download-url="https://files.example.com/output.mp3">'
+        'Download</button><a href="https://files.example.com/output.mp3">download output</a></div>'
+        '<script>window.__STATE__ = {"download": "https://not-this.example.com"}</script></body></html>'
+    )
+    return ''.join(parts)
+
+
+def measure(func, html: str, repeat: int) -> Tuple[float, int, tuple]:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='Recorded agent page HTML files')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [(f'synthetic-{steps}-steps', synthetic_page(steps)) for steps in (100, 1000, 5000)]
+
+    print(f"{'page':<26}{'size':>10}{'bs4 ms':>10}{'new ms':>10}{'speedup':>9}{'bs4 MiB':>10}{'new MiB':>10}  same")
+    for name, html in pages:
+        old_time, old_peak, old_result = measure(bs4_extract, html, args.repeat)
+        new_time, new_peak, new_result = measure(single_pass_extract, html, args.repeat)
+        # Attribute values are compared as raw strings; bs4 renders multi-valued ones (class) as lists
+        same = old_result[0] == new_result[0] and len(old_result[1]) == len(new_result[1])
+        print(f"{name:<26}{len(html) // 1024:>8}Ki{old_time * 1000:>10.1f}{new_time * 1000:>10.1f}"
+              f"{old_time / new_time:>8.1f}x{old_peak / 2 ** 20:>10.1f}{new_peak / 2 ** 20:>10.1f}  {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark for extract_task_output against the previous multi-pass scans.
+
+Usage:
+    python benchmarks/bench_task_output.py                 # synthetic task details with 50-2000 steps
+    python benchmarks/bench_task_output.py details.json    # recorded task details (GET /api/v1/task/{id})
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_output import extract_task_output  # noqa: E402
+
+
+def legacy_extract(details: dict, script: str):
+    """The previous code path: up to three passes for the script, one for the audio id, one for the URL."""
+    steps = details.get('steps', [])
+    output_text = details.get('output', '')
+    enhanced_script = None
+    if output_text and len(output_text) > len(script):
+        enhanced_script = output_text
+    if not enhanced_script:
+        for step in steps:
+            step_output = step.get('output', '')
+            if step_output and len(step_output) > len(script):
+                enhanced_script = step_output
+                break
+    if not enhanced_script:
+        for step in steps:
+            step_output = step.get('output', '')
+            if step_output and len(step_output) > 50 and any(word in step_output.lower() for word in ['enhanced', 'script', 'text']):
+                enhanced_script = step_output
+                break
+    if not enhanced_script:
+        enhanced_script = output_text
+
+    audio_id: Optional[str] = None
+    for step in steps:
+        step_output = step.get('output', '')
+        match = re.search(r'<button[^>]*data-type=["\ ](list-item-trigger-overlay)["\ ][^>]*id=["\ ]([\w-]+)["\ ]', step_output)
+        if match:
+            audio_id = match.group(2)
+            break
+
+    media_url = None
+    for file_info in details.get('output_files', []):
+        url = file_info.get('url', '') if isinstance(file_info, dict) else file_info
+        if isinstance(url, str) and (url.endswith('.mp3') or url.endswith('.wav')):
+            media_url = url
+            break
+    if media_url is None:
+        url_pattern = r'https?://[\w./\-_%]+\.(mp3|wav)(\?[^\s"]*)?'
+        match = re.search(url_pattern, output_text)
+        if not match:
+            for step in steps:
+                match = re.search(url_pattern, step.get('output', ''))
+                if match:
+                    break
+        if match:
+            media_url = match.group(0)
+    return enhanced_script, audio_id, media_url
+
+
+def new_extract(details: dict, script: str):
+    output = extract_task_output(details, script)
+    return output.enhanced_script, output.audio_id, output.first_media_url()
+
+
+def synthetic_details(steps: int, script: str) -> dict:
+    """A long task log where the interesting bits are near the end, as in real generation runs."""
+    filler = ('<div class="sidebar"><button data-type="menu" id="nav-%d">Menu</button>'
+              '<span>Voice settings, stability 0.5, similarity 0.75</span></div>')
+    step_list = [{'output': f'Clicked element {i}. ' + filler % i * 8} for i in range(steps)]
+    step_list[-3]['output'] += ('<button class="row" data-type="list-item-trigger-overlay" '
+                                'id="a1b2c3d4-generated">Play</button>')
+    step_list[-2]['output'] = 'Enhanced script: ' + script * 3
+    step_list[-1]['output'] = 'Audio ready at https://storage.example.com/out/generated-audio.mp3?sig=abc'
+    return {'output': 'done', 'output_files': [], 'steps': step_list}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('details', nargs='*', help='Recorded task details JSON files')
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    script = 'Welcome to the show. Today we talk about speech synthesis and why pacing matters.'
+    if args.details:
+        cases = []
+        for path in args.details:
+            with open(path) as f:
+                cases.append((os.path.basename(path), json.load(f)))
+    else:
+        cases = [(f'synthetic-{n}-steps', synthetic_details(n, script)) for n in (50, 500, 2000)]
+
+    print(f"{'case':<24}{'steps':>7}{'legacy ms':>11}{'new ms':>9}{'speedup':>9}  same")
+    for name, details in cases:
+        legacy = min(timeit.repeat(lambda: legacy_extract(details, script), number=args.number, repeat=3)) / args.number
+        new = min(timeit.repeat(lambda: new_extract(details, script), number=args.number, repeat=3)) / args.number
+        same = legacy_extract(details, script) == new_extract(details, script)
+        print(f"{name:<24}{len(details.get('steps', [])):>7}{legacy * 1000:>11.3f}{new * 1000:>9.3f}"
+              f"{legacy / new:>8.1f}x  {same}")
+
+
+if __name__ == '__main__':
+    main()
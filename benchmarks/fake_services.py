@@ -0,0 +1,345 @@
+"""
+Local stand-ins for browser-use and ElevenLabs, for load tests that must not spend real quota.
+
+browser-use:  POST /api/v1/run-task, GET /api/v1/task/{id}
+ElevenLabs:   GET /v1/history, GET /v1/history/{id}/audio, POST /v1/history/download,
+              POST /v1/text-to-speech/{voice_id}/stream
+Other:        GET /__stats (request counts per endpoint), POST /__reset
+
+A task reports "created" for FAKE_QUEUE_SECONDS, then "running" for FAKE_TASK_SECONDS (each +/-
+FAKE_TASK_JITTER as a fraction), then "finished". When it finishes, a history item with the task's
+script appears, and its audio is one of the MP3s in FAKE_AUDIO_DIR (default uploads/), round robin.
+
+Tasks whose instructions include a login take FAKE_LOGIN_SECONDS longer. With a browser_profile_id,
+a login task leaves the profile logged in for FAKE_SESSION_TTL seconds (0: forever). A pooled task on
+a logged-out profile finishes quickly with LOGIN_REQUIRED and no audio, like the real agent would.
+
+FAKE_RUN_TASK_RATE (tasks per second, 0: unlimited) makes run-task answer 429 with Retry-After when
+tasks are created faster than that, like browser-use does under load.
+
+Streaming TTS sends the first chunk of an MP3 from FAKE_AUDIO_DIR after FAKE_TTS_FIRST_BYTE_SECONDS and
+the rest with FAKE_TTS_CHUNK_SECONDS between chunks, like audio being generated.
+
+If FAKE_WEBHOOK_URL is set, every status change is also pushed there as a signed browser-use
+webhook event (secret FAKE_WEBHOOK_SECRET). FAKE_WEBHOOK_DROP is the fraction of events silently
+dropped, to exercise the polling safety net.
+
+FAKE_HISTORY_ITEMS pre-fills the history with that many items, for export runs. The multi-item
+download streams a deflated zip built on the fly, with entries named "<history_item_id>.mp3".
+
+Run with:  uvicorn --app-dir benchmarks fake_services:app --port 8765
+"""
+import asyncio
+import glob
+import json
+import sys
+import os
+import random
+import re
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+QUEUE_SECONDS = float(os.getenv('FAKE_QUEUE_SECONDS', '1'))
+TASK_SECONDS = float(os.getenv('FAKE_TASK_SECONDS', '5'))
+TASK_JITTER = float(os.getenv('FAKE_TASK_JITTER', '0.2'))
+AUDIO_DIR = os.getenv('FAKE_AUDIO_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads'))
+CHUNK_SIZE = 64 * 1024
+TTS_FIRST_BYTE_SECONDS = float(os.getenv('FAKE_TTS_FIRST_BYTE_SECONDS', '0.3'))
+TTS_CHUNK_SECONDS = float(os.getenv('FAKE_TTS_CHUNK_SECONDS', '0.02'))
+WEBHOOK_URL = os.getenv('FAKE_WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('FAKE_WEBHOOK_SECRET', '')
+WEBHOOK_DROP = float(os.getenv('FAKE_WEBHOOK_DROP', '0'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_webhooks import SIGNATURE_HEADER, STATUS_EVENT, TIMESTAMP_HEADER, sign_body  # noqa: E402
+from session_pool import LOGIN_REQUIRED, SESSION_READY  # noqa: E402
+
+RUN_TASK_RATE = float(os.getenv('FAKE_RUN_TASK_RATE', '0'))
+LOGIN_SECONDS = float(os.getenv('FAKE_LOGIN_SECONDS', '3'))
+SESSION_TTL = float(os.getenv('FAKE_SESSION_TTL', '0'))
+HISTORY_ITEMS = int(os.getenv('FAKE_HISTORY_ITEMS', '0'))
+
+_SCRIPT = re.compile(r'in any way\): "(.*)", click the', re.DOTALL)
+_VOICE = re.compile(r"voice with ID '([^']*)'")
+
+app = FastAPI(title='Fake browser-use and ElevenLabs')
+tasks: Dict[str, dict] = {}
+# Newest first, like the real history endpoint
+history: List[dict] = []
+stats: Dict[str, int] = {}
+# Tasks that have no history item yet
+pending: List[str] = []
+# browser_profile_id -> time its login expires
+profiles: Dict[str, float] = {}
+# browser_profile_id -> voice last selected in it (ElevenLabs keeps the selection)
+profile_voices: Dict[str, str] = {}
+audio_files = sorted(glob.glob(os.path.join(AUDIO_DIR, '*.mp3')))
+_webhook_client: Optional[httpx.AsyncClient] = None
+_last_run_task = 0.0
+
+
+def _jittered(seconds: float) -> float:
+    return max(0.0, seconds * random.uniform(1 - TASK_JITTER, 1 + TASK_JITTER))
+
+
+def _materialize():
+    """Give every task whose run has ended its history item, in the order the runs ended."""
+    now = time.time()
+    finished = sorted((task_id for task_id in pending if now >= tasks[task_id]['finishes_at']),
+                      key=lambda task_id: tasks[task_id]['finishes_at'])
+    for task_id in finished:
+        pending.remove(task_id)
+        task = tasks[task_id]
+        task['history_item_id'] = uuid.uuid4().hex[:20]
+        history.insert(0, {
+            'history_item_id': task['history_item_id'],
+            'voice_id': task['voice_id'],
+            'text': f"[calm] {task['script']}",
+            'date_unix': int(task['finishes_at']),
+            'character_count_change_from': 0,
+            'character_count_change_to': len(task['script']),
+            'state': 'created',
+            '_audio': audio_files[len(history) % len(audio_files)] if audio_files else None,
+        })
+
+
+for _i in range(HISTORY_ITEMS):
+    history.insert(0, {
+        'history_item_id': uuid.uuid4().hex[:20],
+        'voice_id': 'fake-voice',
+        'text': f'Prefilled history item {_i}',
+        'date_unix': int(time.time()) - HISTORY_ITEMS + _i,
+        'character_count_change_from': 0,
+        'character_count_change_to': 26,
+        'state': 'created',
+        '_audio': audio_files[_i % len(audio_files)] if audio_files else None,
+    })
+
+
+@app.middleware('http')
+async def count_requests(request: Request, call_next):
+    route = request.scope.get('path', '')
+    if route.startswith('/api/v1/task/'):
+        key = 'browser_use.task'
+    elif route.startswith('/api/v1/run-task'):
+        key = 'browser_use.run_task'
+    elif route.startswith('/v1/text-to-speech/'):
+        key = 'elevenlabs.tts'
+    elif route.endswith('/audio') or route == '/v1/history/download':
+        key = 'elevenlabs.audio'
+    elif route.startswith('/v1/history'):
+        key = 'elevenlabs.history'
+    else:
+        key = route
+    stats[key] = stats.get(key, 0) + 1
+    return await call_next(request)
+
+
+@app.post('/api/v1/run-task')
+async def run_task(request: Request):
+    global _last_run_task
+    if RUN_TASK_RATE > 0:
+        wait = _last_run_task + 1 / RUN_TASK_RATE - time.time()
+        if wait > 0:
+            stats['browser_use.429'] = stats.get('browser_use.429', 0) + 1
+            raise HTTPException(status_code=429, detail='Too many requests',
+                                headers={'Retry-After': f'{max(1, round(wait))}'})
+        _last_run_task = time.time()
+    body = await request.json()
+    instructions = body.get('task', '')
+    script_match = _SCRIPT.search(instructions)
+    voice_match = _VOICE.search(instructions)
+    profile_id = body.get('browser_profile_id')
+    task_id = uuid.uuid4().hex
+    created_at = time.time()
+    starts_at = created_at + _jittered(QUEUE_SECONDS)
+    logs_in = 'log in using email' in instructions
+    logged_in = profile_id is not None and profiles.get(profile_id, 0) > created_at
+    output = None
+    run_seconds = _jittered(TASK_SECONDS) + (_jittered(LOGIN_SECONDS) if logs_in else 0)
+    if LOGIN_REQUIRED in instructions and not logs_in and not logged_in:
+        output, run_seconds = LOGIN_REQUIRED, _jittered(1)
+    elif SESSION_READY in instructions:
+        output = SESSION_READY
+        if not script_match:
+            run_seconds = _jittered(1) + (_jittered(LOGIN_SECONDS) if logs_in else 0)
+    if logs_in and profile_id is not None:
+        profiles[profile_id] = starts_at + run_seconds + (SESSION_TTL or float('inf'))
+    creates_audio = bool(script_match) and output is None
+    voice_id = voice_match.group(1) if voice_match else profile_voices.get(profile_id, 'fake-voice')
+    if voice_match and profile_id is not None:
+        profile_voices[profile_id] = voice_id
+    tasks[task_id] = {
+        'script': script_match.group(1) if script_match else instructions,
+        'voice_id': voice_id,
+        'created_at': created_at,
+        'starts_at': starts_at,
+        'finishes_at': starts_at + run_seconds,
+        'history_item_id': None,
+        'creates_audio': creates_audio,
+        'output': output,
+    }
+    if creates_audio:
+        pending.append(task_id)
+    if WEBHOOK_URL:
+        asyncio.create_task(_push_events(task_id))
+    return {'id': task_id}
+
+
+async def _send_event(task_id: str, status: str):
+    global _webhook_client
+    if random.random() < WEBHOOK_DROP:
+        stats['webhook.dropped'] = stats.get('webhook.dropped', 0) + 1
+        return
+    if _webhook_client is None:
+        _webhook_client = httpx.AsyncClient(timeout=10)
+    timestamp = datetime.now(timezone.utc).isoformat()
+    payload = {'task_id': task_id, 'session_id': task_id, 'status': status, 'metadata': {}}
+    event = {'type': STATUS_EVENT, 'timestamp': timestamp, 'payload': payload}
+    body = json.dumps(event).encode('utf-8')
+    headers = {SIGNATURE_HEADER: sign_body(WEBHOOK_SECRET, timestamp, body), TIMESTAMP_HEADER: timestamp,
+               'Content-Type': 'application/json'}
+    stats['webhook.sent'] = stats.get('webhook.sent', 0) + 1
+    try:
+        await _webhook_client.post(WEBHOOK_URL, content=body, headers=headers)
+    except httpx.HTTPError as e:
+        print(f'Webhook delivery for {task_id} failed: {e}')
+
+
+async def _push_events(task_id: str):
+    task = tasks[task_id]
+    await asyncio.sleep(max(0.0, task['starts_at'] - time.time()))
+    await _send_event(task_id, 'running')
+    await asyncio.sleep(max(0.0, task['finishes_at'] - time.time()))
+    _materialize()
+    await _send_event(task_id, 'finished')
+
+
+@app.get('/api/v1/task/{task_id}')
+async def get_task(task_id: str):
+    task = tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail='Task not found')
+    _materialize()
+    now = time.time()
+    if now < task['starts_at']:
+        return {'id': task_id, 'status': 'created', 'steps': []}
+    running = task['history_item_id'] is None if task['creates_audio'] else now < task['finishes_at']
+    if running:
+        return {'id': task_id, 'status': 'running', 'steps': [{'output': 'Clicked Generate speech'}]}
+    if task['output']:
+        return {'id': task_id, 'status': 'finished', 'output': task['output'],
+                'steps': [{'output': task['output']}], 'output_files': []}
+    return {
+        'id': task_id,
+        'status': 'finished',
+        'output': f"Enhanced script: [calm] {task['script']}",
+        'steps': [{'output': 'Pasted script'}, {'output': 'Clicked Enhance'}, {'output': 'Audio generated'}],
+        'output_files': [],
+    }
+
+
+@app.get('/v1/history')
+async def get_history(page_size: int = 100, start_after_history_item_id: Optional[str] = None):
+    _materialize()
+    start = 0
+    if start_after_history_item_id:
+        ids = [item['history_item_id'] for item in history]
+        start = ids.index(start_after_history_item_id) + 1 if start_after_history_item_id in ids else len(history)
+    page = history[start:start + page_size]
+    return {
+        'history': [{k: v for k, v in item.items() if not k.startswith('_')} for item in page],
+        'has_more': start + page_size < len(history),
+        'last_history_item_id': page[-1]['history_item_id'] if page else None,
+    }
+
+
+def _iter_file(path: str):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+@app.get('/v1/history/{history_item_id}/audio')
+async def get_history_audio(history_item_id: str):
+    for item in history:
+        if item['history_item_id'] == history_item_id and item['_audio']:
+            return StreamingResponse(_iter_file(item['_audio']), media_type='audio/mpeg',
+                                     headers={'Content-Length': str(os.path.getsize(item['_audio']))})
+    raise HTTPException(status_code=404, detail='History item not found')
+
+
+class _ChunkSink:
+    """Write-only, unseekable file: makes zipfile use data descriptors, like a streamed archive."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _iter_zip(items: List[dict]):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for item in items:
+            with archive.open(f"{item['history_item_id']}.mp3", 'w') as entry:
+                for chunk in _iter_file(item['_audio']):
+                    entry.write(chunk)
+                    yield from sink.chunks
+                    sink.chunks.clear()
+    yield from sink.chunks
+
+
+@app.post('/v1/history/download')
+async def download_history(request: Request):
+    ids = (await request.json()).get('history_item_ids') or []
+    by_id = {item['history_item_id']: item for item in history}
+    items = [by_id[i] for i in ids if i in by_id and by_id[i]['_audio']]
+    if not items:
+        raise HTTPException(status_code=404, detail='History items not found')
+    return StreamingResponse(_iter_zip(items), media_type='application/zip')
+
+
+async def _iter_generated(path: str):
+    await asyncio.sleep(TTS_FIRST_BYTE_SECONDS)
+    for chunk in _iter_file(path):
+        yield chunk
+        await asyncio.sleep(TTS_CHUNK_SECONDS)
+
+
+@app.post('/v1/text-to-speech/{voice_id}/stream')
+async def text_to_speech_stream(voice_id: str, request: Request):
+    body = await request.json()
+    if not body.get('text'):
+        raise HTTPException(status_code=422, detail='text is required')
+    if not audio_files:
+        raise HTTPException(status_code=500, detail=f'No MP3s in {AUDIO_DIR}')
+    path = audio_files[stats.get('elevenlabs.tts', 0) % len(audio_files)]
+    return StreamingResponse(_iter_generated(path), media_type='audio/mpeg',
+                             headers={'history-item-id': uuid.uuid4().hex[:20]})
+
+
+@app.get('/__stats')
+async def get_stats():
+    return stats
+
+
+@app.post('/__reset')
+async def reset_stats():
+    stats.clear()
+    return {'ok': True}
@@ -0,0 +1,321 @@
+"""
+End-to-end load test of api.app against local stand-ins, without spending browser-use or ElevenLabs quota.
+
+Starts the fake browser-use and ElevenLabs services (benchmarks/fake_services.py) on two ports, so
+outbound calls are labelled per service. If `moto_server` is installed it also starts a local S3
+stand-in. The API then runs in a scratch directory, and each concurrency level sends requests to
+POST /enhance-script/ (or --endpoint /tts/stream, or /enhance-script/batch to send each level as one
+batch and time every item as its result line arrives). For each level the test reports:
+- p50/p95/p99 latency, p50 time to first byte and requests per second;
+- peak RSS of the API process so far (it only grows across levels);
+- outbound calls per request, from the API's /metrics and from the fakes' own counters;
+- history items handed to more than one request (must be 0).
+With --workers, /metrics only covers the worker that answered the scrape; the fakes' counters cover all.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 64 --task-seconds 5
+    python benchmarks/load_test.py --json results.json     # also write machine-readable results
+    python benchmarks/load_test.py --endpoint /tts/stream    # streaming TTS fast path
+    python benchmarks/load_test.py --endpoint /enhance-script/batch --run-task-rate 2
+    python benchmarks/load_test.py --sessions 8             # pooled logged-in browser profiles
+    python benchmarks/load_test.py --webhooks               # completion pushed by webhooks, polling as safety net
+    python benchmarks/load_test.py --workers 4              # several API processes sharing state (coordination.py)
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CLIENT_CALLS = re.compile(r'^tts_http_client_requests_total\{service="([^"]*)",[^}]*\} (\S+)$', re.MULTILINE)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_process(args: List[str], env: Dict[str, str], cwd: str, log_path: str) -> subprocess.Popen:
+    log = open(log_path, 'w')
+    return subprocess.Popen(args, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+
+
+def start_uvicorn(app: str, port: int, env: Dict[str, str], cwd: str, log_path: str,
+                  app_dir: Optional[str] = None, workers: int = 1) -> subprocess.Popen:
+    args = [sys.executable, '-m', 'uvicorn', app, '--host', '127.0.0.1', '--port', str(port),
+            '--log-level', 'warning']
+    if app_dir:
+        args += ['--app-dir', app_dir]
+    if workers > 1:
+        args += ['--workers', str(workers)]
+    return start_process(args, env, cwd, log_path)
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{url} exited with code {process.returncode}')
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout:g}s')
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of `pid` (VmHWM on Linux, psutil elsewhere)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process(pid).memory_info()
+    return getattr(info, 'peak_wset', info.rss) / 2 ** 20
+
+
+def outbound_calls(metrics_text: str) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for service, value in _CLIENT_CALLS.findall(metrics_text):
+        totals[service] = totals.get(service, 0) + float(value)
+    return totals
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def run_level(api_url: str, concurrency: int, requests: int, timeout: float,
+                    endpoint: str = '/enhance-script/') -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    history_items: List[str] = []
+    errors = 0
+    run_id = uuid.uuid4().hex[:8]
+
+    async with httpx.AsyncClient(base_url=api_url, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=concurrency + 4)) as client:
+        async def one(index: int):
+            nonlocal errors
+            # Unique scripts: every request does the full pipeline instead of hitting the cache
+            script = f'Load test {run_id} request {index}. The quick brown fox jumps over the lazy dog.'
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with client.stream('POST', endpoint, json={'script': script, 'use_cache': False}) as response:
+                        response.raise_for_status()
+                        first = None
+                        body = bytearray()
+                        async for chunk in response.aiter_raw():
+                            if first is None:
+                                first = time.perf_counter() - started
+                            if response.headers.get('content-type', '').startswith('application/json'):
+                                body += chunk
+                    latencies.append(time.perf_counter() - started)
+                    if body:
+                        history_item_id = json.loads(body).get('latest_history_item_id')
+                        if history_item_id:
+                            history_items.append(history_item_id)
+                    first_bytes.append(first if first is not None else latencies[-1])
+                except httpx.HTTPError as e:
+                    errors += 1
+                    print(f'  request {index} failed: {e}', file=sys.stderr)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    result = _summary(concurrency, requests, errors, elapsed, latencies, first_bytes)
+    result['duplicate_history_items'] = len(history_items) - len(set(history_items))
+    return result
+
+
+async def run_batch(api_url: str, concurrency: int, requests: int, timeout: float, endpoint: str) -> dict:
+    """Send all requests as one batch; each item's latency is the arrival time of its result line."""
+    run_id = uuid.uuid4().hex[:8]
+    items = [{'script': f'Load test {run_id} batch item {index}. The quick brown fox jumps over the lazy dog.',
+              'use_cache': False} for index in range(requests)]
+    latencies: List[float] = []
+    errors = 0
+    async with httpx.AsyncClient(base_url=api_url, timeout=timeout) as client:
+        started = time.perf_counter()
+        async with client.stream('POST', endpoint, json={'items': items}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                event = json.loads(line) if line else {}
+                if event.get('event') != 'result':
+                    continue
+                if event['error'] is not None:
+                    errors += 1
+                    print(f"  item {event['index']} failed: {event['error']}", file=sys.stderr)
+                else:
+                    latencies.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+    return _summary(concurrency, requests, errors, elapsed, latencies, latencies)
+
+
+def _summary(concurrency: int, requests: int, errors: int, elapsed: float, latencies: List[float],
+             first_bytes: List[float]) -> dict:
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'ttfb_p50': percentile(first_bytes, 50),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+    parser.add_argument('--endpoint', default='/enhance-script/', help='API endpoint to load')
+    parser.add_argument('--requests', type=int, default=32, help='Requests per concurrency level')
+    parser.add_argument('--task-seconds', type=float, default=5, help='Fake browser-use run time')
+    parser.add_argument('--queue-seconds', type=float, default=1, help='Fake browser-use queue time')
+    parser.add_argument('--timeout', type=float, default=600, help='Per-request timeout')
+    parser.add_argument('--sessions', type=int, default=0, help='Pooled browser profiles (0: log in on every task)')
+    parser.add_argument('--run-task-rate', type=float, default=0,
+                        help='Fake run-task answers 429 above this many tasks per second (0: never)')
+    parser.add_argument('--login-seconds', type=float, default=3, help='Fake extra time of a task that logs in')
+    parser.add_argument('--webhooks', action='store_true', help='Push task status to the API as signed webhooks')
+    parser.add_argument('--webhook-drop', type=float, default=0, help='Fraction of webhook events the fake drops')
+    parser.add_argument('--workers', type=int, default=1, help='API worker processes (uvicorn --workers)')
+    parser.add_argument('--no-s3', action='store_true', help='Do not start a local S3 stand-in')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory and logs')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the API process (repeatable), e.g. JOB_WORKERS=16')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='tts-load-')
+    browser_use_port, api_port = free_port(), free_port()
+    base_env = {**os.environ, 'PYTHONPATH': REPO_DIR}
+    fake_env = {**base_env, 'FAKE_TASK_SECONDS': str(args.task_seconds),
+                'FAKE_QUEUE_SECONDS': str(args.queue_seconds), 'FAKE_LOGIN_SECONDS': str(args.login_seconds),
+                'FAKE_RUN_TASK_RATE': str(args.run_task_rate)}
+    api_env = {
+        **base_env,
+        'BROWSER_USE_API_KEY': 'load-test', 'ELEVENLABS_API_KEY': 'load-test',
+        'ELEVENLABS_EMAIL': 'load@test', 'ELEVENLABS_PASSWORD': 'load-test', 'VOICE_ID': 'load-voice',
+        'BROWSER_USE_BASE_URL': f'http://127.0.0.1:{browser_use_port}',
+        # Same fake app, different origin, so the API labels the calls per service
+        'ELEVENLABS_BASE_URL': f'http://localhost:{browser_use_port}',
+        'HISTORY_SYNC_INTERVAL': '0',
+        'S3_BUCKET_NAME': '',
+    }
+    if args.sessions:
+        api_env['BROWSER_USE_PROFILE_IDS'] = ','.join(f'load-profile-{i}' for i in range(args.sessions))
+    if args.webhooks:
+        secret = uuid.uuid4().hex
+        fake_env.update({'FAKE_WEBHOOK_URL': f'http://127.0.0.1:{api_port}/webhooks/browser-use',
+                         'FAKE_WEBHOOK_SECRET': secret, 'FAKE_WEBHOOK_DROP': str(args.webhook_drop)})
+        api_env['BROWSER_USE_WEBHOOK_SECRET'] = secret
+    processes: List[subprocess.Popen] = []
+    try:
+        fake = start_uvicorn('fake_services:app', browser_use_port, fake_env, REPO_DIR,
+                             os.path.join(workdir, 'fake.log'), app_dir=os.path.join(REPO_DIR, 'benchmarks'))
+        processes.append(fake)
+        wait_until_up(f'http://127.0.0.1:{browser_use_port}/__stats', fake)
+
+        if not args.no_s3 and shutil.which('moto_server'):
+            s3_port = free_port()
+            moto = start_process(['moto_server', '-p', str(s3_port)], base_env, workdir,
+                                 os.path.join(workdir, 'moto.log'))
+            processes.append(moto)
+            wait_until_up(f'http://127.0.0.1:{s3_port}/', moto)
+            api_env.update({
+                'S3_ENDPOINT_URL': f'http://127.0.0.1:{s3_port}', 'S3_BUCKET_NAME': 'load-test',
+                'AWS_ACCESS_KEY_ID': 'load-test', 'AWS_SECRET_ACCESS_KEY': 'load-test',
+                'AWS_DEFAULT_REGION': 'us-east-1',
+            })
+            httpx.put(f'http://127.0.0.1:{s3_port}/load-test')
+            print(f'S3 stand-in: moto_server on port {s3_port}')
+        else:
+            print('S3 stand-in: none (audio kept on local disk)')
+
+        for item in args.env:
+            key, _, value = item.partition('=')
+            api_env[key] = value
+        if args.workers > 1:
+            api_env['WEB_CONCURRENCY'] = str(args.workers)
+        api = start_uvicorn('api:app', api_port, api_env, workdir, os.path.join(workdir, 'api.log'),
+                            app_dir=REPO_DIR, workers=args.workers)
+        processes.append(api)
+        api_url = f'http://127.0.0.1:{api_port}'
+        wait_until_up(f'{api_url}/health', api)
+
+        results = []
+        header = (f"{'conc':>5}{'reqs':>6}{'err':>5}{'rps':>8}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'ttfb s':>8}"
+                  f"{'rss MB':>8}  outbound calls per request")
+        print(header)
+        for concurrency in [int(level) for level in args.concurrency.split(',') if level]:
+            before = outbound_calls(httpx.get(f'{api_url}/metrics').text)
+            httpx.post(f'http://127.0.0.1:{browser_use_port}/__reset')
+            if args.endpoint.rstrip('/').endswith('/batch'):
+                # The batch is admitted by the API's own limits; --concurrency only labels the run
+                result = asyncio.run(run_batch(api_url, concurrency, args.requests, args.timeout, args.endpoint))
+            else:
+                result = asyncio.run(run_level(api_url, concurrency, args.requests, args.timeout, args.endpoint))
+            after = outbound_calls(httpx.get(f'{api_url}/metrics').text)
+            done = max(1, result['requests'] - result['errors'])
+            result['outbound_per_request'] = {
+                service: round((after.get(service, 0) - before.get(service, 0)) / done, 2) for service in after
+            }
+            result['fake_requests'] = httpx.get(f'http://127.0.0.1:{browser_use_port}/__stats').json()
+            result['peak_rss_mb'] = peak_rss_mb(api.pid)
+            results.append(result)
+            calls = ', '.join(f'{service}={count}' for service, count in sorted(result['outbound_per_request'].items()))
+            rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else '?'
+            print(f"{concurrency:>5}{result['requests']:>6}{result['errors']:>5}{result['rps']:>8.2f}"
+                  f"{result['p50']:>8.2f}{result['p95']:>8.2f}{result['p99']:>8.2f}{result['ttfb_p50']:>8.2f}{rss:>8}  {calls}")
+            if result.get('duplicate_history_items'):
+                print(f"  WARNING: {result['duplicate_history_items']} history items were handed to more than one request")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'task_seconds': args.task_seconds, 'queue_seconds': args.queue_seconds,
+                           'results': results}, f, indent=2)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if args.keep:
+            print(f'Logs and data kept in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
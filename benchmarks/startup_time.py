@@ -0,0 +1,143 @@
+"""
+Cold start benchmark for the API: how long `import api` takes and how long a fresh uvicorn process
+needs before `/health` first answers 200.
+
+Each run starts a new interpreter in a scratch directory (empty data/ and uploads/), so nothing is
+warm except the OS file cache. After the first healthy response the script also reads the API's own
+`startup` timings from /stats, including the background warm-up that runs after the server is ready.
+
+Usage:
+    python benchmarks/startup_time.py --runs 5
+    python benchmarks/startup_time.py --env S3_BUCKET_NAME=my-bucket    # include the boto3 warm-up
+    python benchmarks/startup_time.py --importtime 15                     # slowest modules of one import
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from load_test import REPO_DIR, free_port, start_uvicorn
+
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def import_seconds(env: Dict[str, str], cwd: str) -> float:
+    code = 'import time; t = time.perf_counter(); import api; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=cwd, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: Dict[str, str], cwd: str, top: int) -> List[tuple]:
+    """(cumulative ms, module) for the `top` slowest direct imports of the api module."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import api'], env=env, cwd=cwd,
+                            check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        # Depth 1 (two spaces): modules api imports itself, with everything they pull in
+        if match and len(match.group(3)) == 2:
+            rows.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def time_to_healthy(env: Dict[str, str], cwd: str, timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    process = start_uvicorn('api:app', port, env, cwd, os.path.join(cwd, 'api.log'), app_dir=REPO_DIR)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        healthy = None
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'api exited with code {process.returncode}, see {cwd}/api.log')
+            try:
+                if httpx.get(f'{url}/health', timeout=1).status_code == 200:
+                    healthy = time.perf_counter() - started
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.005)
+        if healthy is None:
+            raise RuntimeError(f'/health did not answer within {timeout:g}s')
+        # Give the background warm-up a moment to report its duration
+        startup = {}
+        for _ in range(100):
+            startup = httpx.get(f'{url}/stats', timeout=5).json().get('startup', {})
+            if startup.get('warm_up_seconds') is not None:
+                break
+            time.sleep(0.05)
+        return {'healthy_seconds': healthy, **startup}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='also list the N slowest modules imported by api')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the API process (repeatable)')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    env = {
+        **os.environ, 'PYTHONPATH': REPO_DIR,
+        # No outbound traffic: only startup is measured
+        'HISTORY_SYNC_INTERVAL': '0', 'S3_BUCKET_NAME': '',
+    }
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+
+    imports: List[float] = []
+    runs: List[dict] = []
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix='tts-startup-')
+        try:
+            imports.append(import_seconds(env, workdir))
+            runs.append(time_to_healthy(env, workdir, args.timeout))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def row(label: str, values: List[float]):
+        values = [v for v in values if v is not None]
+        if values:
+            print(f"{label:<28}{statistics.median(values):>9.3f}{min(values):>9.3f}{max(values):>9.3f}")
+
+    print(f"{'seconds':<28}{'median':>9}{'min':>9}{'max':>9}")
+    row('import api', imports)
+    row('spawn to first /health 200', [r['healthy_seconds'] for r in runs])
+    row('import to lifespan ready', [r.get('ready_seconds') for r in runs])
+    row('background warm-up', [r.get('warm_up_seconds') for r in runs])
+
+    slowest = []
+    if args.importtime:
+        workdir = tempfile.mkdtemp(prefix='tts-startup-')
+        try:
+            slowest = slowest_imports(env, workdir, args.importtime)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print('\nslowest imports of api (cumulative ms):')
+        for ms, module in slowest:
+            print(f"  {ms:>8.1f}  {module}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'import_seconds': imports, 'runs': runs, 'slowest_imports': slowest}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,71 +1,219 @@
-import requests
-from bs4 import BeautifulSoup, Tag
-from typing import Optional, Dict, List
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Optional, Dict, List, Tuple
+from http_client import client_for
+from metrics import log_message
 
-def extract_download_url_from_agent(agent_url: str) -> Optional[str]:
+AGENT_PAGE_CACHE_TTL = float(os.getenv('AGENT_PAGE_CACHE_TTL', '60'))
+AGENT_PAGE_CACHE_SIZE = 128
+
+
+@dataclass
+class AgentPageInfo:
+    download_url: Optional[str] = None
+    buttons: List[Dict[str, str]] = field(default_factory=list)
+
+
+def _http_url(value: Optional[str]) -> Optional[str]:
+    return value if isinstance(value, str) and value.startswith('http') else None
+
+
+class _OpenElement:
+    __slots__ = ('index', 'href', 'resolved', 'mentions_download', '_tail', 'inner_href')
+
+    def __init__(self, index: int = 0, href: Optional[str] = None, resolved: bool = False):
+        self.index = index
+        self.href = href
+        # A button already resolved from its attributes needs no text
+        self.resolved = resolved
+        self.mentions_download = False
+        self._tail = ''
+        # First <a href> inside a button, as found by a tree search
+        self.inner_href: Optional[str] = None
+
+    def add_text(self, data: str):
+        if self.resolved or self.mentions_download:
+            return
+        # Text arrives in pieces; keep enough of the previous one to match across the boundary
+        text = self._tail + data.lower()
+        self.mentions_download = 'download' in text
+        self._tail = text[-7:]
+
+
+class AgentPageParser(HTMLParser):
+    """
+    Event-based, single-pass extractor for Browser Use agent pages.
+    Collects the attributes of every <button> and the download URL with the same precedence as
+    a tree walk: buttons first (data-download-url, any http-valued *download* attribute, then
+    the first link inside a button whose text mentions "download"), then the first link whose
+    text mentions "download". Memory stays constant per open element, whatever the page size.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.buttons: List[Dict[str, str]] = []
+        # (button index, url) for every button that yielded a URL; the lowest index wins
+        self._button_urls: List[Tuple[int, str]] = []
+        self._link_url: Optional[str] = None
+        self._open_buttons: List[_OpenElement] = []
+        self._open_links: List[_OpenElement] = []
+        self._skip_text = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'button':
+            attrs_dict = {name: value if value is not None else '' for name, value in attrs}
+            index = len(self.buttons)
+            self.buttons.append(attrs_dict)
+            url = _http_url(attrs_dict.get('data-download-url'))
+            if url is None:
+                for name, value in attrs_dict.items():
+                    if 'download' in name and _http_url(value):
+                        url = value
+                        break
+            if url is not None:
+                self._button_urls.append((index, url))
+            self._open_buttons.append(_OpenElement(index, resolved=url is not None))
+        elif tag == 'a':
+            href = None
+            for name, value in attrs:
+                if name == 'href':
+                    href = value if value is not None else ''
+            if href is None:
+                return
+            for button in self._open_buttons:
+                if not button.resolved and button.inner_href is None:
+                    button.inner_href = href
+            if self._link_url is None:
+                self._open_links.append(_OpenElement(href=href))
+        elif tag in ('script', 'style'):
+            self._skip_text += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        if self._skip_text:
+            return
+        for button in self._open_buttons:
+            button.add_text(data)
+        for link in self._open_links:
+            link.add_text(data)
+
+    def _close_button(self, button: _OpenElement):
+        if not button.resolved and button.mentions_download:
+            url = _http_url(button.inner_href)
+            if url is not None:
+                self._button_urls.append((button.index, url))
+
+    def _close_link(self, link: _OpenElement):
+        if self._link_url is None and link.mentions_download and _http_url(link.href):
+            self._link_url = link.href
+
+    def handle_endtag(self, tag):
+        if tag == 'button' and self._open_buttons:
+            self._close_button(self._open_buttons.pop())
+        elif tag == 'a' and self._open_links:
+            self._close_link(self._open_links.pop())
+        elif tag in ('script', 'style') and self._skip_text:
+            self._skip_text -= 1
+
+    def close(self):
+        super().close()
+        # Unclosed elements extend to the end of the document
+        while self._open_buttons:
+            self._close_button(self._open_buttons.pop())
+        while self._open_links:
+            self._close_link(self._open_links.pop(0))
+
+    def result(self) -> AgentPageInfo:
+        download_url = min(self._button_urls)[1] if self._button_urls else self._link_url
+        return AgentPageInfo(download_url=download_url, buttons=self.buttons)
+
+
+def parse_agent_page(html: str) -> AgentPageInfo:
+    parser = AgentPageParser()
+    parser.feed(html)
+    parser.close()
+    return parser.result()
+
+
+_page_cache: Dict[str, Tuple[float, AgentPageInfo]] = {}
+_page_fetches: Dict[str, asyncio.Future] = {}
+
+
+async def _fetch_agent_page(agent_url: str) -> AgentPageInfo:
+    # The page is parsed while it streams in, so it is never held in memory whole
+    parser = AgentPageParser()
+    async with client_for(agent_url).stream('GET', agent_url) as response:
+        response.raise_for_status()
+        async for text in response.aiter_text():
+            parser.feed(text)
+    parser.close()
+    return parser.result()
+
+
+async def extract_agent_page(agent_url: str, use_cache: bool = True) -> AgentPageInfo:
+    """
+    Fetch a Browser Use agent page once and return its download URL and button attributes.
+    Results are cached for AGENT_PAGE_CACHE_TTL seconds, and concurrent calls for the same
+    URL share one request. Raises on HTTP errors.
+    """
+    now = time.monotonic()
+    if use_cache:
+        cached = _page_cache.get(agent_url)
+        if cached and cached[0] > now:
+            return cached[1]
+        pending = _page_fetches.get(agent_url)
+        if pending is not None:
+            return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    _page_fetches[agent_url] = future
+    try:
+        info = await _fetch_agent_page(agent_url)
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+        raise
+    else:
+        future.set_result(info)
+    finally:
+        if _page_fetches.get(agent_url) is future:
+            del _page_fetches[agent_url]
+    if AGENT_PAGE_CACHE_TTL > 0:
+        _page_cache[agent_url] = (time.monotonic() + AGENT_PAGE_CACHE_TTL, info)
+        while len(_page_cache) > AGENT_PAGE_CACHE_SIZE:
+            # Dicts keep insertion order: drop the oldest entry
+            del _page_cache[next(iter(_page_cache))]
+    return info
+
+
+async def extract_download_url_from_agent(agent_url: str) -> Optional[str]:
     """
     Given a Browser Use agent page URL, fetch the page, parse the HTML, and extract the download URL from the headers of the download button.
     Returns the download URL if found, else None.
     """
     try:
-        response = requests.get(agent_url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        # Find all buttons
-        buttons = soup.find_all('button')
-        for button in buttons:
-            if not isinstance(button, Tag):
-                continue
-            # Check if button has a data-download-url attribute
-            if button.has_attr('data-download-url'):
-                val = button.get('data-download-url')
-                if isinstance(val, str) and val.startswith('http'):
-                    return val
-            # Check for custom attributes or headers
-            for attr, attr_val in button.attrs.items():
-                if 'download' in attr and isinstance(attr_val, str) and attr_val.startswith('http'):
-                    return attr_val
-            # Sometimes the URL is in the button's text or a child element
-            if button.text and 'download' in button.text.lower():
-                # Try to find a link inside the button
-                link = button.find('a', href=True)
-                if link and isinstance(link, Tag):
-                    href = link.get('href')
-                    if isinstance(href, str) and href.startswith('http'):
-                        return href
-        # If not found, try to find any link with download in the text
-        links = soup.find_all('a', href=True)
-        for link in links:
-            if not isinstance(link, Tag):
-                continue
-            if 'download' in link.text.lower():
-                href = link.get('href')
-                if isinstance(href, str) and href.startswith('http'):
-                    return href
-        return None
+        return (await extract_agent_page(agent_url)).download_url
     except Exception as e:
-        print(f"Error extracting download URL: {e}")
+        log_message(f"Error extracting download URL: {e}", level='error')
         return None
 
-def extract_download_button_headers(agent_url: str) -> Optional[List[Dict[str, str]]]:
+async def extract_download_button_headers(agent_url: str) -> Optional[List[Dict[str, str]]]:
     """
     Given a Browser Use agent page URL, fetch the page, parse the HTML, and extract all attributes (headers) from every button.
     Returns a list of dictionaries of attributes for each button found.
     """
     try:
-        response = requests.get(agent_url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        # Find all buttons
-        buttons = soup.find_all('button')
-        all_button_headers = []
-        for button in buttons:
-            if not isinstance(button, Tag):
-                continue
-            # Collect all attributes for this button
-            attrs_dict = {str(attr): str(val) for attr, val in button.attrs.items()}
-            all_button_headers.append(attrs_dict)
-        return all_button_headers if all_button_headers else None
+        buttons = (await extract_agent_page(agent_url)).buttons
+        return buttons if buttons else None
     except Exception as e:
-        print(f"Error extracting download button headers: {e}")
-        return None 
\ No newline at end of file
+        log_message(f"Error extracting download button headers: {e}", level='error')
+        return None
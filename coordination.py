@@ -0,0 +1,422 @@
+"""
+Cross-process coordination for running several API workers on one host (uvicorn --workers, or
+WEB_CONCURRENCY > 1). The workers share one SQLite file in WAL mode and use it for:
+
+- leases: named, expiring ownership (jobs, browser profiles, singleton loops). A worker renews its
+  leases with every heartbeat. Those of a worker that died expire and can be taken over. A lease
+  taken with `lead` also publishes a value, e.g. the id of the job running for a request key;
+- claims: permanent first-come ownership of a history item, so no audio is handed to two jobs;
+- history waiters: every worker's open waiters, so an item is left to the worker whose job
+  matches it best;
+- task events: webhook events received by a worker that does not watch the task, picked up by the
+  worker that does;
+- rate buckets: one token bucket per outbound service for all workers together;
+- values: small shared state, e.g. the voice a browser profile has selected.
+
+With a single worker, coordination is disabled. Every lease and claim then succeeds at once and the
+database is never opened.
+
+The methods block on the shared database; async code calls them through `Coordinator.call`, which
+runs them in a worker thread.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Iterable, List, Optional, TypeVar
+from metrics import log_message
+
+
+T = TypeVar('T')
+
+
+def open_shared_db(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite file that every API worker process uses (coordination, job store, caches, history
+    index). WAL mode lets readers run alongside the single writer, and a writer that finds the
+    database locked waits up to 10 seconds (busy timeout) instead of failing at once. With WAL,
+    synchronous=NORMAL keeps the file consistent on a crash and only risks the last commits on power
+    loss. The connection is shared between threads; callers serialise access with their own lock.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def configured_workers() -> int:
+    return max(1, int(os.getenv('WEB_CONCURRENCY') or '1'))
+
+
+class Coordinator:
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None,
+                 lease_ttl: Optional[float] = None):
+        self.path = path or os.getenv('COORDINATION_DB_PATH', os.path.join('data', 'coordination.db'))
+        if enabled is None:
+            setting = os.getenv('COORDINATION', 'auto').lower()
+            enabled = configured_workers() > 1 if setting == 'auto' else setting in ('1', 'true', 'yes', 'on')
+        self.enabled = enabled
+        # A worker that misses heartbeats for this long is considered dead
+        self.lease_ttl = lease_ttl or float(os.getenv('COORDINATION_LEASE_TTL', '15'))
+        self.heartbeat_interval = self.lease_ttl / 3
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.claims_lost = 0
+        self.events_forwarded = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_shared_db(self.path)
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner);
+                CREATE TABLE IF NOT EXISTS claims (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    claimed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS history_waiters (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    voice_id TEXT,
+                    words TEXT NOT NULL,
+                    registered_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS task_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    status TEXT,
+                    details TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS task_events_task ON task_events (task_id);
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    paused_until REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    async def call(self, method: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a coordinator method (e.g. `coordinator.call(coordinator.try_lease, name)`) from async code
+        without blocking the event loop. Disabled, the methods return at once, so no thread is used.
+        """
+        if not self.enabled:
+            return method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    # Leases
+
+    def try_lease(self, name: str) -> bool:
+        """Take or renew the lease `name`; False while another live worker holds it."""
+        if not self.enabled:
+            return True
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('''
+                    INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                ''', (name, self.worker_id, now + self.lease_ttl, now))
+                row = db.execute('SELECT owner FROM leases WHERE name = ?', (name,)).fetchone()
+        return row is not None and row[0] == self.worker_id
+
+    def release(self, name: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, self.worker_id))
+
+    def lead(self, name: str, value: dict) -> Optional[dict]:
+        """
+        Take or renew the lease `name` and publish `value` with it, in one transaction. Returns None
+        when this worker holds the lease, otherwise the value published by the worker that does.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('''
+                    INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                ''', (name, self.worker_id, now + self.lease_ttl, now))
+                row = db.execute('SELECT owner FROM leases WHERE name = ?', (name,)).fetchone()
+                if row is not None and row[0] == self.worker_id:
+                    db.execute('INSERT OR REPLACE INTO state (name, value, updated_at) VALUES (?, ?, ?)',
+                               (name, json.dumps(value), now))
+                    return None
+                published = db.execute('SELECT value FROM state WHERE name = ?', (name,)).fetchone()
+        return json.loads(published[0]) if published else {}
+
+    def resign(self, name: str):
+        """Give up a lease taken with `lead` and drop its value."""
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                if db.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, self.worker_id)).rowcount:
+                    db.execute('DELETE FROM state WHERE name = ?', (name,))
+
+    def holders(self, prefix: str) -> List[str]:
+        """Names of live leases starting with `prefix`, held by any worker."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            rows = self._db().execute('SELECT name FROM leases WHERE name LIKE ? AND expires_at >= ?',
+                                      (f'{prefix}%', time.time())).fetchall()
+        return [row[0] for row in rows]
+
+    # Claims
+
+    def claim(self, name: str) -> bool:
+        """Permanently claim `name` for this worker; False if any worker claimed it first."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('INSERT OR IGNORE INTO claims (name, owner, claimed_at) VALUES (?, ?, ?)',
+                           (name, self.worker_id, time.time()))
+                row = db.execute('SELECT owner FROM claims WHERE name = ?', (name,)).fetchone()
+        won = row is not None and row[0] == self.worker_id
+        if not won:
+            self.claims_lost += 1
+        return won
+
+    # History waiters
+
+    def add_waiter(self, waiter_id: str, voice_id: Optional[str], words: Iterable[str], registered_at: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('INSERT OR REPLACE INTO history_waiters (id, owner, voice_id, words, registered_at) '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           (waiter_id, self.worker_id, voice_id, ' '.join(sorted(words)), registered_at))
+
+    def remove_waiter(self, waiter_id: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('DELETE FROM history_waiters WHERE id = ?', (waiter_id,))
+
+    def remote_waiters(self) -> List[dict]:
+        """Open waiters of the other live workers, with their script words as a set."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            rows = self._db().execute('''
+                SELECT w.id, w.voice_id, w.words, w.registered_at FROM history_waiters w
+                JOIN leases l ON l.name = 'worker:' || w.owner AND l.expires_at >= ?
+                WHERE w.owner != ?
+            ''', (time.time(), self.worker_id)).fetchall()
+        return [{'id': row[0], 'voice_id': row[1], 'words': set(row[2].split()), 'registered_at': row[3]}
+                for row in rows]
+
+    # Task events
+
+    def publish_event(self, task_id: str, status: Optional[str], details: Optional[dict]):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('INSERT INTO task_events (task_id, status, details, created_at) VALUES (?, ?, ?, ?)',
+                           (task_id, status, json.dumps(details) if details is not None else None, time.time()))
+
+    def take_events(self, task_ids: Iterable[str]) -> List[tuple]:
+        """Remove and return (task_id, status, details) events for the given tasks, oldest first."""
+        task_ids = list(task_ids)
+        if not self.enabled or not task_ids:
+            return []
+        placeholders = ','.join('?' * len(task_ids))
+        with self._lock:
+            db = self._db()
+            with db:
+                rows = db.execute(f'SELECT id, task_id, status, details FROM task_events '
+                                  f'WHERE task_id IN ({placeholders}) ORDER BY id', task_ids).fetchall()
+                if rows:
+                    db.execute(f"DELETE FROM task_events WHERE id IN ({','.join('?' * len(rows))})",
+                               [row[0] for row in rows])
+        self.events_forwarded += len(rows)
+        return [(row[1], row[2], json.loads(row[3]) if row[3] else None) for row in rows]
+
+    # Rate buckets
+
+    def take_token(self, name: str, rate: float, burst: float) -> float:
+        """
+        Take a token from the shared bucket `name` (refilled at `rate` per second, holding up to
+        `burst`). Returns 0 on success, otherwise the seconds until a token may be available.
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.time()
+        params = {'name': name, 'rate': rate, 'burst': burst, 'now': now}
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('INSERT OR IGNORE INTO rate_buckets (name, tokens, updated) VALUES (:name, :burst, :now)',
+                           params)
+                # One statement, so the refill and the take are atomic across processes
+                taken = db.execute('''
+                    UPDATE rate_buckets SET tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now
+                    WHERE name = :name AND paused_until <= :now
+                    AND MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+                ''', params).rowcount
+                if taken:
+                    return 0.0
+                tokens, updated, paused_until = db.execute(
+                    'SELECT tokens, updated, paused_until FROM rate_buckets WHERE name = ?', (name,)).fetchone()
+        available = min(burst, tokens + (now - updated) * rate)
+        return max(paused_until - now, (1 - available) / rate, 0.001)
+
+    def pause_bucket(self, name: str, seconds: float):
+        """Empty the shared bucket `name` and hand out no tokens for `seconds`."""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('UPDATE rate_buckets SET tokens = 0, updated = ?, paused_until = MAX(paused_until, ?) '
+                           'WHERE name = ?', (now, now + seconds, name))
+
+    # Values
+
+    def get_value(self, name: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db().execute('SELECT value FROM state WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_value(self, name: str, value: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('INSERT OR REPLACE INTO state (name, value, updated_at) VALUES (?, ?, ?)',
+                           (name, json.dumps(value), time.time()))
+
+    # Heartbeat
+
+    def beat(self):
+        """Renew every lease this worker holds (its own `worker:` lease included) and drop stale rows."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('UPDATE leases SET expires_at = ? WHERE owner = ?', (now + self.lease_ttl, self.worker_id))
+                db.execute('INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)',
+                           (f'worker:{self.worker_id}', self.worker_id, now + self.lease_ttl))
+                db.execute('DELETE FROM leases WHERE expires_at < ?', (now - self.lease_ttl,))
+                db.execute('''
+                    DELETE FROM history_waiters WHERE owner NOT IN (
+                        SELECT owner FROM leases WHERE name = 'worker:' || owner
+                    )
+                ''')
+                db.execute('DELETE FROM claims WHERE claimed_at < ?', (now - 7 * 24 * 3600,))
+                db.execute('DELETE FROM task_events WHERE created_at < ?', (now - 600,))
+
+    async def start(self):
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.beat)
+        self._heartbeat = asyncio.create_task(self._run())
+        log_message(f"Coordination enabled: worker {self.worker_id} using {self.path}")
+
+    async def stop(self):
+        if self._heartbeat is None:
+            return
+        self._heartbeat.cancel()
+        await asyncio.gather(self._heartbeat, return_exceptions=True)
+        self._heartbeat = None
+        # Hand everything over now instead of after the TTL
+        await asyncio.to_thread(self._hand_over)
+
+    def _hand_over(self):
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('DELETE FROM leases WHERE owner = ?', (self.worker_id,))
+                db.execute('DELETE FROM history_waiters WHERE owner = ?', (self.worker_id,))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.beat)
+            except sqlite3.Error as e:
+                log_message(f"Coordination heartbeat failed: {e}", level='error')
+
+    async def singleton(self, name: str, factory: Callable[[], Awaitable[None]]):
+        """
+        Run `factory()` in at most one worker at a time, e.g. a background loop. The worker holding
+        the `singleton:<name>` lease runs it; if that worker dies, another one takes over.
+        """
+        task: Optional[asyncio.Task] = None
+        try:
+            while True:
+                if await self.call(self.try_lease, f'singleton:{name}'):
+                    if task is None or task.done():
+                        task = asyncio.create_task(factory())
+                    if not self.enabled:
+                        await task
+                        return
+                elif task is not None:
+                    task.cancel()
+                    task = None
+                await asyncio.sleep(self.heartbeat_interval)
+        finally:
+            if task is not None:
+                task.cancel()
+            await self.call(self.release, f'singleton:{name}')
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {'enabled': False}
+        workers = self.holders('worker:')
+        return {
+            'enabled': True,
+            'worker_id': self.worker_id,
+            'live_workers': len(workers),
+            'claims_lost': self.claims_lost,
+            'events_forwarded': self.events_forwarded,
+        }
+
+
+coordinator = Coordinator()
@@ -1,32 +1,77 @@
+import asyncio
 import os
-import requests
-from dotenv import load_dotenv
+import sys
+from typing import List
+from env import load_env
+from http_client import client_for, close_clients, ELEVENLABS_BASE_URL
+from metrics import log_message
 
-load_dotenv()
+load_env()
 
-def download_elevenlabs_history_audio(history_item_id: str, save_path: str) -> bool:
+AUDIO_CHUNK_SIZE = int(os.getenv('AUDIO_CHUNK_SIZE', str(64 * 1024)))
+
+async def iter_elevenlabs_history_audio(history_item_id: str, chunk_size: int = AUDIO_CHUNK_SIZE):
+    """
+    Stream the audio of a history item from ElevenLabs in chunks of at most `chunk_size` bytes.
+    Raises if the API key is missing or the request fails.
+    """
     api_key = os.getenv('ELEVENLABS_API_KEY')
     if not api_key:
-        print('ELEVENLABS_API_KEY is not set in the environment.')
-        return False
-    url = f'https://api.elevenlabs.io/v1/history/{history_item_id}/audio'
+        raise Exception('ELEVENLABS_API_KEY is not set in the environment.')
+    url = f'{ELEVENLABS_BASE_URL}/v1/history/{history_item_id}/audio'
     headers = {
         'xi-api-key': api_key,
         'Accept': 'audio/mpeg'
     }
-    try:
-        response = requests.get(url, headers=headers)
+    async with client_for(url).stream('GET', url, headers=headers) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(chunk_size):
+            yield chunk
+
+async def iter_elevenlabs_history_zip(history_item_ids: List[str], chunk_size: int = AUDIO_CHUNK_SIZE):
+    """
+    Stream the zip archive ElevenLabs builds for several history items (POST /v1/history/download)
+    in chunks of at most `chunk_size` bytes. The archive is never held in memory; read its entries
+    with zip_stream.iter_zip_entries. Raises if the API key is missing or the request fails.
+    """
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        raise Exception('ELEVENLABS_API_KEY is not set in the environment.')
+    url = f'{ELEVENLABS_BASE_URL}/v1/history/download'
+    headers = {
+        'xi-api-key': api_key,
+        'Accept': 'application/zip'
+    }
+    async with client_for(url).stream('POST', url, headers=headers,
+                                      json={'history_item_ids': history_item_ids}) as response:
         response.raise_for_status()
+        async for chunk in response.aiter_bytes(chunk_size):
+            yield chunk
+
+async def download_elevenlabs_history_audio(history_item_id: str, save_path: str) -> bool:
+    try:
         with open(save_path, 'wb') as f:
-            f.write(response.content)
-        print(f'Audio downloaded to {save_path}')
+            async for chunk in iter_elevenlabs_history_audio(history_item_id):
+                f.write(chunk)
+        log_message(f'Audio downloaded to {save_path}')
         return True
     except Exception as e:
-        print(f'Error downloading audio: {e}')
+        log_message(f'Error downloading audio: {e}', level='error')
         return False
 
+async def _main(history_item_id: str, save_path: str):
+    try:
+        await download_elevenlabs_history_audio(history_item_id, save_path)
+    finally:
+        await close_clients()
+
 if __name__ == "__main__":
-    # Example usage
-    history_item_id = input("Enter history_item_id: ")
-    save_path = input("Enter path to save audio (e.g. output.mp3): ")
-    download_elevenlabs_history_audio(history_item_id, save_path) 
\ No newline at end of file
+    if sys.argv[1:2] == ['export']:
+        # Bulk mode: python elevenlabs_download.py export [options]
+        from history_export import main as export_main
+        export_main(sys.argv[2:])
+    else:
+        # Example usage
+        history_item_id = input("Enter history_item_id: ")
+        save_path = input("Enter path to save audio (e.g. output.mp3): ")
+        asyncio.run(_main(history_item_id, save_path))
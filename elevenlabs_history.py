@@ -1,30 +1,57 @@
+import asyncio
 import os
-import requests
 from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+from env import load_env
+from http_client import client_for, close_clients, ELEVENLABS_BASE_URL
+from rate_limits import limiter_for
 
-load_dotenv()
+load_env()
 
-def get_elevenlabs_history() -> Optional[Dict[str, Any]]:
-    api_key = os.getenv('ELEVENLABS_API_KEY')
-    if not api_key:
-        print('ELEVENLABS_API_KEY is not set in the environment.')
-        return None
-    url = 'https://api.elevenlabs.io/v1/history'
+async def fetch_history_page(api_key: str, page_size: int = 100,
+                             start_after_history_item_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fetch one page of /v1/history, newest first. Pass the last id of the previous page as
+    `start_after_history_item_id` to continue with older items. Calls are rate limited and 429s
+    retried (rate_limits.py); raises on other HTTP errors.
+    """
+    url = f'{ELEVENLABS_BASE_URL}/v1/history'
     headers = {
         'xi-api-key': api_key,
         'Accept': 'application/json'
     }
-    try:
-        response = requests.get(url, headers=headers)
+    params: Dict[str, Any] = {'page_size': page_size}
+    if start_after_history_item_id:
+        params['start_after_history_item_id'] = start_after_history_item_id
+
+    async def fetch():
+        response = await client_for(url).get(url, headers=headers, params=params)
         response.raise_for_status()
         return response.json()
+
+    limiter = limiter_for('elevenlabs')
+    async with limiter.slot():
+        return await limiter.call(fetch)
+
+async def get_elevenlabs_history(page_size: int = 100,
+                                 start_after_history_item_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        print('ELEVENLABS_API_KEY is not set in the environment.')
+        return None
+    try:
+        return await fetch_history_page(api_key, page_size, start_after_history_item_id)
     except Exception as e:
         print(f'Error fetching ElevenLabs history: {e}')
         return None
 
+async def _main():
+    try:
+        return await get_elevenlabs_history()
+    finally:
+        await close_clients()
+
 if __name__ == "__main__":
-    history = get_elevenlabs_history()
+    history = asyncio.run(_main())
     if history:
         print("History fetched successfully:")
         print(history)
@@ -0,0 +1,38 @@
+import os
+import httpx
+from env import load_env
+from http_client import client_for, ELEVENLABS_BASE_URL
+from metrics import log_message
+
+load_env()
+
+TTS_MODEL_ID = os.getenv('ELEVENLABS_TTS_MODEL', 'eleven_multilingual_v2')
+# Only mp3_* formats: the audio is stored and served as MP3
+TTS_OUTPUT_FORMAT = os.getenv('ELEVENLABS_OUTPUT_FORMAT', 'mp3_44100_128')
+
+
+async def open_tts_stream(text: str, voice_id: str, model_id: str = TTS_MODEL_ID,
+                          output_format: str = TTS_OUTPUT_FORMAT) -> httpx.Response:
+    """
+    Start a streaming text-to-speech request and return the response once its headers are in.
+    The body has not been read yet: iterate it with `aiter_bytes()` and close it with `aclose()`.
+    Raises if the API key is missing or ElevenLabs rejects the request.
+    """
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        raise Exception('ELEVENLABS_API_KEY is not set in the environment.')
+    url = f'{ELEVENLABS_BASE_URL}/v1/text-to-speech/{voice_id}/stream'
+    headers = {
+        'xi-api-key': api_key,
+        'Accept': 'audio/mpeg'
+    }
+    client = client_for(url)
+    request = client.build_request('POST', url, headers=headers, params={'output_format': output_format},
+                                   json={'text': text, 'model_id': model_id})
+    response = await client.send(request, stream=True)
+    if response.is_error:
+        await response.aread()
+        await response.aclose()
+        log_message(f'ElevenLabs TTS error {response.status_code}: {response.text}', level='error')
+        response.raise_for_status()
+    return response
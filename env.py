@@ -0,0 +1,14 @@
+"""
+Loads .env into os.environ once per process. Modules that read settings at import time call
+`load_env()` first; after the first call it costs nothing.
+"""
+_loaded = False
+
+
+def load_env():
+    global _loaded
+    if _loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    _loaded = True
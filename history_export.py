@@ -0,0 +1,274 @@
+"""
+Bulk export of ElevenLabs history audio to the uploads cache and/or S3.
+
+    python history_export.py --to both --workers 8
+    python elevenlabs_download.py export --since 2024-01-01
+
+The history index is synced first (paging through /v1/history), then every item still missing a
+copy is exported, oldest first. Items already on disk or in S3 are skipped without downloading
+them again. Workers take batches of items and fetch each batch as one zip from
+/v1/history/download. The archive is unpacked while it streams, so it is never held in memory.
+If an archive can't be read, its items are downloaded one by one instead. Each finished item is
+recorded in the index right away (`mark_stored`), so an interrupted export picks up where it
+stopped.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+from env import load_env
+from elevenlabs_download import iter_elevenlabs_history_audio, iter_elevenlabs_history_zip
+from history_index import HistoryIndex
+from http_client import close_clients
+from rate_limits import BATCH_PRIORITY, limiter_for, priority_var
+from s3_storage import s3_uploader, upload_file_to_s3, upload_stream_to_s3
+from uploads_cache import UploadsCache
+from zip_stream import ZipStreamError, iter_zip_entries
+
+load_env()
+
+
+def _s3_key(history_item_id: str) -> str:
+    # Same layout as the pipeline, so exported and generated audio share one S3 folder
+    return f"{os.getenv('S3_AUDIO_FOLDER', '')}{history_item_id}.mp3"
+
+
+class ExportProgress:
+    def __init__(self, total: int):
+        self.total = total
+        self.exported = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.zip_batches = 0
+        self.fallbacks = 0
+        self.started = time.monotonic()
+
+    @property
+    def finished(self) -> int:
+        return self.exported + self.skipped + self.failed
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.exported / elapsed
+        left = self.total - self.finished
+        eta = f"{left / rate:.0f}s" if rate > 0 else '?'
+        return (f"{self.finished}/{self.total} items ({self.exported} exported, {self.skipped} skipped, "
+                f"{self.failed} failed) | {rate:.2f} items/s, {self.bytes / elapsed / 1e6:.2f} MB/s | ETA {eta}")
+
+
+class HistoryExporter:
+    """
+    Worker pool that exports history items to `local` (the uploads cache) and/or `s3`.
+    At most `workers` downloads run at once, and each batch of `batch_size` items is one request.
+    Every download waits for the shared ElevenLabs rate limiter at batch priority, so a running API
+    server still comes first.
+    """
+
+    def __init__(self, index: HistoryIndex, cache: UploadsCache, local: bool, s3_bucket: Optional[str],
+                 workers: int = 4, batch_size: int = 10, use_zip: bool = True):
+        self.index = index
+        self.cache = cache
+        self.local = local
+        self.s3_bucket = s3_bucket
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.use_zip = use_zip
+        self.progress = ExportProgress(0)
+
+    async def _missing(self, history_item_id: str) -> Dict[str, object]:
+        """Which copies are missing. Copies found along the way are recorded in the index."""
+        local_path = await asyncio.to_thread(self.cache.lookup, history_item_id)
+        s3_key = _s3_key(history_item_id)
+        in_s3 = bool(self.s3_bucket) and await asyncio.to_thread(s3_uploader.exists, self.s3_bucket, s3_key)
+        if local_path or in_s3:
+            await asyncio.to_thread(self.index.mark_stored, history_item_id, downloaded_path=local_path,
+                                    s3_key=s3_key if in_s3 else None)
+        return {
+            'local_path': local_path,
+            'local': self.local and not local_path,
+            's3': bool(self.s3_bucket) and not in_s3,
+        }
+
+    async def _counted(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            self.progress.bytes += len(chunk)
+            yield chunk
+
+    async def _store(self, history_item_id: str, chunks: AsyncIterator[bytes], missing: dict):
+        """Write one item's audio to every missing destination; raises if any of them failed."""
+        chunks = self._counted(chunks)
+        if missing['local']:
+            chunks = self.cache.tee(history_item_id, chunks)
+        s3_key = _s3_key(history_item_id)
+        if missing['s3']:
+            if not await upload_stream_to_s3(chunks, self.s3_bucket, s3_key):
+                raise Exception(f"S3 upload of {s3_key} failed")
+        else:
+            async for _ in chunks:
+                pass
+        await asyncio.to_thread(
+            self.index.mark_stored,
+            history_item_id,
+            downloaded_path=self.cache.path_for(history_item_id) if missing['local'] else None,
+            s3_key=s3_key if missing['s3'] else None,
+        )
+        if missing['local'] and missing['s3']:
+            await asyncio.to_thread(self.cache.set_s3_key, history_item_id, s3_key)
+        self.progress.exported += 1
+
+    async def _download_one(self, history_item_id: str, missing: dict):
+        try:
+            await limiter_for('elevenlabs').throttle()
+            await self._store(history_item_id, iter_elevenlabs_history_audio(history_item_id), missing)
+        except Exception as e:
+            self.progress.failed += 1
+            print(f"Failed to export history item {history_item_id}: {e}")
+
+    async def _download_zip(self, pending: Dict[str, dict]):
+        """
+        Export a batch from one zip archive. An entry is only used when its file name, without the
+        extension, is one of the requested ids; other entries are skipped. Whatever the archive did
+        not deliver is downloaded item by item.
+        """
+        ids = list(pending)
+        remaining = dict(pending)
+        await limiter_for('elevenlabs').throttle()
+        try:
+            async for entry in iter_zip_entries(iter_elevenlabs_history_zip(ids)):
+                history_item_id = Path(entry.name).stem
+                if history_item_id not in remaining:
+                    continue
+                missing = remaining.pop(history_item_id)
+                try:
+                    await self._store(history_item_id, entry.chunks(), missing)
+                except ZipStreamError:
+                    remaining[history_item_id] = missing
+                    raise
+                except Exception as e:
+                    # The archive is no longer at an entry boundary; give up on the rest of it
+                    self.progress.failed += 1
+                    print(f"Failed to export history item {history_item_id}: {e}")
+                    break
+            self.progress.zip_batches += 1
+        except (ZipStreamError, httpx.HTTPError) as e:
+            print(f"Zip download of {len(ids)} history items failed ({e}), downloading them one by one")
+        if remaining:
+            self.progress.fallbacks += len(remaining)
+            for history_item_id, missing in remaining.items():
+                await self._download_one(history_item_id, missing)
+
+    async def _export_batch(self, history_item_ids: List[str]):
+        pending: Dict[str, dict] = {}
+        for history_item_id in history_item_ids:
+            missing = await self._missing(history_item_id)
+            if not missing['local'] and not missing['s3']:
+                self.progress.skipped += 1
+            elif not missing['local'] and missing['local_path']:
+                # Already on disk: upload the local copy instead of downloading it again
+                s3_key = _s3_key(history_item_id)
+                if await asyncio.to_thread(upload_file_to_s3, missing['local_path'], self.s3_bucket, s3_key):
+                    await asyncio.to_thread(self.index.mark_stored, history_item_id, s3_key=s3_key)
+                    await asyncio.to_thread(self.cache.set_s3_key, history_item_id, s3_key)
+                    self.progress.exported += 1
+                else:
+                    self.progress.failed += 1
+            else:
+                pending[history_item_id] = missing
+        if len(pending) > 1 and self.use_zip:
+            await self._download_zip(pending)
+        else:
+            for history_item_id, missing in pending.items():
+                await self._download_one(history_item_id, missing)
+
+    async def _worker(self, queue: asyncio.Queue):
+        priority_var.set(BATCH_PRIORITY)
+        while True:
+            batch = await queue.get()
+            try:
+                await self._export_batch(batch)
+            except Exception as e:
+                self.progress.failed += len(batch)
+                print(f"Failed to export {len(batch)} history items: {e}")
+            finally:
+                queue.task_done()
+
+    async def _report(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.progress.report())
+
+    async def run(self, items: List[dict], report_interval: float = 5.0) -> ExportProgress:
+        self.progress = ExportProgress(len(items))
+        # Bounded, so batches are planned no faster than the workers drain them
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report(report_interval))
+        try:
+            for start in range(0, len(items), self.batch_size):
+                await queue.put([item['history_item_id'] for item in items[start:start + self.batch_size]])
+            await queue.join()
+        finally:
+            for task in workers + [reporter]:
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+        return self.progress
+
+
+def _parse_since(value: str) -> int:
+    """Unix timestamp or YYYY-MM-DD."""
+    if value.isdigit():
+        return int(value)
+    return int(datetime.strptime(value, '%Y-%m-%d').timestamp())
+
+
+async def _export(args) -> ExportProgress:
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        raise SystemExit('ELEVENLABS_API_KEY is not set in the environment.')
+    s3_bucket = os.getenv('S3_BUCKET_NAME') if args.to in ('s3', 'both') else None
+    if args.to in ('s3', 'both') and not s3_bucket:
+        raise SystemExit('S3_BUCKET_NAME is not set in the environment.')
+    index = HistoryIndex(args.db)
+    try:
+        if not args.no_sync:
+            written = await index.sync(api_key)
+            print(f"History index: synced {written} new items ({index.count()} indexed)")
+        items = index.unstored(local=args.to in ('local', 'both'), s3=bool(s3_bucket), voice_id=args.voice_id,
+                               since=_parse_since(args.since) if args.since else None, limit=args.limit)
+        print(f"Exporting {len(items)} history items to {args.to} with {args.workers} workers")
+        exporter = HistoryExporter(index, UploadsCache(), local=args.to in ('local', 'both'), s3_bucket=s3_bucket,
+                                   workers=args.workers, batch_size=args.batch_size, use_zip=not args.no_zip)
+        progress = await exporter.run(items, args.report_interval)
+        print(progress.report())
+        print(f"{progress.zip_batches} zip batches, {progress.fallbacks} items downloaded one by one")
+        return progress
+    finally:
+        await close_clients()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Export ElevenLabs history audio to the uploads cache and/or S3')
+    parser.add_argument('--to', choices=['local', 's3', 'both'],
+                        default='s3' if os.getenv('S3_BUCKET_NAME') else 'local')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent downloads')
+    parser.add_argument('--batch-size', type=int, default=10, help='history items per zip download')
+    parser.add_argument('--no-zip', action='store_true', help='download every item separately')
+    parser.add_argument('--voice-id', help='only export items of this voice')
+    parser.add_argument('--since', help='only export items created since (unix time or YYYY-MM-DD)')
+    parser.add_argument('--limit', type=int, help='export at most this many items')
+    parser.add_argument('--no-sync', action='store_true', help='use the index as is, without paging /v1/history')
+    parser.add_argument('--report-interval', type=float, default=5.0, help='seconds between progress lines')
+    parser.add_argument('--db', help='history index path (default: HISTORY_INDEX_PATH or data/history.db)')
+    args = parser.parse_args(argv)
+    progress = asyncio.run(_export(args))
+    if progress.failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
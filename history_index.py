@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+from coordination import open_shared_db
+from env import load_env
+from elevenlabs_history import fetch_history_page
+from http_client import close_clients
+from result_cache import normalize_script
+from metrics import log_message
+
+load_env()
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_script(text or '').encode('utf-8')).hexdigest()
+
+
+class HistoryIndex:
+    """
+    Local SQLite mirror of ElevenLabs /v1/history.
+    `sync` pages newest-first and stops at the cursor left by the previous sync, so after the
+    initial backfill each sync only transfers the delta. Lookups by text hash and voice are local queries.
+    Download/S3 state recorded with `mark_stored` survives restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('HISTORY_INDEX_PATH', os.path.join('data', 'history.db'))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_shared_db(self.path)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS history_items (
+                    history_item_id TEXT PRIMARY KEY,
+                    voice_id TEXT,
+                    voice_name TEXT,
+                    text TEXT,
+                    text_hash TEXT,
+                    character_count INTEGER,
+                    date_unix INTEGER,
+                    downloaded_path TEXT,
+                    s3_key TEXT,
+                    synced_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS history_items_lookup ON history_items (text_hash, voice_id);
+                CREATE INDEX IF NOT EXISTS history_items_date ON history_items (date_unix);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def upsert(self, items: Iterable[dict]) -> int:
+        """Insert or refresh history items as returned by the API; keeps download/S3 state."""
+        now = time.time()
+        rows = []
+        for item in items:
+            if not item.get('history_item_id'):
+                continue
+            count = (item.get('character_count_change_to') or 0) - (item.get('character_count_change_from') or 0)
+            rows.append((
+                item['history_item_id'], item.get('voice_id'), item.get('voice_name'), item.get('text'),
+                text_hash(item.get('text', '')), count, item.get('date_unix'), now,
+            ))
+        with self._lock:
+            db = self._db()
+            db.executemany('''
+                INSERT INTO history_items
+                    (history_item_id, voice_id, voice_name, text, text_hash, character_count, date_unix, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(history_item_id) DO UPDATE SET
+                    voice_id = excluded.voice_id,
+                    voice_name = excluded.voice_name,
+                    text = excluded.text,
+                    text_hash = excluded.text_hash,
+                    character_count = excluded.character_count,
+                    date_unix = excluded.date_unix,
+                    synced_at = excluded.synced_at
+            ''', rows)
+            db.commit()
+        return len(rows)
+
+    def mark_stored(self, history_item_id: str, downloaded_path: Optional[str] = None,
+                    s3_key: Optional[str] = None):
+        with self._lock:
+            db = self._db()
+            db.execute('INSERT OR IGNORE INTO history_items (history_item_id, synced_at) VALUES (?, ?)',
+                       (history_item_id, time.time()))
+            if downloaded_path is not None:
+                db.execute('UPDATE history_items SET downloaded_path = ? WHERE history_item_id = ?',
+                           (downloaded_path, history_item_id))
+            if s3_key is not None:
+                db.execute('UPDATE history_items SET s3_key = ? WHERE history_item_id = ?',
+                           (s3_key, history_item_id))
+            db.commit()
+
+    def contains(self, history_item_id: str) -> bool:
+        with self._lock:
+            row = self._db().execute('SELECT 1 FROM history_items WHERE history_item_id = ?',
+                                     (history_item_id,)).fetchone()
+        return row is not None
+
+    def get(self, history_item_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db().execute('SELECT * FROM history_items WHERE history_item_id = ?',
+                                     (history_item_id,)).fetchone()
+        return dict(row) if row else None
+
+    def search(self, text: Optional[str] = None, voice_id: Optional[str] = None, q: Optional[str] = None,
+               stored_only: bool = False, limit: int = 20) -> List[dict]:
+        """Exact match on normalized `text`, substring match on `q`, newest first."""
+        clauses, params = [], []
+        if text:
+            clauses.append('text_hash = ?')
+            params.append(text_hash(text))
+        if voice_id:
+            clauses.append('voice_id = ?')
+            params.append(voice_id)
+        if q:
+            clauses.append('text LIKE ?')
+            params.append(f'%{q}%')
+        if stored_only:
+            clauses.append('(s3_key IS NOT NULL OR downloaded_path IS NOT NULL)')
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._db().execute(
+                f'SELECT * FROM history_items {where} ORDER BY date_unix DESC LIMIT ?', (*params, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def unstored(self, local: bool = True, s3: bool = False, voice_id: Optional[str] = None,
+                 since: Optional[int] = None, limit: Optional[int] = None) -> List[dict]:
+        """Items still missing a local copy (`local`) or an S3 copy (`s3`), oldest first."""
+        missing = []
+        if local:
+            missing.append('downloaded_path IS NULL')
+        if s3:
+            missing.append('s3_key IS NULL')
+        clauses = [f"({' OR '.join(missing or ['0'])})"]
+        params: list = []
+        if voice_id:
+            clauses.append('voice_id = ?')
+            params.append(voice_id)
+        if since:
+            clauses.append('date_unix >= ?')
+            params.append(since)
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT * FROM history_items WHERE {' AND '.join(clauses)} ORDER BY date_unix LIMIT ?",
+                (*params, -1 if limit is None else limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def recent(self, synced_since: float) -> List[dict]:
+        """Items written to the index since `synced_since`, oldest first (the history watcher's shared feed)."""
+        with self._lock:
+            rows = self._db().execute(
+                'SELECT history_item_id, voice_id, voice_name, text, date_unix FROM history_items '
+                'WHERE synced_at >= ? AND text IS NOT NULL ORDER BY date_unix', (synced_since,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db().execute('SELECT COUNT(*) FROM history_items').fetchone()[0]
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        with self._lock:
+            db = self._db()
+            db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+            db.commit()
+
+    async def sync(self, api_key: str, full: bool = False, page_size: int = 100, max_pages: Optional[int] = None) -> int:
+        """
+        Pull new history items into the index and return how many were written.
+        A delta sync stops once it reaches the newest item of the previous completed sync; items
+        upserted in between by other writers (e.g. the history watcher) do not end it early.
+        """
+        cursor = None if full else await asyncio.to_thread(self._get_meta, 'sync_cursor')
+        cursor_id, cursor_date = json.loads(cursor) if cursor else (None, None)
+        newest = None
+        written = 0
+        pages = 0
+        start_after = None
+        while max_pages is None or pages < max_pages:
+            page = await fetch_history_page(api_key, page_size, start_after)
+            pages += 1
+            items = page.get('history', [])
+            if newest is None and items:
+                newest = (items[0].get('history_item_id'), items[0].get('date_unix'))
+            fresh = []
+            reached_cursor = False
+            for item in items:
+                if cursor_id is not None and (item.get('history_item_id') == cursor_id
+                                              or (item.get('date_unix') or 0) < (cursor_date or 0)):
+                    reached_cursor = True
+                    break
+                fresh.append(item)
+            written += await asyncio.to_thread(self.upsert, fresh)
+            if reached_cursor or not page.get('has_more') or not items:
+                break
+            start_after = page.get('last_history_item_id') or items[-1].get('history_item_id')
+        else:
+            # Stopped by max_pages: the cursor would skip the unread older items, so keep the old one
+            return written
+        if newest is not None:
+            await asyncio.to_thread(self._set_meta, 'sync_cursor', json.dumps(newest))
+        return written
+
+
+async def run_periodic_sync(index: HistoryIndex, api_key: str, interval: float):
+    """Background loop keeping the index current with delta syncs."""
+    while True:
+        try:
+            written = await index.sync(api_key)
+            if written:
+                log_message(f"History index: synced {written} new items")
+        except Exception as e:
+            log_message(f'Error syncing ElevenLabs history index: {e}', level='error')
+        await asyncio.sleep(interval)
+
+
+async def _sync(index: HistoryIndex, full: bool) -> int:
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        raise SystemExit('ELEVENLABS_API_KEY is not set in the environment.')
+    try:
+        return await index.sync(api_key, full=full)
+    finally:
+        await close_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local index of ElevenLabs history')
+    parser.add_argument('--db', help='index path (default: HISTORY_INDEX_PATH or data/history.db)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sync_parser = sub.add_parser('sync', help='pull new history items into the index')
+    sync_parser.add_argument('--full', action='store_true', help='re-read the whole history')
+    search_parser = sub.add_parser('search', help='look up indexed items')
+    search_parser.add_argument('--text', help='exact script text (whitespace-insensitive)')
+    search_parser.add_argument('--q', help='substring of the text')
+    search_parser.add_argument('--voice-id')
+    search_parser.add_argument('--stored-only', action='store_true', help='only items already downloaded or in S3')
+    search_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    index = HistoryIndex(args.db)
+    if args.command == 'sync':
+        start = time.monotonic()
+        written = asyncio.run(_sync(index, args.full))
+        print(f"Synced {written} items in {time.monotonic() - start:.2f}s ({index.count()} indexed)")
+    else:
+        results = index.search(text=args.text, voice_id=args.voice_id, q=args.q,
+                               stored_only=args.stored_only, limit=args.limit)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
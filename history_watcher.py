@@ -0,0 +1,274 @@
+import asyncio
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from coordination import coordinator
+from elevenlabs_history import fetch_history_page
+from metrics import http_calls_var, log_message, request_id_var
+from rate_limits import DEFAULT_PRIORITY, priority_var
+
+_TAG_PATTERN = re.compile(r'\[[^\]]*\]')
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+def text_words(text: str) -> set:
+    """Words of a script with ElevenLabs audio tags such as [excited] removed."""
+    return set(_WORD_PATTERN.findall(_TAG_PATTERN.sub(' ', text or '').lower()))
+
+
+def match_score(script_words: set, item: dict) -> float:
+    """Fraction of the submitted script's words found in a history item's text."""
+    if not script_words:
+        return 0.0
+    return len(script_words & text_words(item.get('text', ''))) / len(script_words)
+
+
+class HistoryWaiter:
+    def __init__(self, script: str, voice_id: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.words = text_words(script)
+        self.voice_id = voice_id
+        self.registered_at = time.time()
+        self.armed = False
+        self.candidates: List[dict] = []
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def accepts(self, item: dict, slack: float) -> bool:
+        return _accepts(self.voice_id, self.registered_at, item, slack)
+
+
+def _accepts(voice_id: Optional[str], registered_at: float, item: dict, slack: float) -> bool:
+    if voice_id and item.get('voice_id') and item['voice_id'] != voice_id:
+        return False
+    created = item.get('date_unix')
+    return created is None or created >= registered_at - slack
+
+
+class HistoryWatcher:
+    """
+    Shared watcher over one API key's ElevenLabs history.
+    It keeps a set of already-seen history_item_ids and fetches only items newer than the cursor,
+    paging further back only when a whole page is new. Each new item goes to the open waiter
+    whose voice and text match it best, so concurrent jobs never race for the same item.
+    The watcher only polls while at least one waiter is armed, i.e. its task has finished.
+    With several worker processes (coordination.py), only the worker holding the `history-poll`
+    lease fetches /v1/history; the others read the items it mirrors into the shared history index
+    through `feed(since)`. Waiters are published, so an item is left to another worker whose job
+    matches it better, and every hand-out is a claim that at most one worker wins.
+    """
+
+    def __init__(self, api_key: str, poll_interval: Optional[float] = None, page_size: int = 20,
+                 match_threshold: float = 0.5, clock_slack: float = 5.0, max_pages: int = 10,
+                 seen_limit: int = 5000):
+        self.api_key = api_key
+        self.poll_interval = poll_interval or float(os.getenv('HISTORY_POLL_INTERVAL', '2'))
+        self.page_size = page_size
+        self.match_threshold = match_threshold
+        self.clock_slack = clock_slack
+        self.max_pages = max_pages
+        self.seen_limit = seen_limit
+        self.seen: 'OrderedDict[str, None]' = OrderedDict()
+        self.primed = False
+        self.waiters: List[HistoryWaiter] = []
+        self.listeners = []
+        # Set by the pipeline: `feed(since)` returns items mirrored into the shared index since then
+        self.feed = None
+        self.feed_cursor = time.time()
+        self.fetches = 0
+        self._prime_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    async def expect(self, script: str, voice_id: Optional[str]) -> HistoryWaiter:
+        """Register interest in the item a task is about to generate. Call before creating the task."""
+        if not self.primed:
+            if self._prime_lock is None:
+                self._prime_lock = asyncio.Lock()
+            async with self._prime_lock:
+                if not self.primed:
+                    # Everything already in history is old: remember it without dispatching
+                    page = await self._fetch()
+                    for item in page.get('history', []):
+                        self._mark_seen(item['history_item_id'])
+                    self.primed = True
+        waiter = HistoryWaiter(script, voice_id)
+        self.waiters.append(waiter)
+        await coordinator.call(coordinator.add_waiter, waiter.id, voice_id, waiter.words, waiter.registered_at)
+        return waiter
+
+    async def wait(self, waiter: HistoryWaiter, timeout: float) -> Optional[dict]:
+        """
+        Arm the waiter and wait for its matching history item. On timeout, fall back to the
+        best-scoring unclaimed candidate for the same voice, or None.
+        """
+        waiter.armed = True
+        self._ensure_running()
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            for item in sorted(waiter.candidates, key=lambda candidate: match_score(waiter.words, candidate),
+                               reverse=True):
+                for other in self.waiters:
+                    if item in other.candidates:
+                        other.candidates.remove(item)
+                if await coordinator.call(coordinator.claim, f"history:{item['history_item_id']}"):
+                    return item
+            return None
+        finally:
+            await self.cancel(waiter)
+
+    async def find_recent(self, script: str, voice_id: Optional[str], since: float) -> Optional[dict]:
+        """
+        Best match for `script` among items created after `since`, read straight from history.
+        For jobs resumed after a restart, whose item may be older than the watcher's cursor.
+        """
+        words = text_words(script)
+        best, best_score = None, 0.0
+        start_after = None
+        for _ in range(self.max_pages):
+            page = await self._fetch(start_after)
+            items = page.get('history', [])
+            for item in items:
+                created = item.get('date_unix')
+                if created is not None and created < since - self.clock_slack:
+                    return best if best_score >= self.match_threshold else None
+                if voice_id and item.get('voice_id') and item['voice_id'] != voice_id:
+                    continue
+                score = match_score(words, item)
+                if score > best_score:
+                    best, best_score = item, score
+            if not page.get('has_more') or not items:
+                break
+            start_after = items[-1].get('history_item_id')
+        return best if best_score >= self.match_threshold else None
+
+    async def cancel(self, waiter: HistoryWaiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+            # Lets the poll loop stop right away when this was the last waiter
+            if self._wakeup is not None:
+                self._wakeup.set()
+            await coordinator.call(coordinator.remove_waiter, waiter.id)
+
+    def add_listener(self, callback):
+        """
+        Call `callback(items)` with every batch of newly seen history items. Callbacks run in a
+        worker thread, so they may block (e.g. write to the history index).
+        """
+        self.listeners.append(callback)
+
+    def _mark_seen(self, history_item_id: str):
+        self.seen[history_item_id] = None
+        while len(self.seen) > self.seen_limit:
+            self.seen.popitem(last=False)
+
+    async def _fetch(self, start_after: Optional[str] = None) -> dict:
+        self.fetches += 1
+        return await fetch_history_page(self.api_key, self.page_size, start_after)
+
+    async def fetch_new_items(self) -> List[dict]:
+        """Items newer than the cursor, oldest first."""
+        new_items = []
+        start_after = None
+        for _ in range(self.max_pages):
+            page = await self._fetch(start_after)
+            items = page.get('history', [])
+            reached_cursor = False
+            for item in items:
+                if item.get('history_item_id') in self.seen:
+                    reached_cursor = True
+                    break
+                new_items.append(item)
+            if reached_cursor or not page.get('has_more') or not items:
+                break
+            start_after = items[-1].get('history_item_id')
+        for item in new_items:
+            self._mark_seen(item['history_item_id'])
+        new_items.reverse()
+        return new_items
+
+    def _remote_score(self, item: dict, remote_waiters: List[dict]) -> float:
+        scores = [match_score(w['words'], item) for w in remote_waiters
+                  if _accepts(w['voice_id'], w['registered_at'], item, self.clock_slack)]
+        return max(scores, default=0.0)
+
+    async def read_feed(self) -> List[dict]:
+        """Unseen items another worker mirrored into the shared index, oldest first."""
+        since = self.feed_cursor
+        self.feed_cursor = time.time()
+        # Rows committed just before the cursor moved are read again; `seen` drops the repeats
+        items = await asyncio.to_thread(self.feed, since - self.poll_interval)
+        new_items = [item for item in items if item.get('history_item_id') not in self.seen]
+        for item in new_items:
+            self._mark_seen(item['history_item_id'])
+        return new_items
+
+    async def dispatch(self, items: List[dict]):
+        remote_waiters = await coordinator.call(coordinator.remote_waiters)
+        for item in items:
+            open_waiters = [w for w in self.waiters if not w.future.done() and w.accepts(item, self.clock_slack)]
+            if not open_waiters:
+                continue
+            scored = [(match_score(w.words, item), w) for w in open_waiters]
+            score, best = max(scored, key=lambda pair: pair[0])
+            if remote_waiters and self._remote_score(item, remote_waiters) > score:
+                # Another worker's job matches it better; that worker will claim it
+                continue
+            if score >= self.match_threshold:
+                if not await coordinator.call(coordinator.claim, f"history:{item['history_item_id']}"):
+                    continue
+                log_message(f"History item {item['history_item_id']} matched a waiting job (score {score:.2f})")
+                best.future.set_result(item)
+            else:
+                for _, waiter in scored:
+                    waiter.candidates.append(item)
+
+    def _ensure_running(self):
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def _run(self):
+        # Started from whichever job came first, but the fetches serve every waiter: detach from its request
+        http_calls_var.set(None)
+        request_id_var.set(None)
+        priority_var.set(DEFAULT_PRIORITY)
+        try:
+            while any(w.armed and not w.future.done() for w in self.waiters):
+                try:
+                    if self.feed is None or await coordinator.call(coordinator.try_lease, 'history-poll'):
+                        items = await self.fetch_new_items()
+                    else:
+                        items = await self.read_feed()
+                    if items:
+                        await self.dispatch(items)
+                        for listener in self.listeners:
+                            await asyncio.to_thread(listener, items)
+                except Exception as e:
+                    log_message(f'Error fetching ElevenLabs history: {e}', level='error')
+                self._wakeup.clear()
+                if not any(w.armed and not w.future.done() for w in self.waiters):
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Let a worker that still has waiters take over the polling
+            await coordinator.call(coordinator.release, 'history-poll')
+
+
+_watchers: Dict[str, HistoryWatcher] = {}
+
+
+def get_history_watcher(api_key: str) -> HistoryWatcher:
+    """The shared watcher for `api_key`, created on first use."""
+    watcher = _watchers.get(api_key)
+    if watcher is None:
+        watcher = _watchers[api_key] = HistoryWatcher(api_key)
+    return watcher
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import ssl
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+from env import load_env
+from metrics import HTTP_CLIENT_REQUESTS, HTTP_CLIENT_SECONDS, count_external_call
+
+load_env()
+
+# Base URLs can be pointed at local stand-ins (benchmarks, staging proxies)
+BROWSER_USE_BASE_URL = os.getenv('BROWSER_USE_BASE_URL', 'https://api.browser-use.com').rstrip('/')
+ELEVENLABS_BASE_URL = os.getenv('ELEVENLABS_BASE_URL', 'https://api.elevenlabs.io').rstrip('/')
+
+HTTP_TIMEOUT = httpx.Timeout(
+    float(os.getenv('HTTP_TIMEOUT', '30')),
+    connect=float(os.getenv('HTTP_CONNECT_TIMEOUT', '10')),
+)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', '20')),
+    max_keepalive_connections=int(os.getenv('HTTP_MAX_KEEPALIVE', '10')),
+    keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60')),
+)
+
+# One pooled client per (event loop, origin); clients cannot be shared across loops
+_clients: Dict[Tuple[int, str], httpx.AsyncClient] = {}
+# Loading the CA bundle costs tens of milliseconds, so every client shares one context
+_ssl_context: Optional[ssl.SSLContext] = None
+_ssl_lock = threading.Lock()
+
+
+def ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        with _ssl_lock:
+            if _ssl_context is None:
+                _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def warm_up():
+    """
+    Blocking part of creating the first client: the CA bundle and httpcore's transport modules.
+    Run it in a thread so `client_for` is cheap on the event loop afterwards.
+    """
+    ssl_context()
+    http2_available()
+    import httpcore  # noqa: F401
+    httpx.AsyncHTTPTransport(verify=ssl_context())
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def service_name(url) -> str:
+    """Metric label for an outbound URL: the configured service it belongs to, else its host."""
+    origin = _origin(str(url))
+    if origin == _origin(BROWSER_USE_BASE_URL):
+        return 'browser_use'
+    if origin == _origin(ELEVENLABS_BASE_URL):
+        return 'elevenlabs'
+    return urlsplit(origin).hostname or 'unknown'
+
+
+async def _on_request(request: httpx.Request):
+    request.extensions['started_at'] = time.perf_counter()
+    count_external_call(service_name(request.url))
+
+
+async def _on_response(response: httpx.Response):
+    request = response.request
+    service = service_name(request.url)
+    HTTP_CLIENT_REQUESTS.inc(service=service, method=request.method, status=response.status_code)
+    started_at = request.extensions.get('started_at')
+    if started_at is not None:
+        HTTP_CLIENT_SECONDS.observe(time.perf_counter() - started_at, service=service)
+
+
+def client_for(url: str) -> httpx.AsyncClient:
+    """
+    Return the shared keep-alive client for the host of `url`, creating it on first use.
+    HTTP/2 is negotiated when the optional `h2` package is installed.
+    """
+    key = (id(asyncio.get_running_loop()), _origin(url))
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=HTTP_LIMITS,
+            http2=http2_available(),
+            verify=ssl_context(),
+            follow_redirects=True,
+            # Every outbound call is timed and counted, per service and per request
+            event_hooks={'request': [_on_request], 'response': [_on_response]},
+        )
+        _clients[key] = client
+    return client
+
+
+async def close_clients():
+    """Close every client owned by the running event loop."""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [key for key in _clients if key[0] == loop_id]:
+        await _clients.pop(key).aclose()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from coordination import open_shared_db
+from metrics import log_message
+
+
+class JobStore:
+    """
+    Durable SQLite record of every job, so a restart can resume unfinished jobs instead of losing them.
+    The database runs in WAL mode. `save` only queues the latest snapshot of a job. A background
+    flusher writes all queued snapshots in one transaction every `flush_interval` seconds, so a burst
+    of stage changes costs one commit rather than one per change.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: Optional[float] = None,
+                 retention: Optional[float] = None):
+        self.path = path or os.getenv('JOB_STORE_PATH', os.path.join('data', 'jobs.db'))
+        self.flush_interval = flush_interval or float(os.getenv('JOB_STORE_FLUSH_INTERVAL', '0.25'))
+        # Finished jobs older than this many seconds are dropped at startup
+        self.retention = retention or float(os.getenv('JOB_STORE_RETENTION', str(7 * 24 * 3600)))
+        self._pending: Dict[str, dict] = {}
+        # `save` runs on the event loop: it must never wait behind a flush's write
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_shared_db(self.path)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    task_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    record TEXT NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at)')
+            self._conn.commit()
+        return self._conn
+
+    def save(self, record: dict):
+        """Queue the current snapshot of a job (a dict from Job.to_record) for the next flush."""
+        with self._lock:
+            self._pending[record['id']] = record
+        if self._wakeup is not None and len(self._pending) >= 100:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(r['id'], r['status'], r['stage'], r.get('task_id'), r['created_at'], r['updated_at'],
+                 json.dumps(r, default=str)) for r in pending.values()]
+        with self._db_lock:
+            db = self._db()
+            try:
+                with db:
+                    db.executemany(
+                        'INSERT OR REPLACE INTO jobs (id, status, stage, task_id, created_at, updated_at, record) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+                    )
+            except sqlite3.Error:
+                # Keep the snapshots for the next attempt unless newer ones arrived meanwhile
+                with self._lock:
+                    self._pending = {**pending, **self._pending}
+                raise
+            self.flushes += 1
+            self.rows_written += len(pending)
+            return len(pending)
+
+    def load(self, finished_limit: int = 500) -> List[dict]:
+        """Unfinished jobs plus the most recent finished ones, oldest first."""
+        with self._db_lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                           (time.time() - self.retention,))
+            unfinished = db.execute(
+                "SELECT record FROM jobs WHERE status NOT IN ('completed', 'failed') ORDER BY created_at"
+            ).fetchall()
+            finished = db.execute(
+                "SELECT record FROM jobs WHERE status IN ('completed', 'failed') ORDER BY updated_at DESC LIMIT ?",
+                (finished_limit,)
+            ).fetchall()
+        records = [json.loads(row[0]) for row in reversed(finished)] + [json.loads(row[0]) for row in unfinished]
+        return records
+
+    def load_unfinished(self) -> List[dict]:
+        """Unfinished jobs of every worker sharing this store, oldest first."""
+        with self._db_lock:
+            rows = self._db().execute(
+                "SELECT record FROM jobs WHERE status NOT IN ('completed', 'failed') ORDER BY created_at"
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """The last flushed snapshot of a job, e.g. one owned by another worker process."""
+        with self._lock:
+            pending = self._pending.get(job_id)
+        if pending is not None:
+            return pending
+        with self._db_lock:
+            row = self._db().execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                log_message(f"Job store flush failed: {e}", level='error')
+
+    def stats(self) -> dict:
+        return {'pending': len(self._pending), 'flushes': self.flushes, 'rows_written': self.rows_written}
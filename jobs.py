@@ -0,0 +1,432 @@
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Dict, List, Set
+from models import ScriptRequest, ScriptResponse, StageProgress, JobStatus
+from metrics import (
+    JOB_HTTP_CALLS, JOB_SECONDS, JOBS_TOTAL, STAGE_SECONDS, http_calls_var, log_event, log_message,
+    request_id_var,
+)
+from rate_limits import DEFAULT_PRIORITY, RateLimited, priority_var
+
+FINISHED_STATUSES = ('completed', 'failed')
+# How often a job that another worker runs is read back from the store
+FOLLOW_INTERVAL = float(os.getenv('JOB_FOLLOW_INTERVAL', '1'))
+
+
+class Job:
+    """
+    One /enhance-script/ request moving through the pipeline.
+    Stage changes are recorded with timestamps so GET /jobs/{id} can report progress.
+    Details passed to `advance` (task id, history item, S3 key, ...) form the job's checkpoint,
+    from which a job interrupted by a restart is resumed.
+    """
+
+    def __init__(self, request: ScriptRequest, priority: int = DEFAULT_PRIORITY):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.priority = request.priority if request.priority is not None else priority
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.stages: List[StageProgress] = [StageProgress(stage='queued', started_at=time.time())]
+        self.task_id: Optional[str] = None
+        self.result: Optional[ScriptResponse] = None
+        self.error: Optional[str] = None
+        # HTTP status for /enhance-script/ when the job failed (429 when a service kept throttling)
+        self.error_status = 500
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.key: Optional[str] = None
+        self.coalesced_requests = 0
+        # Inherits the id of the HTTP request that submitted the job
+        self.request_id = request_id_var.get() or self.id
+        self.http_calls: Dict[str, int] = {}
+        self.checkpoint: Dict[str, Any] = {}
+        # Called after every state change, e.g. to persist the job
+        self.on_change: Optional[Callable[['Job'], None]] = None
+        self.done = asyncio.Event()
+
+    @classmethod
+    def from_record(cls, record: dict, resume: bool = True) -> 'Job':
+        """
+        Rebuild a job saved with `to_record`. An interrupted job is queued again as 'resumed',
+        unless `resume` is False (a read-only view of a job another worker runs).
+        """
+        job = cls(ScriptRequest(**record['request']))
+        job.id = record['id']
+        job.status = record['status']
+        job.stage = record['stage']
+        job.stages = [StageProgress(**stage) for stage in record['stages']]
+        job.task_id = record.get('task_id')
+        job.result = ScriptResponse(**record['result']) if record.get('result') else None
+        job.error = record.get('error')
+        job.error_status = record.get('error_status', 500)
+        job.priority = record.get('priority', job.priority)
+        job.created_at = record['created_at']
+        job.updated_at = record['updated_at']
+        job.key = record.get('key')
+        job.coalesced_requests = record.get('coalesced_requests', 0)
+        job.request_id = record.get('request_id') or job.id
+        job.http_calls = record.get('http_calls') or {}
+        job.checkpoint = record.get('checkpoint') or {}
+        if job.status in FINISHED_STATUSES:
+            job.done.set()
+        elif resume:
+            # Downtime is not attributed to the stage that was running
+            if job.stages[-1].finished_at is None:
+                job.stages[-1].finished_at = job.updated_at
+            now = time.time()
+            job.stages.append(StageProgress(stage='resumed', started_at=now))
+            job.status = 'queued'
+            job.stage = 'resumed'
+            job.updated_at = now
+        return job
+
+    def mirror(self, record: dict):
+        """Take over the state another worker saved for this job (see JobManager._follow)."""
+        saved = Job.from_record(record, resume=False)
+        for name in ('status', 'stage', 'stages', 'task_id', 'result', 'error', 'error_status', 'updated_at',
+                     'http_calls'):
+            setattr(self, name, getattr(saved, name))
+        if self.status in FINISHED_STATUSES:
+            self.done.set()
+
+    def to_record(self) -> dict:
+        return {
+            'id': self.id,
+            'request': self.request.model_dump(),
+            'status': self.status,
+            'stage': self.stage,
+            'stages': [stage.model_dump() for stage in self.stages],
+            'task_id': self.task_id,
+            'result': self.result.model_dump() if self.result is not None else None,
+            'error': self.error,
+            'error_status': self.error_status,
+            'priority': self.priority,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'key': self.key,
+            'coalesced_requests': self.coalesced_requests,
+            'request_id': self.request_id,
+            'http_calls': dict(self.http_calls),
+            'checkpoint': dict(self.checkpoint),
+        }
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def _close_stage(self, now: float):
+        current = self.stages[-1]
+        current.finished_at = now
+        seconds = now - current.started_at
+        STAGE_SECONDS.observe(seconds, stage=current.stage)
+        log_event('stage_finished', request_id=self.request_id, job_id=self.id, stage=current.stage,
+                  seconds=round(seconds, 3), task_id=self.task_id)
+
+    def advance(self, stage: str, task_id: Optional[str] = None, **info):
+        """Start `stage` and merge `info` into the checkpoint; for the current stage only the latter."""
+        now = time.time()
+        if stage != self.stage:
+            self._close_stage(now)
+            self.stages.append(StageProgress(stage=stage, started_at=now))
+            self.stage = stage
+        if task_id:
+            self.task_id = task_id
+            self.checkpoint['task_id'] = task_id
+        self.checkpoint.update({name: value for name, value in info.items() if value is not None})
+        self.updated_at = now
+        self._changed()
+
+    def finish(self, result: Optional[ScriptResponse] = None, error: Optional[str] = None):
+        now = time.time()
+        self._close_stage(now)
+        self.result = result
+        self.error = error
+        self.status = 'failed' if error is not None else 'completed'
+        self.stage = self.status
+        self.updated_at = now
+        JOB_SECONDS.observe(now - self.created_at, status=self.status)
+        JOBS_TOTAL.inc(status=self.status)
+        for service, calls in self.http_calls.items():
+            JOB_HTTP_CALLS.observe(calls, service=service)
+        log_event('job_finished', request_id=self.request_id, job_id=self.id, status=self.status,
+                  seconds=round(now - self.created_at, 3), http_calls=self.http_calls, error=error)
+        self._changed()
+        self.done.set()
+
+    def to_status(self) -> JobStatus:
+        return JobStatus(
+            job_id=self.id,
+            status=self.status,
+            stage=self.stage,
+            stages=list(self.stages),
+            task_id=self.task_id,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            result=self.result,
+            error=self.error,
+            coalesced_requests=self.coalesced_requests,
+            priority=self.priority,
+            request_id=self.request_id,
+            http_calls=dict(self.http_calls),
+        )
+
+
+class JobManager:
+    """
+    Bounded worker pool that runs enhancement jobs in the background.
+    `runner(request, advance)` is the pipeline coroutine, normally pipeline.run_enhancement.
+    When `key_func` is given, a request whose key matches a job that is still queued or running
+    attaches to that job instead of starting another one (single-flight).
+    The queue is ordered by job priority (lower first), then submission order. A request that
+    attaches to a queued job raises the job's priority to its own if that is higher.
+    With a `store` (job_store.JobStore), jobs are persisted and unfinished ones are resumed on start:
+    the runner is then called with `resume=<checkpoint>`.
+    With an enabled `coordinator` (coordination.Coordinator), several worker processes share the
+    store. Each job is owned through a `job:<id>` lease, a worker only resumes jobs whose lease it
+    wins, and jobs of a worker that died are adopted by the others. Single-flight then spans the
+    workers: the worker that leads a key's `request:<key>` lease runs the job, and the others follow
+    it through the store. Only the leading worker can raise a job's priority.
+    """
+
+    def __init__(self, runner, workers: Optional[int] = None, history_limit: Optional[int] = None,
+                 key_func=None, store=None, coordinator=None):
+        self.runner = runner
+        self.key_func = key_func
+        self.store = store
+        self.coordinator = coordinator if coordinator is not None and coordinator.enabled else None
+        self.adopted_total = 0
+        self.resumed_total = 0
+        self.in_flight: Dict[str, Job] = {}
+        self.coalesced_total = 0
+        self.workers = workers or int(os.getenv('JOB_WORKERS', '8'))
+        self.history_limit = history_limit or int(os.getenv('JOB_HISTORY_LIMIT', '500'))
+        self.jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._followers: Set[asyncio.Task] = set()
+        # Held while a key's lease is taken, so two local requests can't both start a job for it
+        self._leading = asyncio.Lock()
+
+    async def start(self):
+        self.queue = asyncio.PriorityQueue()
+        if self.store is not None:
+            await self.store.start()
+            await self._rehydrate()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if self.coordinator is not None and self.store is not None:
+            self._tasks.append(asyncio.create_task(self._adopt_orphans()))
+        log_message(f"Job manager started with {self.workers} workers")
+
+    async def stop(self):
+        tasks = self._tasks + list(self._followers)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            await self.store.stop()
+
+    async def _rehydrate(self):
+        records = await asyncio.to_thread(self.store.load, self.history_limit)
+        for record in records:
+            try:
+                job = Job.from_record(record)
+            except Exception as e:
+                log_message(f"Skipping unreadable stored job {record.get('id')}: {e}", level='warning')
+                continue
+            if job.status in FINISHED_STATUSES:
+                self._track(job)
+            elif self.coordinator is None or await self.coordinator.call(self.coordinator.try_lease, f'job:{job.id}'):
+                await self._resume(job)
+
+    async def _resume(self, job: Job):
+        self._track(job)
+        if job.key is not None:
+            self.in_flight[job.key] = job
+            if self.coordinator is not None:
+                await self.coordinator.call(self.coordinator.lead, f'request:{job.key}', {'job_id': job.id})
+        self.resumed_total += 1
+        log_message(f"Resuming job {job.id} from checkpoint {job.checkpoint}")
+        self._enqueue(job)
+        self.store.save(job.to_record())
+
+    async def _adopt_orphans(self):
+        """Take over unfinished jobs whose owner stopped renewing their lease."""
+        while True:
+            await asyncio.sleep(self.coordinator.heartbeat_interval)
+            try:
+                records = await asyncio.to_thread(self.store.load_unfinished)
+                for record in records:
+                    if record['id'] in self.jobs or not await self.coordinator.call(self.coordinator.try_lease,
+                                                                                    f"job:{record['id']}"):
+                        continue
+                    self.adopted_total += 1
+                    await self._resume(Job.from_record(record))
+            except Exception as e:
+                log_message(f"Adopting orphaned jobs failed: {e}", level='error')
+
+    def _track(self, job: Job):
+        self.jobs[job.id] = job
+        if self.store is not None:
+            job.on_change = self._persist
+
+    def _enqueue(self, job: Job):
+        self.queue.put_nowait((job.priority, next(self._seq), job))
+
+    def _persist(self, job: Job):
+        self.store.save(job.to_record())
+
+    async def submit(self, request: ScriptRequest, priority: int = DEFAULT_PRIORITY) -> Job:
+        if self.queue is None:
+            raise RuntimeError('JobManager.start() has not been called')
+        key = self.key_func(request) if self.key_func else None
+        if key is not None and key not in self.in_flight and self.coordinator is not None \
+                and self.store is not None:
+            async with self._leading:
+                if key not in self.in_flight:
+                    return await self._lead_or_follow(key, request, priority)
+        if key is not None:
+            existing = self.in_flight.get(key)
+            if existing is not None:
+                existing.coalesced_requests += 1
+                self.coalesced_total += 1
+                new_priority = request.priority if request.priority is not None else priority
+                if new_priority < existing.priority and self._runs_here(existing):
+                    # An interactive request must not wait behind the batch it attached to
+                    existing.priority = new_priority
+                    if existing.status != 'running':
+                        self._enqueue(existing)
+                existing._changed()
+                log_message(f"Coalesced request into in-flight job {existing.id} "
+                            f"({existing.coalesced_requests} attached)")
+                return existing
+        job = Job(request, priority)
+        job.key = key
+        await self._start(job)
+        return job
+
+    async def _lead_or_follow(self, key: str, request: ScriptRequest, priority: int) -> Job:
+        """Start the job for `key`, unless another worker leads the key: then follow that worker's job."""
+        job = Job(request, priority)
+        job.key = key
+        leader = await self.coordinator.call(self.coordinator.lead, f'request:{key}', {'job_id': job.id})
+        if leader is None or not leader.get('job_id'):
+            await self._start(job)
+            return job
+        job.id = leader['job_id']
+        self.in_flight[key] = job
+        self.coalesced_total += 1
+        self._follow(job)
+        log_message(f"Coalesced request into job {job.id} of another worker")
+        return job
+
+    async def _start(self, job: Job):
+        if job.key is not None:
+            self.in_flight[job.key] = job
+        self._track(job)
+        self._prune()
+        if self.coordinator is not None:
+            await self.coordinator.call(self.coordinator.try_lease, f'job:{job.id}')
+        self._enqueue(job)
+        job._changed()
+
+    def _runs_here(self, job: Job) -> bool:
+        return self.jobs.get(job.id) is job
+
+    def _follow(self, job: Job):
+        task = asyncio.create_task(self._run_follower(job))
+        self._followers.add(task)
+        task.add_done_callback(self._followers.discard)
+
+    async def _run_follower(self, job: Job):
+        """
+        Mirror a job that another worker runs from the store until it finishes. If that worker died
+        before the job was ever saved, nobody can adopt it, so this worker takes the key and runs it.
+        """
+        try:
+            while not job.done.is_set():
+                await asyncio.sleep(FOLLOW_INTERVAL)
+                record = await asyncio.to_thread(self.store.get, job.id)
+                if record is not None:
+                    job.mirror(record)
+                elif await self.coordinator.call(self.coordinator.lead, f'request:{job.key}',
+                                                 {'job_id': job.id}) is None:
+                    log_message(f"Job {job.id} was lost with its worker, running it here", level='warning')
+                    await self._start(job)
+                    return
+        finally:
+            if self.in_flight.get(job.key) is job and not self._runs_here(job):
+                del self.in_flight[job.key]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> Optional[Job]:
+        """Like `get`, but also finds jobs held by other worker processes through the store."""
+        job = self.jobs.get(job_id)
+        if job is not None or self.coordinator is None:
+            return job
+        record = await asyncio.to_thread(self.store.get, job_id)
+        return Job.from_record(record, resume=False) if record else None
+
+    def list(self) -> List[Job]:
+        return list(self.jobs.values())
+
+    def counts(self) -> Dict[str, int]:
+        queued = sum(1 for job in self.jobs.values() if job.status == 'queued')
+        running = sum(1 for job in self.jobs.values() if job.status == 'running')
+        return {'queued': queued, 'running': running, 'workers': self.workers,
+                'coalesced_total': self.coalesced_total}
+
+    def _prune(self):
+        # Drop the oldest finished jobs once the registry grows past the limit
+        excess = len(self.jobs) - self.history_limit
+        if excess <= 0:
+            return
+        for job_id in [jid for jid, job in self.jobs.items() if job.status in FINISHED_STATUSES][:excess]:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            priority, _, job = await self.queue.get()
+            if priority != job.priority or job.status == 'running' or job.status in FINISHED_STATUSES:
+                # Entry left behind when the job was re-queued at a higher priority
+                self.queue.task_done()
+                continue
+            job.status = 'running'
+            job._changed()
+            # Everything the runner starts (tasks, threads) inherits these
+            request_id_var.set(job.request_id)
+            http_calls_var.set(job.http_calls)
+            priority_var.set(job.priority)
+            try:
+                if job.checkpoint:
+                    result = await self.runner(job.request, job.advance, resume=dict(job.checkpoint))
+                else:
+                    result = await self.runner(job.request, job.advance)
+                job.finish(result=result)
+            except asyncio.CancelledError:
+                if self.store is None:
+                    job.finish(error='Job cancelled during shutdown')
+                # With a store the job stays unfinished and is resumed after the restart
+                raise
+            except Exception as e:
+                log_message(f"Job {job.id} failed: {e}", level='error')
+                job.error_status = 429 if isinstance(e, RateLimited) else getattr(e, 'status_code', 500)
+                job.finish(error=str(getattr(e, 'detail', e)))
+            finally:
+                if self.coordinator is not None and job.status in FINISHED_STATUSES:
+                    # The final snapshot must be on disk before another worker could adopt or follow the job
+                    await asyncio.to_thread(self.store.flush)
+                    await self.coordinator.call(self.coordinator.release, f'job:{job.id}')
+                    if job.key is not None and self.in_flight.get(job.key) is job:
+                        await self.coordinator.call(self.coordinator.resign, f'request:{job.key}')
+                if job.key is not None and self.in_flight.get(job.key) is job:
+                    del self.in_flight[job.key]
+                self.queue.task_done()
@@ -1,47 +1,33 @@
+import asyncio
 import os
-import time
-import requests
 import json
-from dotenv import load_dotenv
+from env import load_env
+from http_client import close_clients
+from pipeline import create_task, wait_for_completion, download_file, navigation_steps, session_pool
+from session_pool import needs_login
+from task_output import extract_task_output
 
-def create_task(instructions: str, api_key: str):
-    url = 'https://api.browser-use.com/api/v1/run-task'
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
-    response = requests.post(url, headers=headers, json={'task': instructions})
-    if response.status_code != 200:
-        print("Status code:", response.status_code)
-        print("Response text:", response.text)
-    response.raise_for_status()
-    return response.json()['id']
-
-def get_task_details(task_id: str, api_key: str):
-    url = f'https://api.browser-use.com/api/v1/task/{task_id}'
-    headers = {'Authorization': f'Bearer {api_key}'}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
-
-def wait_for_completion(task_id: str, api_key: str, poll_interval: int = 3):
-    while True:
-        details = get_task_details(task_id, api_key)
-        status = details['status']
-        print(f"Task status: {status}")
-        if status in ['finished', 'failed', 'stopped']:
-            return details
-        time.sleep(poll_interval)
-
-def download_file(url, save_path):
-    response = requests.get(url)
-    response.raise_for_status()
-    with open(save_path, 'wb') as f:
-        f.write(response.content)
-    print(f"Downloaded file to {save_path}")
+async def run_task(script, voice_id, api_key, elevenlabs_email, elevenlabs_password, session=None):
+    instructions = (
+        navigation_steps(voice_id, elevenlabs_email, elevenlabs_password, session) +
+        f"paste the following script into the input: \"{script}\", "
+        "click the 'Enhance (alpha)' button, "
+        "wait for the enhanced script to appear, "
+        "click the 'Generate speech' button, "
+        "wait for the audio to be generated, "
+        "then click the download button for the generated audio file, download it, and return it as an output file. If you cannot download, return the direct download link to the audio file, and also return the enhanced script."
+    )
+    options = {'browser_profile_id': session.profile_id, 'save_browser_data': True} if session else {}
+    print("Creating task...")
+    task_id = await create_task(instructions, api_key, **options)
+    print(f"Task created with ID: {task_id}")
+    print("Waiting for task completion...")
+    details = await wait_for_completion(task_id, api_key, timeout_minutes=60)
+    print("Task completed!")
+    return details
 
-def main():
-    load_dotenv()
+async def main():
+    load_env()
     api_key = os.getenv('BROWSER_USE_API_KEY')
     elevenlabs_email = os.getenv('ELEVENLABS_EMAIL')
     elevenlabs_password = os.getenv('ELEVENLABS_PASSWORD')
@@ -55,62 +41,31 @@ def main():
 
     script = input("Enter the script you want to enhance and convert to speech:\n")
 
-    instructions = (
-        f"Go to https://elevenlabs.io/app/speech-synthesis/text-to-speech, "
-        f"if redirected to login or signup, log in using email: {elevenlabs_email} and password: {elevenlabs_password}, "
-        f"after successful login, go to the text-to-speech section, "
-        f"select the voice with id '{voice_id}', "
-        f"paste the following script into the input: \"{script}\", "
-        "click the 'Enhance (alpha)' button, "
-        "wait for the enhanced script to appear, "
-        "click the 'Generate speech' button, "
-        "wait for the audio to be generated, "
-        "then click the download button for the generated audio file, download it, and return it as an output file. If you cannot download, return the direct download link to the audio file, and also return the enhanced script."
-    )
-    print("Creating task...")
-    task_id = create_task(instructions, api_key)
-    print(f"Task created with ID: {task_id}")
-    print("Waiting for task completion...")
-    details = wait_for_completion(task_id, api_key)
-    print("Task completed!")
+    if session_pool.enabled:
+        # Reuse a logged-in browser profile; log it in again only if it expired
+        async with session_pool.session(voice_id) as session:
+            details = await run_task(script, voice_id, api_key, elevenlabs_email, elevenlabs_password, session)
+            if needs_login(details):
+                await session_pool.login(session, api_key, elevenlabs_email, elevenlabs_password)
+                details = await run_task(script, voice_id, api_key, elevenlabs_email, elevenlabs_password, session)
+    else:
+        details = await run_task(script, voice_id, api_key, elevenlabs_email, elevenlabs_password)
     # Try to download the mp3 if present
-    output_files = details.get('output_files', [])
+    task_output = extract_task_output(details)
     os.makedirs('uploads', exist_ok=True)
-    found_mp3 = False
-    for file_info in output_files:
-        # If file_info is a dict (with 'name' and 'url')
-        if isinstance(file_info, dict):
-            name = file_info.get('name', '')
-            url = file_info.get('url', '')
-        # If file_info is a string (assume it's a URL)
-        elif isinstance(file_info, str):
-            name = os.path.basename(file_info)
-            url = file_info
-        else:
-            continue
-        # Only download if url looks like a valid http(s) link
-        if (name.endswith('.mp3') or url.endswith('.mp3')) and url.startswith('http'):
-            save_path = os.path.join('uploads', name)
-            download_file(url, save_path)
-            found_mp3 = True
-    if not found_mp3:
+    mp3_files = task_output.media_files(('.mp3',))
+    for name, url in mp3_files:
+        save_path = os.path.join('uploads', name)
+        await download_file(url, save_path)
+    if not mp3_files:
         # Try to extract a direct audio link from output or steps
-        output_text = details.get('output', '')
-        steps = details.get('steps', [])
-        import re
-        url_pattern = r'https?://[\w./\-_%]+\.mp3(\?[^\s"]*)?'
-        match = re.search(url_pattern, output_text)
-        if not match:
-            for step in steps:
-                step_output = step.get('output', '')
-                match = re.search(url_pattern, step_output)
-                if match:
-                    break
-        if match:
-            print(f"Direct audio file link: {match.group(0)}")
+        direct_link = task_output.first_media_url(('.mp3',))
+        if direct_link:
+            print(f"Direct audio file link: {direct_link}")
         else:
             print("No downloadable mp3 file found. Please check the output for more details.")
     print(json.dumps(details, indent=2))
+    await close_clients()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+In-process metrics with Prometheus text exposition, request-scoped context and JSON logs.
+
+Metrics are plain counters and histograms keyed by label values; `render_metrics()` produces the
+text format served on GET /metrics. The current request id and the per-request count of outbound
+HTTP calls live in context variables, so they follow a request into every task and worker thread
+it starts (asyncio.create_task and asyncio.to_thread copy the context).
+"""
+import json
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+# Mutable per-request {service: calls}; shared by every task spawned while handling the request
+http_calls_var: ContextVar[Optional[Dict[str, int]]] = ContextVar('http_calls', default=None)
+
+_registry: List['_Metric'] = []
+_gauge_callbacks: List[Tuple[str, str, Callable[[], Optional[float]]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> ([count per bucket], sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def register_gauge(name: str, help_text: str, func: Callable[[], Optional[float]]):
+    """A gauge read from `func` at scrape time; None values are skipped."""
+    _gauge_callbacks[:] = [entry for entry in _gauge_callbacks if entry[0] != name]
+    _gauge_callbacks.append((name, help_text, func))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render())
+    for name, help_text, func in _gauge_callbacks:
+        try:
+            value = func()
+        except Exception:
+            value = None
+        if value is None:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram('tts_stage_duration_seconds', 'Time spent in each pipeline stage.', ['stage'])
+JOB_SECONDS = Histogram('tts_job_duration_seconds', 'End-to-end job duration, queue wait included.', ['status'])
+JOBS_TOTAL = Counter('tts_jobs_total', 'Finished jobs by outcome.', ['status'])
+JOB_HTTP_CALLS = Histogram('tts_job_external_calls', 'Outbound calls made by one job, per service.', ['service'],
+                           buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200))
+HTTP_CLIENT_REQUESTS = Counter('tts_http_client_requests_total', 'Outbound HTTP calls.',
+                               ['service', 'method', 'status'])
+HTTP_CLIENT_SECONDS = Histogram('tts_http_client_request_duration_seconds',
+                                'Outbound HTTP call latency up to the response headers.', ['service'])
+TTS_FIRST_BYTE_SECONDS = Histogram('tts_speech_first_byte_seconds',
+                                  'Time from a /tts/stream request to the first audio byte from ElevenLabs.')
+HTTP_REQUESTS = Counter('tts_http_requests_total', 'Inbound API requests.', ['method', 'route', 'status'])
+HTTP_REQUEST_SECONDS = Histogram('tts_http_request_duration_seconds', 'Inbound API request latency.', ['route'])
+
+
+def log_event(event: str, **fields):
+    """Emit one JSON log line tagged with the current request id."""
+    record = {'ts': round(time.time(), 3), 'event': event}
+    request_id = fields.pop('request_id', None) or request_id_var.get()
+    if request_id:
+        record['request_id'] = request_id
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+
+def log_message(message: str, level: str = 'info', **fields):
+    """A free-form log line in the same JSON format as `log_event`, so it carries the request id too."""
+    log_event('log', level=level, message=message, **fields)
+
+
+def count_external_call(service: str):
+    """Count one outbound call against the current request, if there is one."""
+    calls = http_calls_var.get()
+    if calls is not None:
+        calls[service] = calls.get(service, 0) + 1
@@ -0,0 +1,75 @@
+from pydantic import BaseModel
+from typing import Dict, Optional, List
+
+
+class ScriptRequest(BaseModel):
+    script: str
+    voice_id: Optional[str] = None
+    use_cache: bool = True
+    chunked: bool = False
+    max_chunk_chars: Optional[int] = None
+    # Lower runs first; defaults to 0 for single requests and BATCH_PRIORITY for batch items
+    priority: Optional[int] = None
+
+
+class BatchRequest(BaseModel):
+    items: List[ScriptRequest]
+    # Applied to items that do not set their own priority
+    priority: Optional[int] = None
+
+
+class SpeechRequest(BaseModel):
+    # Fast path: plain text-to-speech, no browser and no "Enhance (alpha)" step
+    script: str
+    voice_id: Optional[str] = None
+    model_id: Optional[str] = None
+    use_cache: bool = True
+
+
+class ScriptResponse(BaseModel):
+    enhanced_script: Optional[str] = None
+    audio_url: Optional[str] = None
+    audio_file_path: Optional[str] = None
+    audio_id: Optional[str] = None
+    latest_history_item_id: Optional[str] = None
+    browser_use_download_url: Optional[str] = None
+    agent_ui_download_url: Optional[str] = None
+    agent_ui_download_button_headers: Optional[list[dict[str, str]]] = None
+    elevenlabs_downloaded_audio_path: Optional[str] = None
+    s3_audio_url: Optional[str] = None
+    chunk_task_ids: Optional[List[str]] = None
+    chunk_history_item_ids: Optional[List[str]] = None
+    task_id: str
+    status: str
+    message: str
+
+
+class StageProgress(BaseModel):
+    stage: str
+    started_at: float
+    finished_at: Optional[float] = None
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    stage: str
+    stages: List[StageProgress] = []
+    task_id: Optional[str] = None
+    created_at: float
+    updated_at: float
+    result: Optional[ScriptResponse] = None
+    error: Optional[str] = None
+    coalesced_requests: int = 0
+    priority: int = 0
+    request_id: Optional[str] = None
+    # Outbound calls made by the job, per service (browser_use, elevenlabs, s3, ...)
+    http_calls: Dict[str, int] = {}
+
+
+class JobListResponse(BaseModel):
+    jobs: List[JobStatus]
+    queued: int
+    running: int
+    workers: int
+    coalesced_total: int = 0
@@ -0,0 +1,205 @@
+"""
+Frame-level MP3 concatenation without re-encoding.
+
+Each input is parsed into MPEG audio frames; ID3v2/ID3v1 tags and per-file Xing/Info/VBRI
+header frames are dropped, the frames are appended in order, and a fresh Xing/Info frame with
+the combined frame and byte counts is written at the front so players report the right duration.
+"""
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Bitrates in kbps indexed by [version_key][layer][bitrate_index]
+_BITRATES = {
+    1: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    2: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+_LAYERS = {1: 3, 2: 2, 3: 1}
+
+
+class FrameHeader(NamedTuple):
+    version: float
+    layer: int
+    bitrate: int
+    sample_rate: int
+    padding: int
+    channel_mode: int
+    protected: bool
+    length: int
+    samples: int
+    raw: bytes
+
+    @property
+    def side_info_size(self) -> int:
+        mono = self.channel_mode == 3
+        if self.version == 1:
+            return 17 if mono else 32
+        return 9 if mono else 17
+
+
+def parse_frame_header(header: bytes) -> Optional[FrameHeader]:
+    """Decode a 4-byte MPEG audio frame header, or return None if it is not a valid one."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = _VERSIONS.get((header[1] >> 3) & 0x03)
+    layer = _LAYERS.get((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _BITRATES[1 if version == 1 else 2][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if (layer == 3 and version != 1) else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+    return FrameHeader(
+        version=version, layer=layer, bitrate=bitrate, sample_rate=sample_rate, padding=padding,
+        channel_mode=header[3] >> 6, protected=not (header[1] & 0x01), length=length,
+        samples=samples, raw=bytes(header[:4]),
+    )
+
+
+def id3v2_size(data: bytes) -> int:
+    """Total size of a leading ID3v2 tag (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_vbr_header_frame(frame: bytes, header: FrameHeader) -> bool:
+    """True for Xing/Info/VBRI frames, which describe the file rather than carry audio."""
+    offset = 4 + (2 if header.protected else 0) + header.side_info_size
+    if frame[offset:offset + 4] in (b'Xing', b'Info'):
+        return True
+    return frame[36:40] == b'VBRI'
+
+
+def iter_frames(data: bytes) -> Iterator[Tuple[FrameHeader, bytes]]:
+    """Yield (header, frame bytes) for every audio frame, skipping tags and junk between frames."""
+    pos = id3v2_size(data)
+    end = len(data)
+    if end - pos >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+    while pos + 4 <= end:
+        header = parse_frame_header(data[pos:pos + 4])
+        if header is None or header.length < 4 or pos + header.length > end:
+            # Resynchronise on the next byte that could start a frame
+            pos = data.find(b'\xff', pos + 1, end)
+            if pos < 0:
+                return
+            continue
+        next_pos = pos + header.length
+        if next_pos + 4 <= end and parse_frame_header(data[next_pos:next_pos + 4]) is None \
+                and data[next_pos:next_pos + 3] not in (b'TAG', b'ID3'):
+            # A real frame is followed by another frame; this was a false sync
+            pos = data.find(b'\xff', pos + 1, end)
+            if pos < 0:
+                return
+            continue
+        yield header, data[pos:next_pos]
+        pos = next_pos
+
+
+def _vbr_header_frame(template: FrameHeader, frame_count: int, byte_count: int, is_vbr: bool) -> bytes:
+    # Reuse the first audio frame's header without CRC or padding so the length is predictable
+    raw = bytearray(template.raw)
+    raw[1] |= 0x01
+    raw[2] &= ~0x02 & 0xFF
+    header = parse_frame_header(bytes(raw))
+    offset = 4 + header.side_info_size
+    frame = bytearray(header.length)
+    frame[:4] = raw
+    frame[offset:offset + 4] = b'Xing' if is_vbr else b'Info'
+    # Flags: frame count and byte count present
+    frame[offset + 4:offset + 16] = struct.pack('>III', 0x03, frame_count, byte_count)
+    return bytes(frame)
+
+
+def audio_duration(data: bytes) -> float:
+    """Duration in seconds computed from the frames themselves."""
+    duration = 0.0
+    for header, frame in iter_frames(data):
+        if duration == 0.0 and is_vbr_header_frame(frame, header):
+            continue
+        duration += header.samples / header.sample_rate
+    return duration
+
+
+def concat_mp3(inputs: Iterable[bytes], out: BinaryIO, keep_id3: bool = True) -> float:
+    """
+    Append the audio frames of `inputs` to the seekable `out` and return the total duration.
+    The first input's ID3v2 tag is kept when `keep_id3` is set; all other tags are dropped.
+    Inputs must share sample rate and channel mode, which is true for chunks of one voice.
+    """
+    vbr_header_pos = None
+    template = None
+    frame_count = 0
+    byte_count = 0
+    bitrates = set()
+    duration = 0.0
+    for index, data in enumerate(inputs):
+        if index == 0 and keep_id3:
+            out.write(data[:id3v2_size(data)])
+        for header, frame in iter_frames(data):
+            if is_vbr_header_frame(frame, header):
+                continue
+            if template is None:
+                template = header
+                vbr_header_pos = out.tell()
+                # Placeholder, rewritten once the counts are known
+                out.write(_vbr_header_frame(template, 0, 0, False))
+            elif (header.sample_rate, header.channel_mode == 3) != (template.sample_rate, template.channel_mode == 3):
+                raise ValueError('Cannot concatenate MP3 streams with different sample rates or channel layouts')
+            out.write(frame)
+            frame_count += 1
+            byte_count += len(frame)
+            bitrates.add(header.bitrate)
+            duration += header.samples / header.sample_rate
+    if template is None:
+        raise ValueError('No MPEG audio frames found in the inputs')
+    end = out.tell()
+    out.seek(vbr_header_pos)
+    # The byte count covers the Xing frame itself plus every audio frame
+    vbr_frame_length = end - vbr_header_pos - byte_count
+    out.write(_vbr_header_frame(template, frame_count, byte_count + vbr_frame_length, len(bitrates) > 1))
+    out.seek(end)
+    return duration
+
+
+def _read_files(paths: List[str]) -> Iterator[bytes]:
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield f.read()
+
+
+def concat_mp3_files(paths: List[str], out_path: str) -> float:
+    """File-based wrapper around concat_mp3 that holds only one input in memory at a time."""
+    tmp_path = f"{out_path}.part"
+    try:
+        with open(tmp_path, 'wb') as out:
+            duration = concat_mp3(_read_files(paths), out)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return duration
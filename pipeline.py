@@ -0,0 +1,688 @@
+import asyncio
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Set, Tuple
+from fastapi import HTTPException
+from env import load_env
+from elevenlabs_tts import open_tts_stream, TTS_MODEL_ID
+from elevenlabs_download import iter_elevenlabs_history_audio, AUDIO_CHUNK_SIZE
+from http_client import client_for, BROWSER_USE_BASE_URL
+from models import ScriptRequest, ScriptResponse, SpeechRequest
+from metrics import TTS_FIRST_BYTE_SECONDS, log_message
+from s3_storage import upload_file_to_s3, upload_stream_to_s3, s3_uploader, S3MultipartWriter
+from result_cache import ResultCache, CachedResult, cache_key
+from task_poller import TaskPoller
+from rate_limits import limiter_for
+from session_pool import SessionPool, BrowserSession, LOGIN_REQUIRED, TTS_URL, needs_login
+from history_watcher import get_history_watcher
+from coordination import coordinator
+from history_index import HistoryIndex
+from mp3_concat import concat_mp3_files
+from script_chunking import split_script
+from task_output import TaskOutput, extract_task_output
+from uploads_cache import UploadsCache
+
+load_env()
+
+# The pipeline streams audio straight to S3; set KEEP_LOCAL_AUDIO to also keep a copy in the uploads cache
+KEEP_LOCAL_AUDIO = os.getenv('KEEP_LOCAL_AUDIO', '').lower() in ('1', 'true', 'yes')
+
+# Long-script mode: chunk size, parallel browser-use tasks and retries per chunk
+MAX_CHUNK_CHARS = int(os.getenv('MAX_CHUNK_CHARS', '2500'))
+CHUNK_CONCURRENCY = int(os.getenv('CHUNK_CONCURRENCY', '3'))
+CHUNK_RETRIES = int(os.getenv('CHUNK_RETRIES', '2'))
+
+result_cache = ResultCache()
+history_index = HistoryIndex()
+uploads_cache = UploadsCache()
+
+
+async def create_task(instructions: str, api_key: str, **options):
+    # `options` are extra run-task fields, e.g. browser_profile_id and save_browser_data
+    url = f'{BROWSER_USE_BASE_URL}/api/v1/run-task'
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+    response = await client_for(url).post(url, headers=headers, json={'task': instructions, **options})
+    if response.status_code != 200:
+        log_message(f"browser-use run-task answered {response.status_code}: {response.text}", level='error')
+    response.raise_for_status()
+    return response.json()['id']
+
+async def get_task_details(task_id: str, api_key: str):
+    url = f'{BROWSER_USE_BASE_URL}/api/v1/task/{task_id}'
+    headers = {'Authorization': f'Bearer {api_key}'}
+    response = await client_for(url).get(url, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+async def wait_for_completion(task_id: str, api_key: str, timeout_minutes: int = 10, on_status=None,
+                              poll_now: bool = False):
+    # All in-flight tasks share one adaptive poller instead of a fixed 3s loop each
+    return await task_poller.wait(task_id, api_key, timeout=timeout_minutes * 60, on_status=on_status,
+                                  poll_now=poll_now)
+
+async def download_file(url, save_path, chunk_size: int = AUDIO_CHUNK_SIZE):
+    async with client_for(url).stream('GET', url) as response:
+        response.raise_for_status()
+        with open(save_path, 'wb') as f:
+            async for chunk in response.aiter_bytes(chunk_size):
+                f.write(chunk)
+    log_message(f"Downloaded file to {save_path}")
+
+
+task_poller = TaskPoller(get_task_details, on_rate_limited=limiter_for('browser_use').pause)
+
+
+async def run_browser_task(instructions: str, api_key: str, **options) -> dict:
+    limiter = limiter_for('browser_use')
+    async with limiter.slot():
+        task_id = await limiter.call(lambda: create_task(instructions, api_key, **options))
+        return await wait_for_completion(task_id, api_key)
+
+
+session_pool = SessionPool(run_browser_task)
+
+
+def warm_up():
+    """
+    Blocking set-up that the first real request would otherwise pay for: open the SQLite stores
+    and, when S3 is configured, import boto3 and build the client. Safe to run in a thread.
+    """
+    for store in (result_cache, history_index, uploads_cache):
+        store._db()
+    if os.getenv('S3_BUCKET_NAME'):
+        s3_uploader.client
+        s3_uploader.transfer_config
+
+
+def _noop_advance(stage: str, **info):
+    pass
+
+
+def _get_history_watcher(api_key: str):
+    watcher = get_history_watcher(api_key)
+    if history_index.upsert not in watcher.listeners:
+        # Everything the watcher sees is mirrored into the local index for free
+        watcher.add_listener(history_index.upsert)
+        if coordinator.enabled:
+            # ... which is also how workers that do not hold the polling lease see new items
+            watcher.feed = history_index.recent
+    return watcher
+
+
+def request_key(request: ScriptRequest) -> str:
+    """Key identifying identical work: the normalized script plus the voice that will be used."""
+    return cache_key(request.script, request.voice_id or os.getenv('VOICE_ID'))
+
+
+def job_key(request: ScriptRequest) -> str:
+    """
+    Key for coalescing in-flight jobs: `request_key` plus every option that changes what the job
+    produces, so a chunked or uncached request never attaches to a job that runs differently.
+    """
+    key = request_key(request)
+    if request.chunked:
+        key += f":chunked:{request.max_chunk_chars or MAX_CHUNK_CHARS}"
+    if not request.use_cache:
+        key += ':uncached'
+    return key
+
+
+async def _cached_response(cached: CachedResult) -> ScriptResponse:
+    s3_audio_url = await asyncio.to_thread(s3_uploader.presign, cached.s3_bucket, cached.s3_key)
+    return ScriptResponse(
+        enhanced_script=cached.enhanced_script,
+        audio_id=cached.audio_id,
+        latest_history_item_id=cached.latest_history_item_id,
+        s3_audio_url=s3_audio_url,
+        task_id=cached.task_id or '',
+        status='finished',
+        message="Served from result cache."
+    )
+
+
+def navigation_steps(voice_id: Optional[str], elevenlabs_email: str, elevenlabs_password: str,
+                     session: Optional[BrowserSession] = None) -> str:
+    """
+    Opening steps of a task: reach the text-to-speech page with the right voice selected.
+    A pooled session is already logged in, so the agent is told to stop instead of logging in,
+    and the voice is only selected when the session does not have it selected already.
+    """
+    if voice_id and (session is None or session.voice_id != voice_id):
+        voice_selection = f"first, click on the voice dropdown and select the voice with ID '{voice_id}', wait for the voice to be selected, then "
+    else:
+        voice_selection = ""
+
+    if session is not None:
+        return (
+            f"Go to {TTS_URL}, "
+            f"if redirected to login or signup, stop immediately and reply with exactly {LOGIN_REQUIRED}, "
+            f"{voice_selection}"
+        )
+    return (
+        f"Go to {TTS_URL}, "
+        f"if redirected to login or signup, log in using email: {elevenlabs_email} and password: {elevenlabs_password}, "
+        f"after successful login, go to the text-to-speech section, "
+        f"{voice_selection}"
+    )
+
+
+def build_instructions(script: str, voice_id: Optional[str], elevenlabs_email: str, elevenlabs_password: str,
+                       session: Optional[BrowserSession] = None) -> str:
+    return (
+        navigation_steps(voice_id, elevenlabs_email, elevenlabs_password, session) +
+        f"paste the following script EXACTLY as provided into the text input area (do not modify, shorten, or change the script in any way): \"{script}\", "
+        "click the 'Enhance (alpha)' button, "
+        "wait for the enhanced script to appear in the text area, "
+        "verify that the enhanced script contains the full original content, "
+        "click the 'Generate speech' button, "
+        "wait for the audio to be generated, "
+        "do not download or fetch the audio file yet."
+    )
+
+
+def read_task_output(details: dict, script: str) -> TaskOutput:
+    output = extract_task_output(details, script)
+    if output.enhanced_source == 'fallback':
+        log_message("No enhanced script found in output")
+    else:
+        log_message(f"Found enhanced script in {output.enhanced_source}: {len(output.enhanced_script)} characters")
+    if output.audio_id:
+        log_message(f"Found audio_id: {output.audio_id}")
+    return output
+
+
+async def _run_generation_task(instructions: str, api_key: str, advance, **options) -> Tuple[str, dict]:
+    # A concurrency slot is held while the task runs; run-task calls are rate limited and retried on 429
+    limiter = limiter_for('browser_use')
+    advance('admission')
+    async with limiter.slot():
+        advance('creating_task')
+        log_message("Creating task 1 (audio generation)...")
+        task_created_at = time.time()
+        task_id = await limiter.call(lambda: create_task(instructions, api_key, **options))
+        log_message(f"Task 1 created with ID: {task_id}")
+        # Queue wait at browser-use ends when a poll first reports the task running
+        advance('task_queued', task_id=task_id, task_created_at=task_created_at)
+        started = False
+
+        def on_status(status: str):
+            nonlocal started
+            if status not in ('created', 'queued') and not started:
+                started = True
+                advance('running_task')
+
+        log_message("Waiting for task 1 completion...")
+        details = await wait_for_completion(task_id, api_key, timeout_minutes=20, on_status=on_status)
+        log_message("Task 1 completed!")
+    return task_id, details
+
+
+async def _run_in_session(script: str, voice_id: Optional[str], api_key: str, elevenlabs_email: str,
+                          elevenlabs_password: str, advance) -> Tuple[str, dict]:
+    """Run the generation task in a pooled, logged-in browser profile, logging it in again if it expired."""
+    advance('leasing_session')
+    async with session_pool.session(voice_id) as session:
+        options = {'browser_profile_id': session.profile_id, 'save_browser_data': True}
+        instructions = build_instructions(script, voice_id, elevenlabs_email, elevenlabs_password, session)
+        task_id, details = await _run_generation_task(instructions, api_key, advance, **options)
+        if needs_login(details):
+            log_message(f"Browser profile {session.profile_id} is logged out, logging in again", level='warning')
+            advance('logging_in')
+            await session_pool.login(session, api_key, elevenlabs_email, elevenlabs_password)
+            instructions = build_instructions(script, voice_id, elevenlabs_email, elevenlabs_password, session)
+            task_id, details = await _run_generation_task(instructions, api_key, advance, **options)
+        if details.get('status') == 'finished' and not needs_login(details):
+            await session_pool.mark_ok(session, voice_id)
+    return task_id, details
+
+
+async def _resume_generation(script: str, voice_id: Optional[str], api_key: str, resume: dict,
+                             advance) -> Tuple[str, dict, Optional[str]]:
+    """Pick up a task created before a restart: collect its details and find its history item."""
+    task_id = resume['task_id']
+    advance('running_task', task_id=task_id)
+    log_message(f"Resuming task {task_id}")
+    details = await wait_for_completion(task_id, api_key, timeout_minutes=20, poll_now=True)
+
+    advance('resolving_history')
+    history_item_id = resume.get('history_item_id')
+    elevenlabs_api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not history_item_id and elevenlabs_api_key:
+        watcher = _get_history_watcher(elevenlabs_api_key)
+        since = resume.get('task_created_at') or 0
+        # Items that appear from now on go to the waiter; the ones already there are searched directly
+        waiter = await watcher.expect(script, voice_id)
+        waiter.registered_at = since
+        try:
+            item = await watcher.find_recent(script, voice_id, since)
+        except BaseException:
+            await watcher.cancel(waiter)
+            raise
+        if item is not None:
+            await watcher.cancel(waiter)
+        else:
+            item = await watcher.wait(waiter, timeout=30)
+        if item:
+            history_item_id = item['history_item_id']
+            log_message(f"History item for resumed task {task_id}: {history_item_id}")
+    return task_id, details, history_item_id
+
+
+async def generate_audio(script: str, voice_id: Optional[str], api_key: str, elevenlabs_email: str,
+                         elevenlabs_password: str, advance=_noop_advance,
+                         resume: Optional[dict] = None) -> Tuple[str, dict, Optional[str]]:
+    """
+    Run one browser-use generation task for `script` and resolve the history item it produced.
+    Uses a pooled logged-in browser profile when BROWSER_USE_PROFILE_IDS is set.
+    With a `resume` checkpoint that has a task id, the existing task is collected instead.
+    Returns (task_id, task details, history_item_id or None).
+    """
+    if resume and resume.get('task_id'):
+        return await _resume_generation(script, voice_id, api_key, resume, advance)
+
+    # Register with the history watcher before the task runs, so its item is recognised as new
+    elevenlabs_api_key = os.getenv('ELEVENLABS_API_KEY')
+    history_watcher = _get_history_watcher(elevenlabs_api_key) if elevenlabs_api_key else None
+    history_waiter = None
+    if history_watcher is not None:
+        history_waiter = await history_watcher.expect(script, voice_id)
+    else:
+        log_message('ELEVENLABS_API_KEY is not set in the environment.')
+
+    try:
+        if session_pool.enabled:
+            task_id, details = await _run_in_session(script, voice_id, api_key, elevenlabs_email,
+                                                     elevenlabs_password, advance)
+        else:
+            instructions = build_instructions(script, voice_id, elevenlabs_email, elevenlabs_password)
+            task_id, details = await _run_generation_task(instructions, api_key, advance)
+    except BaseException:
+        if history_waiter is not None:
+            await history_watcher.cancel(history_waiter)
+        raise
+
+    advance('resolving_history')
+    history_item_id = None
+    if history_waiter is not None:
+        item = await history_watcher.wait(history_waiter, timeout=30)
+        if item:
+            history_item_id = item['history_item_id']
+            log_message(f"New history item found: {history_item_id}")
+        else:
+            log_message("No new history item matched this job.")
+    return task_id, details, history_item_id
+
+
+def _s3_key(filename: str) -> str:
+    s3_folder = os.getenv('S3_AUDIO_FOLDER', '')
+    return f"{s3_folder}{filename}" if s3_folder else filename
+
+
+async def run_enhancement(request: ScriptRequest, advance=_noop_advance, resume: Optional[dict] = None) -> ScriptResponse:
+    """
+    Run the full create -> poll -> history -> download -> S3 pipeline for one script.
+    HTTP calls go through the shared async client; blocking S3 calls run in a worker thread.
+    `advance(stage, **checkpoint)` is called as each stage starts, so callers can report progress
+    and persist what is needed to `resume` the job after a restart without creating a new task.
+    """
+    # Get environment variables
+    api_key = os.getenv('BROWSER_USE_API_KEY')
+    elevenlabs_email = os.getenv('ELEVENLABS_EMAIL')
+    elevenlabs_password = os.getenv('ELEVENLABS_PASSWORD')
+    env_voice_id = os.getenv('VOICE_ID')  # Get voice_id from environment as fallback
+
+    if not api_key:
+        raise HTTPException(status_code=500, detail="BROWSER_USE_API_KEY is not set in the environment.")
+    if not elevenlabs_email or not elevenlabs_password:
+        raise HTTPException(status_code=500, detail="ELEVENLABS_EMAIL and ELEVENLABS_PASSWORD must be set in the environment.")
+
+    # Use voice_id from request, or fallback to environment variable
+    voice_id_to_use = request.voice_id if request.voice_id else env_voice_id
+
+    # Debug: Print which voice ID is being used
+    log_message(f"Using voice ID: {voice_id_to_use}")
+    log_message(f"Script length: {len(request.script)} characters")
+
+    # Identical script + voice already generated: skip the browser-use task entirely
+    key = request_key(request)
+    if request.use_cache:
+        cached = await asyncio.to_thread(result_cache.get, key)
+        if cached is not None:
+            advance('cache_hit', task_id=cached.task_id)
+            log_message(f"Result cache hit for history item {cached.latest_history_item_id}")
+            return await _cached_response(cached)
+
+    max_chunk_chars = request.max_chunk_chars or MAX_CHUNK_CHARS
+    if request.chunked and len(request.script) > max_chunk_chars:
+        return await _run_chunked(request, key, voice_id_to_use, max_chunk_chars, api_key,
+                                  elevenlabs_email, elevenlabs_password, advance, resume)
+
+    task1_id, details, latest_history_item_id = await generate_audio(
+        request.script, voice_id_to_use, api_key, elevenlabs_email, elevenlabs_password, advance, resume
+    )
+    task_output = read_task_output(details, request.script)
+    enhanced_script = task_output.enhanced_script
+    audio_id = task_output.audio_id
+
+    # Stream the audio from ElevenLabs into S3, teeing into the uploads cache only when configured
+    advance('downloading', history_item_id=latest_history_item_id)
+    elevenlabs_downloaded_audio_path = None
+    s3_audio_url = None
+    if latest_history_item_id:
+        s3_bucket = os.getenv('S3_BUCKET_NAME')
+        audio_filename = f"{latest_history_item_id}.mp3"
+        s3_key = _s3_key(audio_filename)
+        keep_local = KEEP_LOCAL_AUDIO or not s3_bucket
+        try:
+            s3_exists = bool(s3_bucket) and await asyncio.to_thread(s3_uploader.exists, s3_bucket, s3_key)
+            cached_path = await asyncio.to_thread(uploads_cache.lookup, latest_history_item_id)
+            if cached_path:
+                log_message(f"Audio for history id {latest_history_item_id} is in the uploads cache, skipping download")
+                elevenlabs_downloaded_audio_path = cached_path
+                if s3_bucket:
+                    advance('uploading', s3_key=s3_key)
+                    s3_audio_url = await asyncio.to_thread(upload_file_to_s3, cached_path, s3_bucket, s3_key)
+            elif s3_exists and not keep_local:
+                log_message(f"Audio for history id {latest_history_item_id} is already in S3, skipping download")
+                s3_audio_url = await asyncio.to_thread(s3_uploader.presign, s3_bucket, s3_key)
+            else:
+                chunks = iter_elevenlabs_history_audio(latest_history_item_id)
+                if keep_local:
+                    chunks = uploads_cache.tee(latest_history_item_id, chunks)
+                if s3_bucket and not s3_exists:
+                    advance('uploading', s3_key=s3_key)
+                    s3_audio_url = await upload_stream_to_s3(chunks, s3_bucket, s3_key)
+                else:
+                    if not s3_bucket:
+                        log_message("S3_BUCKET_NAME is not set, keeping audio on local disk only.")
+                    async for _ in chunks:
+                        pass
+                    if s3_exists:
+                        s3_audio_url = await asyncio.to_thread(s3_uploader.presign, s3_bucket, s3_key)
+                local_path = uploads_cache.path_for(latest_history_item_id)
+                if keep_local and os.path.exists(local_path):
+                    elevenlabs_downloaded_audio_path = local_path
+                    log_message(f"Downloaded ElevenLabs audio to {local_path}")
+            if s3_audio_url:
+                log_message(f"S3 download link: {s3_audio_url}")
+                if elevenlabs_downloaded_audio_path:
+                    await asyncio.to_thread(uploads_cache.set_s3_key, latest_history_item_id, s3_key)
+        except Exception as e:
+            log_message(f"Failed to download ElevenLabs audio for history id {latest_history_item_id}: {e}",
+                        level='error')
+        if s3_audio_url or elevenlabs_downloaded_audio_path:
+            await asyncio.to_thread(
+                history_index.mark_stored,
+                latest_history_item_id,
+                downloaded_path=elevenlabs_downloaded_audio_path,
+                s3_key=s3_key if s3_audio_url else None,
+            )
+        if s3_audio_url:
+            await asyncio.to_thread(result_cache.put, key, CachedResult(
+                enhanced_script=enhanced_script,
+                latest_history_item_id=latest_history_item_id,
+                s3_bucket=s3_bucket,
+                s3_key=s3_key,
+                audio_id=audio_id,
+                task_id=task1_id,
+            ))
+
+    return ScriptResponse(
+        enhanced_script=enhanced_script,
+        audio_url=None,
+        audio_file_path=None,
+        audio_id=audio_id,
+        latest_history_item_id=latest_history_item_id,
+        browser_use_download_url=None,
+        agent_ui_download_url=None,
+        agent_ui_download_button_headers=None,
+        elevenlabs_downloaded_audio_path=elevenlabs_downloaded_audio_path,
+        s3_audio_url=s3_audio_url,
+        task_id=task1_id,
+        status=details.get('status', 'unknown'),
+        message="Audio generated and uploaded to S3."
+    )
+
+
+async def _chunk_audio(history_item_id: str) -> str:
+    """Local path of a chunk's audio: from the uploads cache, downloading it into the cache if needed."""
+    path = await asyncio.to_thread(uploads_cache.lookup, history_item_id)
+    if path is None:
+        async for _ in uploads_cache.tee(history_item_id, iter_elevenlabs_history_audio(history_item_id)):
+            pass
+        path = uploads_cache.path_for(history_item_id)
+    return path
+
+
+async def _generate_chunk(index: int, script: str, voice_id: Optional[str], state: dict, save,
+                          semaphore: asyncio.Semaphore, api_key: str, elevenlabs_email: str,
+                          elevenlabs_password: str) -> Tuple[str, str, str, str]:
+    """
+    Generate and download one chunk, retrying it on its own. Returns (task_id, enhanced script, history id, path).
+    `state` is the chunk's checkpoint (task id, history item, local path, enhanced script), written through `save()`
+    as it changes. A finished chunk is not generated again, and a task created before a restart is
+    collected instead of being created again.
+    """
+    if state.get('done'):
+        path = await _chunk_audio(state['history_item_id'])
+        return state['task_id'], state.get('enhanced_script'), state['history_item_id'], path
+
+    def advance(stage: str, task_id: Optional[str] = None, **info):
+        changed = {name: value for name, value in dict(info, task_id=task_id).items()
+                   if value is not None and state.get(name) != value}
+        if changed:
+            state.update(changed)
+            save()
+
+    async with semaphore:
+        for attempt in range(1, CHUNK_RETRIES + 2):
+            resume = dict(state) if state.get('task_id') else None
+            try:
+                task_id, details, history_item_id = await generate_audio(
+                    script, voice_id, api_key, elevenlabs_email, elevenlabs_password, advance, resume
+                )
+                if details.get('status') != 'finished':
+                    raise Exception(f"task {task_id} ended with status {details.get('status')}")
+                if not history_item_id:
+                    raise Exception(f"no history item found for task {task_id}")
+                path = await _chunk_audio(history_item_id)
+                enhanced_script = read_task_output(details, script).enhanced_script
+                state.update(done=True, task_id=task_id, history_item_id=history_item_id,
+                             enhanced_script=enhanced_script, path=path)
+                save()
+                log_message(f"Chunk {index} ready ({history_item_id})")
+                return task_id, enhanced_script, history_item_id, path
+            except Exception as e:
+                if attempt > CHUNK_RETRIES:
+                    raise Exception(f"Chunk {index} failed after {attempt} attempts: {e}")
+                log_message(f"Chunk {index} attempt {attempt} failed, retrying: {e}", level='warning')
+                # The next attempt starts a new task
+                state.clear()
+                save()
+
+
+async def _run_chunked(request: ScriptRequest, key: str, voice_id: Optional[str], max_chunk_chars: int, api_key: str,
+                       elevenlabs_email: str, elevenlabs_password: str, advance,
+                       resume: Optional[dict] = None) -> ScriptResponse:
+    """
+    Long-script mode: split at paragraph/sentence boundaries, generate the chunks concurrently
+    and join the MP3s frame by frame into one file. Every chunk is checkpointed under `chunks`,
+    so a job resumed after a restart only generates the chunks that were not finished.
+    """
+    chunks = split_script(request.script, max_chunk_chars)
+    log_message(f"Chunked mode: {len(chunks)} chunks of at most {max_chunk_chars} characters")
+    saved = (resume or {}).get('chunks') or []
+    states = [dict(saved[i]) if i < len(saved) and len(saved) == len(chunks) else {} for i in range(len(chunks))]
+    if any(state.get('done') for state in states):
+        log_message(f"Resuming chunked job: {sum(1 for state in states if state.get('done'))} of {len(chunks)} "
+                    f"chunks already generated")
+
+    def save():
+        # Same stage again: only the checkpoint is updated
+        advance('generating_chunks', chunks=[dict(state) for state in states])
+
+    save()
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    with tempfile.TemporaryDirectory() as work_dir:
+        tasks = [
+            asyncio.create_task(_generate_chunk(i, text, voice_id, states[i], save, semaphore, api_key,
+                                                elevenlabs_email, elevenlabs_password))
+            for i, text in enumerate(chunks)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        advance('concatenating')
+        audio_filename = f"chunked-{key[:20]}.mp3"
+        combined_path = os.path.join(work_dir, audio_filename)
+        duration = await asyncio.to_thread(concat_mp3_files, [r[3] for r in results], combined_path)
+        log_message(f"Joined {len(results)} chunks into {duration:.1f}s of audio")
+
+        advance('uploading')
+        s3_bucket = os.getenv('S3_BUCKET_NAME')
+        s3_key = _s3_key(audio_filename)
+        s3_audio_url = None
+        if s3_bucket:
+            s3_audio_url = await asyncio.to_thread(upload_file_to_s3, combined_path, s3_bucket, s3_key)
+            if s3_audio_url:
+                log_message(f"S3 download link: {s3_audio_url}")
+        elevenlabs_downloaded_audio_path = None
+        if KEEP_LOCAL_AUDIO or not s3_bucket:
+            elevenlabs_downloaded_audio_path = await asyncio.to_thread(
+                uploads_cache.add_file, audio_filename[:-4], combined_path, s3_key if s3_audio_url else None
+            )
+
+    task_ids = [r[0] for r in results]
+    history_item_ids = [r[2] for r in results]
+    enhanced_script = '\n\n'.join(r[1] for r in results if r[1])
+    if s3_audio_url:
+        await asyncio.to_thread(result_cache.put, key, CachedResult(
+            enhanced_script=enhanced_script,
+            latest_history_item_id=None,
+            s3_bucket=s3_bucket,
+            s3_key=s3_key,
+            task_id=task_ids[0],
+        ))
+    return ScriptResponse(
+        enhanced_script=enhanced_script,
+        elevenlabs_downloaded_audio_path=elevenlabs_downloaded_audio_path,
+        s3_audio_url=s3_audio_url,
+        chunk_task_ids=task_ids,
+        chunk_history_item_ids=history_item_ids,
+        task_id=task_ids[0],
+        status='finished',
+        message=f"Audio generated in {len(chunks)} chunks and uploaded to S3."
+    )
+
+
+@dataclass
+class SpeechSource:
+    """Where /tts/stream gets its audio: a cached file, a cached S3 object or a live stream."""
+    audio_id: str
+    path: Optional[str] = None
+    url: Optional[str] = None
+    chunks: Optional[AsyncIterator[bytes]] = None
+    history_item_id: Optional[str] = None
+
+
+# S3 uploads finishing after the client already got its last byte
+_background_uploads: Set[asyncio.Task] = set()
+
+
+async def _finish_speech_upload(writer: S3MultipartWriter, audio_id: str, key: str):
+    try:
+        await writer.complete()
+        s3_uploader.uploads += 1
+        await asyncio.to_thread(uploads_cache.set_s3_key, audio_id, writer.key)
+        await asyncio.to_thread(result_cache.put, key, CachedResult(
+            enhanced_script=None, latest_history_item_id=None, s3_bucket=writer.bucket, s3_key=writer.key,
+        ))
+        log_message(f"Uploaded speech {audio_id} to S3 as {writer.key}")
+    except Exception as e:
+        log_message(f"S3 upload of speech {audio_id} failed: {e}", level='error')
+        await writer.abort()
+
+
+async def _tee_speech(response, audio_id: str, key: str, started: float) -> AsyncIterator[bytes]:
+    """
+    Forward the ElevenLabs stream chunk by chunk as it arrives, while writing it to the uploads
+    cache and an S3 multipart upload. S3 trouble never interrupts the client's stream.
+    """
+    s3_bucket = os.getenv('S3_BUCKET_NAME')
+    writer = S3MultipartWriter(s3_bucket, _s3_key(f"{audio_id}.mp3")) if s3_bucket else None
+    # Created in the background so it does not delay the first byte
+    s3_start = asyncio.create_task(writer.start()) if writer else None
+    first = True
+    local = uploads_cache.tee(audio_id, response.aiter_bytes())
+    try:
+        async for chunk in local:
+            if first:
+                first = False
+                TTS_FIRST_BYTE_SECONDS.observe(time.perf_counter() - started)
+            yield chunk
+            if writer is not None:
+                try:
+                    await s3_start
+                    await writer.write(chunk)
+                except Exception as e:
+                    log_message(f"S3 upload of speech {audio_id} failed, continuing without it: {e}", level='warning')
+                    await writer.abort()
+                    writer = None
+        if writer is not None:
+            await s3_start
+            task = asyncio.create_task(_finish_speech_upload(writer, audio_id, key))
+            _background_uploads.add(task)
+            task.add_done_callback(_background_uploads.discard)
+            writer = None
+    finally:
+        # Drops the partial cache file if the stream did not complete
+        await local.aclose()
+        await response.aclose()
+        if writer is not None:
+            # Client went away or ElevenLabs failed mid-stream
+            if not s3_start.done():
+                s3_start.cancel()
+            await asyncio.gather(s3_start, return_exceptions=True)
+            await writer.abort()
+
+
+async def open_speech(request: SpeechRequest) -> SpeechSource:
+    """
+    Fast path: plain ElevenLabs streaming TTS for scripts that need no enhancement.
+    Identical text/voice/model requests are served from the uploads cache or S3; otherwise the
+    stream is opened (so errors surface before any byte is sent) and returned for forwarding.
+    """
+    started = time.perf_counter()
+    if not os.getenv('ELEVENLABS_API_KEY'):
+        raise HTTPException(status_code=500, detail="ELEVENLABS_API_KEY is not set in the environment.")
+    voice_id = request.voice_id or os.getenv('VOICE_ID')
+    if not voice_id:
+        raise HTTPException(status_code=400, detail="voice_id is required (or set VOICE_ID in the environment).")
+    model_id = request.model_id or TTS_MODEL_ID
+    key = cache_key(request.script, f"{voice_id}:{model_id}")
+    audio_id = f"tts-{key[:32]}"
+
+    if request.use_cache:
+        cached_path = await asyncio.to_thread(uploads_cache.lookup, audio_id)
+        if cached_path:
+            return SpeechSource(audio_id=audio_id, path=cached_path)
+        cached = await asyncio.to_thread(result_cache.get, key)
+        if cached is not None:
+            url = await asyncio.to_thread(s3_uploader.presign, cached.s3_bucket, cached.s3_key)
+            return SpeechSource(audio_id=audio_id, url=url)
+
+    response = await open_tts_stream(request.script, voice_id, model_id)
+    return SpeechSource(
+        audio_id=audio_id,
+        chunks=_tee_speech(response, audio_id, key, started),
+        history_item_id=response.headers.get('history-item-id'),
+    )
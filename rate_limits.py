@@ -0,0 +1,251 @@
+"""
+Per-service admission control for outbound calls: a token bucket for the request rate, a cap on
+concurrent work and a shared pause after a 429/503 with Retry-After.
+
+Waiters are served by priority (lower value first, FIFO within a priority), so interactive
+requests overtake queued batch items. The priority comes from `priority_var`, which the job
+workers set for everything a job runs.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import httpx
+from coordination import configured_workers, coordinator
+from task_poller import parse_retry_after
+from metrics import log_message
+
+DEFAULT_PRIORITY = 0
+BATCH_PRIORITY = int(os.getenv('BATCH_PRIORITY', '10'))
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '5'))
+
+priority_var: ContextVar[int] = ContextVar('priority', default=DEFAULT_PRIORITY)
+
+T = TypeVar('T')
+
+
+class RateLimited(Exception):
+    """A service kept answering 429/503 after all retries."""
+
+    def __init__(self, service: str, retry_after: Optional[float]):
+        self.service = service
+        self.retry_after = retry_after
+        hint = f", retry after {retry_after:.0f}s" if retry_after else ''
+        super().__init__(f"{service} is rate limiting requests{hint}")
+
+
+class _Waiters:
+    """Futures waiting for a resource, lowest priority value first."""
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def add(self, priority: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        return future
+
+    def peek(self) -> Optional[asyncio.Future]:
+        while self._heap and self._heap[0][2].done():
+            heapq.heappop(self._heap)
+        return self._heap[0][2] if self._heap else None
+
+    def pop(self) -> Optional[asyncio.Future]:
+        future = self.peek()
+        if future is not None:
+            heapq.heappop(self._heap)
+        return future
+
+    def __len__(self) -> int:
+        return sum(1 for _, _, future in self._heap if not future.done())
+
+
+class ServiceLimiter:
+    """
+    Admission control for one service. `throttle()` waits for a token (at most `rate` per second,
+    bursts up to `burst`) and for any Retry-After pause to end. `slot()` holds one of
+    `max_concurrency` slots. A rate or cap of 0 disables that limit. With `shared`, the token
+    bucket and the pause live in the coordination database, so every worker draws from one bucket.
+    """
+
+    def __init__(self, service: str, rate: float, burst: float, max_concurrency: int, shared: bool = False):
+        self.service = service
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_concurrency = max_concurrency
+        self.shared = shared
+        self.tokens = self.burst
+        self._shared_wait = 0.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_use = 0
+        self.throttled = 0
+        self.rate_limited = 0
+        self._token_waiters = _Waiters()
+        self._slot_waiters = _Waiters()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _try_take(self) -> bool:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def _dispatch(self):
+        self._timer = None
+        while self._token_waiters.peek() is not None and self._try_take():
+            self._token_waiters.pop().set_result(None)
+        if self._token_waiters.peek() is not None:
+            now = time.monotonic()
+            next_token = (1 - self.tokens) / self.rate if self.rate > 0 else 0
+            delay = max(self.paused_until - now, next_token, 0.001)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    async def _try_take_shared(self) -> bool:
+        if time.monotonic() < self.paused_until:
+            return False
+        if self.rate <= 0:
+            return True
+        self._shared_wait = await coordinator.call(coordinator.take_token, f'rate:{self.service}',
+                                                   self.rate, self.burst)
+        return self._shared_wait == 0
+
+    async def _dispatch_shared(self):
+        # Like _dispatch, but every take is a database call, so it runs as a task instead of a timer
+        while self._token_waiters.peek() is not None:
+            if await self._try_take_shared():
+                future = self._token_waiters.pop()
+                if future is not None:
+                    future.set_result(None)
+            else:
+                await asyncio.sleep(max(self.paused_until - time.monotonic(), self._shared_wait, 0.001))
+
+    async def throttle(self, priority: Optional[int] = None):
+        if not len(self._token_waiters) and (await self._try_take_shared() if self.shared else self._try_take()):
+            return
+        self.throttled += 1
+        future = self._token_waiters.add(priority_var.get() if priority is None else priority)
+        if self.shared:
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = asyncio.create_task(self._dispatch_shared())
+        elif self._timer is None:
+            self._dispatch()
+        await future
+
+    async def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds` (a Retry-After from the service)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        if self.shared:
+            await coordinator.call(coordinator.pause_bucket, f'rate:{self.service}', seconds)
+
+    def _release_slot(self):
+        future = self._slot_waiters.pop()
+        if future is not None:
+            # The slot passes straight to the next waiter
+            future.set_result(None)
+        else:
+            self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        if self.max_concurrency <= 0:
+            yield
+            return
+        if self.in_use < self.max_concurrency and not len(self._slot_waiters):
+            self.in_use += 1
+        else:
+            future = self._slot_waiters.add(priority_var.get() if priority is None else priority)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release_slot()
+                raise
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    async def call(self, func: Callable[[], Awaitable[T]], retries: int = RATE_LIMIT_RETRIES) -> T:
+        """Run `func()` once a token is available, retrying 429/503 answers after their Retry-After."""
+        for attempt in range(retries + 1):
+            await self.throttle()
+            try:
+                return await func()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in (429, 503):
+                    raise
+                self.rate_limited += 1
+                retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+                if attempt == retries:
+                    raise RateLimited(self.service, retry_after)
+                delay = retry_after if retry_after is not None else min(60.0, 2.0 ** attempt)
+                log_message(f"{self.service} answered {e.response.status_code}, pausing for {delay:.1f}s",
+                            level='warning')
+                await self.pause(delay)
+
+    def stats(self) -> dict:
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'max_concurrency': self.max_concurrency,
+            'in_use': self.in_use,
+            'waiting_for_slot': len(self._slot_waiters),
+            'waiting_for_token': len(self._token_waiters),
+            'paused_for': round(max(0.0, self.paused_until - time.monotonic()), 2),
+            'throttled': self.throttled,
+            'rate_limited': self.rate_limited,
+        }
+
+
+# (env prefix, default rate per second, default burst, default concurrency)
+_DEFAULTS = {
+    'browser_use': ('BROWSER_USE', 0.5, 5, 10),
+    'elevenlabs': ('ELEVENLABS', 2, 5, 4),
+}
+_limiters: Dict[str, ServiceLimiter] = {}
+
+
+def limiter_for(service: str) -> ServiceLimiter:
+    """
+    The shared limiter for `service`, configured from <PREFIX>_RATE_LIMIT (requests per second),
+    <PREFIX>_BURST and <PREFIX>_MAX_CONCURRENCY, e.g. BROWSER_USE_MAX_CONCURRENCY for running tasks.
+    The limits are for the whole deployment: with several worker processes they share one token
+    bucket and each one gets an equal share of the concurrency cap.
+    """
+    limiter = _limiters.get(service)
+    if limiter is None:
+        prefix, rate, burst, concurrency = _DEFAULTS.get(service, (service.upper(), 0, 1, 0))
+        share = configured_workers() if coordinator.enabled else 1
+        concurrency = int(os.getenv(f'{prefix}_MAX_CONCURRENCY', str(concurrency)))
+        limiter = _limiters[service] = ServiceLimiter(
+            service,
+            rate=float(os.getenv(f'{prefix}_RATE_LIMIT', str(rate))),
+            burst=float(os.getenv(f'{prefix}_BURST', str(burst))),
+            max_concurrency=math.ceil(concurrency / share),
+            shared=coordinator.enabled,
+        )
+    return limiter
+
+
+def limiter_stats() -> dict:
+    return {service: limiter.stats() for service, limiter in _limiters.items()}
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+from coordination import open_shared_db
+
+
+def normalize_script(script: str) -> str:
+    """Normalize a script so trivially different copies (whitespace, unicode forms) share a key."""
+    return ' '.join(unicodedata.normalize('NFC', script).split())
+
+
+def cache_key(script: str, voice_id: Optional[str]) -> str:
+    payload = f"{voice_id or ''}\0{normalize_script(script)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class CachedResult:
+    enhanced_script: Optional[str]
+    latest_history_item_id: Optional[str]
+    s3_bucket: str
+    s3_key: str
+    audio_id: Optional[str] = None
+    task_id: Optional[str] = None
+    created_at: float = 0.0
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished enhancements keyed on cache_key(script, voice_id).
+    A small in-memory LRU sits in front of a persistent SQLite table, so results survive restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None, capacity: Optional[int] = None):
+        self.path = path or os.getenv('RESULT_CACHE_PATH', os.path.join('data', 'results.db'))
+        self.capacity = capacity if capacity is not None else int(os.getenv('RESULT_CACHE_SIZE', '256'))
+        self._lru: 'OrderedDict[str, CachedResult]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_shared_db(self.path)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, result: CachedResult):
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            result = self._lru.get(key)
+            if result is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return result
+            row = self._db().execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            result = CachedResult(**json.loads(row[0]))
+            self._remember(key, result)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: CachedResult):
+        if not result.created_at:
+            result.created_at = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                'INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)',
+                (key, json.dumps(asdict(result)), result.created_at)
+            )
+            db.commit()
+            self._remember(key, result)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._lru.pop(key, None)
+            db = self._db()
+            db.execute('DELETE FROM results WHERE key = ?', (key,))
+            db.commit()
@@ -0,0 +1,304 @@
+import asyncio
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+from metrics import HTTP_CLIENT_REQUESTS, count_external_call, log_message
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+S3_PART_SIZE = max(MIN_PART_SIZE, int(os.getenv('S3_MULTIPART_CHUNK_SIZE', str(8 * 1024 * 1024))))
+S3_MAX_CONCURRENCY = max(1, int(os.getenv('S3_MAX_CONCURRENCY', '8')))
+# Presigned URLs are handed out again until less than this many seconds of validity remain
+PRESIGN_REFRESH_MARGIN = float(os.getenv('S3_PRESIGN_REFRESH_MARGIN', '300'))
+# Attempts after the first for a streaming-upload call that failed with a transient error
+S3_RETRIES = max(0, int(os.getenv('S3_RETRIES', '3')))
+_TRANSIENT_ERROR_CODES = {'InternalError', 'RequestTimeout', 'ServiceUnavailable', 'SlowDown', 'Throttling',
+                          'ThrottlingException'}
+
+
+def _count_s3_call(**kwargs):
+    count_external_call('s3')
+
+
+def _record_s3_response(http_response=None, model=None, **kwargs):
+    # botocore reports the operation (PutObject, UploadPart, ...) rather than the HTTP method
+    status = http_response.status_code if http_response is not None else 'error'
+    HTTP_CLIENT_REQUESTS.inc(service='s3', method=model.name if model is not None else '', status=status)
+
+
+def make_s3_client():
+    # boto3 takes a noticeable share of a cold start; load it with the first client instead
+    import boto3
+    from botocore.config import Config
+    client = boto3.client(
+        's3',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_DEFAULT_REGION'),
+        # Optional override for S3-compatible stores (MinIO, moto_server, ...)
+        endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+        # Enough pooled connections for concurrent multipart parts
+        config=Config(max_pool_connections=max(10, S3_MAX_CONCURRENCY * 2)),
+    )
+    client.meta.events.register('before-send.s3', _count_s3_call)
+    client.meta.events.register('after-call.s3', _record_s3_response)
+    return client
+
+def is_transient_error(error) -> bool:
+    """Whether a botocore ClientError is worth retrying (throttling, timeouts, 5xx)."""
+    response = getattr(error, 'response', None) or {}
+    code = response.get('Error', {}).get('Code')
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+    return code in _TRANSIENT_ERROR_CODES or status >= 500
+
+def presign_get(s3_client, bucket, object_name, expiration=3600):
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket, 'Key': object_name},
+        ExpiresIn=expiration
+    )
+
+class S3Uploader:
+    """
+    Long-lived S3 uploader around one boto3 client (clients are thread-safe and costly to build).
+    Uploads use a tuned TransferConfig, objects known to exist are not uploaded again, and presigned
+    URLs are cached and reused until they get close to expiry. All methods are blocking.
+    boto3 is only imported when the client is first built (the API does that in its warm-up).
+    """
+
+    def __init__(self, part_size: int = S3_PART_SIZE, max_concurrency: int = S3_MAX_CONCURRENCY,
+                 refresh_margin: float = PRESIGN_REFRESH_MARGIN):
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.max_concurrency = max_concurrency
+        self.refresh_margin = refresh_margin
+        self._transfer_config = None
+        self._client = None
+        self._lock = threading.Lock()
+        self._existing: Set[Tuple[str, str]] = set()
+        self._presigned: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self.uploads = 0
+        self.skipped_uploads = 0
+        self.presign_hits = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = make_s3_client()
+        return self._client
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(
+                multipart_threshold=self.part_size,
+                multipart_chunksize=self.part_size,
+                max_concurrency=self.max_concurrency,
+            )
+        return self._transfer_config
+
+    def exists(self, bucket: str, object_name: str) -> bool:
+        from botocore.exceptions import ClientError
+        if (bucket, object_name) in self._existing:
+            return True
+        try:
+            self.client.head_object(Bucket=bucket, Key=object_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                # Without s3:ListBucket a missing key reports 403; treat any failure as "upload it"
+                log_message(f"S3 head_object error for {object_name}: {e}", level='error')
+            return False
+        self.mark_uploaded(bucket, object_name)
+        return True
+
+    def mark_uploaded(self, bucket: str, object_name: str):
+        with self._lock:
+            self._existing.add((bucket, object_name))
+
+    def presign(self, bucket: str, object_name: str, expiration: int = 3600) -> str:
+        now = time.time()
+        with self._lock:
+            cached = self._presigned.get((bucket, object_name))
+            if cached and cached[1] - now > min(self.refresh_margin, expiration / 2):
+                self.presign_hits += 1
+                return cached[0]
+        url = presign_get(self.client, bucket, object_name, expiration)
+        with self._lock:
+            self._presigned[(bucket, object_name)] = (url, now + expiration)
+        return url
+
+    def upload_file(self, file_path: str, bucket: str, object_name: str, expiration: int = 3600,
+                    skip_existing: bool = True) -> Optional[str]:
+        """Upload `file_path` unless the object already exists; returns a presigned URL or None on error."""
+        from botocore.exceptions import ClientError
+        try:
+            if skip_existing and self.exists(bucket, object_name):
+                self.skipped_uploads += 1
+                log_message(f"S3 object {object_name} already exists, skipping upload")
+            else:
+                self.client.upload_file(file_path, bucket, object_name, Config=self.transfer_config,
+                                        ExtraArgs={'ContentType': 'audio/mpeg'})
+                self.uploads += 1
+                self.mark_uploaded(bucket, object_name)
+            return self.presign(bucket, object_name, expiration)
+        except ClientError as e:
+            log_message(f"S3 upload error: {e}", level='error')
+            return None
+
+    def stats(self) -> dict:
+        return {
+            'uploads': self.uploads,
+            'skipped_uploads': self.skipped_uploads,
+            'presign_hits': self.presign_hits,
+            'presigned_cached': len(self._presigned),
+        }
+
+
+s3_uploader = S3Uploader()
+
+
+def upload_file_to_s3(file_path, bucket, object_name, expiration=3600):
+    return s3_uploader.upload_file(file_path, bucket, object_name, expiration)
+
+
+class S3MultipartWriter:
+    """
+    Incremental S3 multipart upload. Bytes passed to `write` are buffered only until a
+    part is full, and at most `concurrency` parts are in flight, so memory stays bounded by
+    part_size * concurrency rather than the object size. The multipart upload is created with the
+    first full part; an object smaller than one part is sent with a single put_object instead.
+    Calls failing with a transient error are retried `retries` times with exponential backoff.
+    boto3 is blocking, so every S3 call runs in a worker thread.
+    """
+
+    def __init__(self, bucket: str, key: str, part_size: int = S3_PART_SIZE, s3_client=None,
+                 content_type: str = 'audio/mpeg', concurrency: int = S3_MAX_CONCURRENCY,
+                 retries: int = S3_RETRIES, retry_delay: float = 0.5):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        # The shared client is resolved in `start`, off the event loop
+        self.s3_client = s3_client
+        self.content_type = content_type
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.upload_id: Optional[str] = None
+        self.parts = []
+        self.bytes_written = 0
+        self.retried = 0
+        self._buffer = bytearray()
+        self._next_part = 1
+        self._tasks = []
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def _call(self, method: str, **params):
+        if self.s3_client is None:
+            await self.start()
+        from botocore.exceptions import ClientError
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.to_thread(getattr(self.s3_client, method), **params)
+            except ClientError as e:
+                if attempt == self.retries or not is_transient_error(e):
+                    raise
+                self.retried += 1
+                delay = self.retry_delay * 2 ** attempt
+                log_message(f"S3 {method} for {self.key} failed ({e}), retrying in {delay:.1f}s", level='warning')
+                await asyncio.sleep(delay)
+
+    async def start(self):
+        """
+        Get the shared client ready in a worker thread: the first use builds it (boto3 import,
+        credential chain, endpoint resolution), which would otherwise stall the event loop.
+        Nothing is sent yet: the upload is created once there is a full part (or at `complete`).
+        """
+        if self.s3_client is None:
+            self.s3_client = await asyncio.to_thread(getattr, s3_uploader, 'client')
+
+    async def _ensure_upload(self):
+        if self.upload_id is None:
+            response = await self._call('create_multipart_upload', Bucket=self.bucket, Key=self.key,
+                                        ContentType=self.content_type)
+            self.upload_id = response['UploadId']
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._submit_part(part)
+
+    async def _submit_part(self, body: bytes):
+        await self._ensure_upload()
+        # Waits for a free slot, which applies backpressure to the source stream
+        await self._slots.acquire()
+        part_number = self._next_part
+        self._next_part += 1
+        task = asyncio.create_task(self._upload_part(part_number, body))
+        task.add_done_callback(lambda _: self._slots.release())
+        self._tasks.append(task)
+        # Surface a failed part early instead of at complete()
+        for done in self._tasks:
+            if done.done() and done.exception() is not None:
+                raise done.exception()
+
+    async def _upload_part(self, part_number: int, body: bytes):
+        response = await self._call('upload_part', Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                    PartNumber=part_number, Body=body)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    async def complete(self):
+        if self.upload_id is None:
+            # Smaller than one part: a multipart upload would only add two round trips
+            await self._call('put_object', Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer),
+                             ContentType=self.content_type)
+            self._buffer.clear()
+            s3_uploader.mark_uploaded(self.bucket, self.key)
+            return
+        # The final part may be smaller than the minimum
+        if self._buffer:
+            await self._submit_part(bytes(self._buffer))
+            self._buffer.clear()
+        await asyncio.gather(*self._tasks)
+        await self._call('complete_multipart_upload', Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                         MultipartUpload={'Parts': sorted(self.parts, key=lambda part: part['PartNumber'])})
+        s3_uploader.mark_uploaded(self.bucket, self.key)
+
+    async def abort(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.upload_id is None:
+            return
+        from botocore.exceptions import ClientError
+        try:
+            await asyncio.to_thread(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+        except ClientError as e:
+            log_message(f"S3 abort error: {e}", level='error')
+
+
+async def upload_stream_to_s3(chunks: AsyncIterator[bytes], bucket, object_name, expiration=3600,
+                              part_size: int = S3_PART_SIZE) -> Optional[str]:
+    """
+    Upload an async stream of bytes to S3 via multipart upload and return a presigned URL,
+    or None if the upload failed. The source is consumed chunk by chunk and never buffered whole.
+    """
+    writer = S3MultipartWriter(bucket, object_name, part_size=part_size)
+    try:
+        await writer.start()
+        async for chunk in chunks:
+            await writer.write(chunk)
+        await writer.complete()
+    except Exception as e:
+        log_message(f"S3 streaming upload error: {e}", level='error')
+        await writer.abort()
+        return None
+    s3_uploader.uploads += 1
+    return await asyncio.to_thread(s3_uploader.presign, bucket, object_name, expiration)
@@ -0,0 +1,76 @@
+import re
+from typing import List
+
+_PARAGRAPH_SPLIT = re.compile(r'\n\s*\n')
+# Sentence punctuation plus any closing quotes/brackets, then the whitespace the split happens at
+_SENTENCE_END = re.compile(r'[.!?…]["\')\]]*(\s+)')
+
+
+def _sentences(text: str) -> List[str]:
+    """Split at sentence ends; closing quotes and brackets stay with their sentence."""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.start(1)])
+        start = match.end(1)
+    sentences.append(text[start:])
+    return sentences
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """
+    Split a paragraph into sentences, sentences that are still too long at word boundaries, and
+    words longer than `max_chars` into slices of `max_chars`.
+    """
+    pieces = []
+    for sentence in _sentences(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        current = ''
+        for word in sentence.split():
+            if len(word) > max_chars:
+                if current:
+                    pieces.append(current)
+                pieces.extend(word[i:i + max_chars] for i in range(0, len(word) - max_chars, max_chars))
+                current = word[(len(word) - 1) // max_chars * max_chars:]
+            elif current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            pieces.append(current)
+    return pieces
+
+
+def split_script(script: str, max_chars: int) -> List[str]:
+    """
+    Split a script into chunks of at most `max_chars` characters.
+    Paragraphs are kept whole where they fit, otherwise split at sentence boundaries; adjacent
+    pieces are packed together greedily so the number of chunks stays small.
+    """
+    if max_chars <= 0:
+        raise ValueError('max_chars must be positive')
+    chunks: List[str] = []
+    current = ''
+    for paragraph in _PARAGRAPH_SPLIT.split(script.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= max_chars else _split_long(paragraph, max_chars)
+        for index, piece in enumerate(pieces):
+            # Paragraph breaks survive packing, sentence breaks become a single space
+            separator = '\n\n' if index == 0 else ' '
+            if current and len(current) + len(separator) + len(piece) <= max_chars:
+                current = f"{current}{separator}{piece}"
+            else:
+                if current:
+                    chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks
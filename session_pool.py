@@ -0,0 +1,225 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+from coordination import coordinator
+from metrics import log_message
+
+TTS_URL = 'https://elevenlabs.io/app/speech-synthesis/text-to-speech'
+LOGIN_URL = 'https://elevenlabs.io/app/sign-in'
+# Replies the agent is told to give, so the outcome can be read without parsing prose
+LOGIN_REQUIRED = 'LOGIN_REQUIRED'
+SESSION_READY = 'SESSION_READY'
+
+
+def needs_login(details: dict) -> bool:
+    """Whether a task stopped because its browser profile is no longer logged in to ElevenLabs."""
+    outputs = [details.get('output') or '']
+    steps = details.get('steps') or []
+    if steps:
+        outputs.append(steps[-1].get('output') or '')
+    return any(LOGIN_REQUIRED in output for output in outputs)
+
+
+def session_check_instructions() -> str:
+    return (
+        f"Go to {TTS_URL}, wait for the page to load. "
+        f"If you are redirected to a login or signup page, reply with exactly {LOGIN_REQUIRED}, "
+        f"otherwise reply with exactly {SESSION_READY}. Do not click anything else."
+    )
+
+
+def login_instructions(email: str, password: str) -> str:
+    return (
+        f"Go to {LOGIN_URL}, log in using email: {email} and password: {password}, "
+        f"after successful login go to {TTS_URL}, wait for the text-to-speech page to load, "
+        f"then reply with exactly {SESSION_READY}."
+    )
+
+
+class BrowserSession:
+    """One persistent browser-use profile that keeps an ElevenLabs login between tasks."""
+
+    def __init__(self, profile_id: str):
+        self.profile_id = profile_id
+        # Voice last selected in this profile; ElevenLabs keeps it, so the next job can skip selecting it
+        self.voice_id: Optional[str] = None
+        self.leased = False
+        self.expired = False
+        self.last_ok = 0.0
+        # Left for another worker until then (monotonic), see SessionPool.release
+        self.handoff_until = 0.0
+        self.leases = 0
+        self.logins = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'profile_id': self.profile_id,
+            'leased': self.leased,
+            'expired': self.expired,
+            'voice_id': self.voice_id,
+            'last_ok': self.last_ok or None,
+            'leases': self.leases,
+            'logins': self.logins,
+        }
+
+
+class SessionPool:
+    """
+    Pool of logged-in browser-use profiles (BROWSER_USE_PROFILE_IDS, comma-separated).
+    A job leases a profile, so its task can start on the text-to-speech page and skip the login
+    and navigation steps. Leases prefer a profile that already has the requested voice selected.
+    A profile is logged in again only when a task or health check reports LOGIN_REQUIRED.
+    `run_task(instructions, api_key, **options)` runs one browser-use task and returns its details.
+    With no profiles configured the pool is disabled and every task logs in by itself.
+    With several worker processes, a profile is also leased through coordination.py (`profile:<id>`),
+    so two workers never drive the same browser profile at once.
+    """
+
+    def __init__(self, run_task: Callable[..., Awaitable[dict]], profile_ids: Optional[List[str]] = None,
+                 health_interval: Optional[float] = None):
+        self.run_task = run_task
+        if profile_ids is None:
+            profile_ids = [p.strip() for p in os.getenv('BROWSER_USE_PROFILE_IDS', '').split(',') if p.strip()]
+        self.sessions = [BrowserSession(profile_id) for profile_id in profile_ids]
+        self.health_interval = health_interval or float(os.getenv('SESSION_HEALTH_INTERVAL', '1800'))
+        self.waiting = 0
+        self.relogins = 0
+        self.health_checks = 0
+        self._available: Optional[asyncio.Condition] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sessions)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._available is None:
+            self._available = asyncio.Condition()
+        return self._available
+
+    async def _pick(self, voice_id: Optional[str]) -> Optional[BrowserSession]:
+        now = time.monotonic()
+        idle = [session for session in self.sessions if not session.leased and session.handoff_until <= now]
+        # Same voice first, then logged-in over expired, then least recently used
+        for session in sorted(idle, key=lambda s: (s.voice_id != voice_id, s.expired, s.last_ok)):
+            if await coordinator.call(coordinator.try_lease, f'profile:{session.profile_id}'):
+                await self._load_shared(session)
+                return session
+        return None
+
+    async def _load_shared(self, session: BrowserSession):
+        # Another worker may have used the profile since: its selected voice is what counts
+        state = await coordinator.call(coordinator.get_value, f'profile:{session.profile_id}')
+        if state is not None:
+            session.voice_id = state.get('voice_id')
+            session.expired = state.get('expired', False)
+            session.last_ok = max(session.last_ok, state.get('last_ok') or 0.0)
+
+    async def _save_shared(self, session: BrowserSession):
+        await coordinator.call(coordinator.set_value, f'profile:{session.profile_id}', {
+            'voice_id': session.voice_id, 'expired': session.expired, 'last_ok': session.last_ok,
+        })
+
+    async def lease(self, voice_id: Optional[str] = None) -> BrowserSession:
+        condition = self._condition()
+        async with condition:
+            self.waiting += 1
+            try:
+                session = await self._pick(voice_id)
+                while session is None:
+                    # Tells the other workers to hand released profiles over rather than keep them
+                    await coordinator.call(coordinator.try_lease, f'profile-wait:{coordinator.worker_id}')
+                    try:
+                        # Other workers release profiles without notifying this one: look again now and then
+                        await asyncio.wait_for(condition.wait(), timeout=1 if coordinator.enabled else None)
+                    except asyncio.TimeoutError:
+                        pass
+                    session = await self._pick(voice_id)
+            finally:
+                self.waiting -= 1
+                if not self.waiting:
+                    await coordinator.call(coordinator.release, f'profile-wait:{coordinator.worker_id}')
+            session.leased = True
+            session.leases += 1
+            return session
+
+    async def release(self, session: BrowserSession):
+        condition = self._condition()
+        async with condition:
+            session.leased = False
+            await coordinator.call(coordinator.release, f'profile:{session.profile_id}')
+            waiting = await coordinator.call(coordinator.holders, 'profile-wait:')
+            if any(name != f'profile-wait:{coordinator.worker_id}' for name in waiting):
+                # Local waiters would otherwise always win the profile over a worker polling for it
+                session.handoff_until = time.monotonic() + 2
+            condition.notify()
+
+    @asynccontextmanager
+    async def session(self, voice_id: Optional[str] = None) -> AsyncIterator[BrowserSession]:
+        session = await self.lease(voice_id)
+        try:
+            yield session
+        finally:
+            await self.release(session)
+
+    async def mark_ok(self, session: BrowserSession, voice_id: Optional[str] = None):
+        session.expired = False
+        session.last_ok = time.time()
+        if voice_id:
+            session.voice_id = voice_id
+        await self._save_shared(session)
+
+    async def login(self, session: BrowserSession, api_key: str, email: str, password: str):
+        """Log the (leased) profile in again and save its cookies. Raises if the login task fails."""
+        log_message(f"Logging in browser profile {session.profile_id}")
+        session.expired = True
+        session.voice_id = None
+        await self._save_shared(session)
+        details = await self.run_task(login_instructions(email, password), api_key,
+                                      browser_profile_id=session.profile_id, save_browser_data=True)
+        if details.get('status') != 'finished' or needs_login(details):
+            raise Exception(f"Login with browser profile {session.profile_id} failed "
+                            f"(status {details.get('status')})")
+        session.logins += 1
+        self.relogins += 1
+        await self.mark_ok(session)
+
+    async def check(self, session: BrowserSession, api_key: str, email: str, password: str):
+        """Health check for a leased profile: cheap page visit, and a login only if it expired."""
+        self.health_checks += 1
+        details = await self.run_task(session_check_instructions(), api_key, browser_profile_id=session.profile_id)
+        if needs_login(details):
+            await self.login(session, api_key, email, password)
+        elif details.get('status') == 'finished':
+            await self.mark_ok(session, session.voice_id)
+
+    async def run_health_checks(self, api_key: str, email: str, password: str):
+        """Background loop: check idle profiles not used successfully within the health interval."""
+        while True:
+            await asyncio.sleep(min(self.health_interval, 300))
+            for session in list(self.sessions):
+                if session.leased or time.time() - session.last_ok < self.health_interval:
+                    continue
+                async with self._condition():
+                    if session.leased or not await coordinator.call(coordinator.try_lease,
+                                                                    f'profile:{session.profile_id}'):
+                        continue
+                    await self._load_shared(session)
+                    session.leased = True
+                try:
+                    await self.check(session, api_key, email, password)
+                except Exception as e:
+                    log_message(f"Health check of browser profile {session.profile_id} failed: {e}", level='error')
+                finally:
+                    await self.release(session)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'sessions': [session.to_dict() for session in self.sessions],
+            'leased': sum(1 for session in self.sessions if session.leased),
+            'waiting': self.waiting,
+            'relogins': self.relogins,
+            'health_checks': self.health_checks,
+        }
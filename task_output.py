@@ -0,0 +1,95 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+MEDIA_URL_PATTERN = re.compile(r'https?://[\w./\-_%]+\.(?:mp3|wav)(?:\?[^\s"]*)?')
+AUDIO_ID_PATTERN = re.compile(
+    r'<button[^>]*data-type=["\ ](list-item-trigger-overlay)["\ ][^>]*id=["\ ]([\w-]+)["\ ]'
+)
+ENHANCED_HINT_PATTERN = re.compile(r'enhanced|script|text', re.IGNORECASE)
+MEDIA_EXTENSIONS = ('.mp3', '.wav')
+
+
+@dataclass
+class TaskOutput:
+    """Everything the pipeline reads out of finished browser-use task details."""
+    enhanced_script: Optional[str] = None
+    # Where the enhanced script came from: 'output', 'step N', or 'fallback'
+    enhanced_source: Optional[str] = None
+    audio_id: Optional[str] = None
+    # Direct mp3/wav links in the main output, then in step order
+    media_urls: List[str] = field(default_factory=list)
+    # (name, url) for every entry of output_files
+    output_files: List[Tuple[str, str]] = field(default_factory=list)
+
+    def media_files(self, extensions: Tuple[str, ...] = MEDIA_EXTENSIONS) -> List[Tuple[str, str]]:
+        """Output files whose name or URL has one of `extensions` and that can be downloaded over http."""
+        return [(name, url) for name, url in self.output_files
+                if (name.endswith(extensions) or url.endswith(extensions)) and url.startswith('http')]
+
+    def first_media_url(self, extensions: Tuple[str, ...] = MEDIA_EXTENSIONS) -> Optional[str]:
+        """Preferred download link: an output file first, then a link found in the text."""
+        for _, url in self.output_files:
+            if url.endswith(extensions):
+                return url
+        for url in self.media_urls:
+            if url.split('?', 1)[0].endswith(extensions):
+                return url
+        return None
+
+
+def _output_file(file_info) -> Optional[Tuple[str, str]]:
+    if isinstance(file_info, dict):
+        return file_info.get('name') or '', file_info.get('url') or ''
+    if isinstance(file_info, str):
+        return os.path.basename(file_info), file_info
+    return None
+
+
+def _media_urls(text: str) -> List[str]:
+    # The pattern's literal "http" prefix makes the scan fast; a '.mp3' substring pre-check is slower
+    return [match.group(0) for match in MEDIA_URL_PATTERN.finditer(text)]
+
+
+def extract_task_output(details: dict, script: str = '') -> TaskOutput:
+    """
+    Walk the task details once and collect the enhanced script, audio id, media links and output files.
+    The enhanced script is, in order of preference: the main output if it is longer than `script`,
+    the first step output longer than `script`, the first step output over 50 characters that
+    mentions enhanced/script/text, and finally the main output as-is.
+    """
+    result = TaskOutput()
+    output_text = details.get('output') or ''
+    for file_info in details.get('output_files') or []:
+        entry = _output_file(file_info)
+        if entry is not None:
+            result.output_files.append(entry)
+    result.media_urls.extend(_media_urls(output_text))
+
+    longer_step = None
+    hinted_step = None
+    for i, step in enumerate(details.get('steps') or []):
+        step_output = (step.get('output') or '') if isinstance(step, dict) else ''
+        if not step_output:
+            continue
+        if longer_step is None and len(step_output) > len(script):
+            longer_step = (i, step_output)
+        # Only needed while no step beats the script length, which takes precedence
+        if hinted_step is None and longer_step is None and len(step_output) > 50 and ENHANCED_HINT_PATTERN.search(step_output):
+            hinted_step = (i, step_output)
+        # Substring check first: the full pattern backtracks over every <button in the step
+        if result.audio_id is None and 'list-item-trigger-overlay' in step_output:
+            match = AUDIO_ID_PATTERN.search(step_output)
+            if match:
+                result.audio_id = match.group(2)
+        result.media_urls.extend(_media_urls(step_output))
+
+    if output_text and len(output_text) > len(script):
+        result.enhanced_script, result.enhanced_source = output_text, 'output'
+    elif longer_step or hinted_step:
+        i, result.enhanced_script = longer_step or hinted_step
+        result.enhanced_source = f'step {i}'
+    else:
+        result.enhanced_script, result.enhanced_source = output_text, 'fallback'
+    return result
@@ -0,0 +1,263 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+import httpx
+from metrics import http_calls_var, log_message, request_id_var
+
+TERMINAL_STATUSES = ('finished', 'failed', 'stopped')
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class _Watch:
+    def __init__(self, task_id: str, api_key: str, timeout: float):
+        self.task_id = task_id
+        self.api_key = api_key
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.next_poll = self.started
+        self.polls = 0
+        self.errors = 0
+        self.status: Optional[str] = None
+        # Set when a webhook reported a terminal status, so the closing fetch is retried promptly
+        self.pushed_terminal = False
+        # Polls are made on behalf of the waiting request and counted against it
+        self.http_calls = http_calls_var.get()
+        self.request_id = request_id_var.get()
+        self.listeners: List[Callable[[str], None]] = []
+        # Requests waiting on the task; the watch is dropped when the last one gives up
+        self.waiters = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class TaskPoller:
+    """
+    Single background poller for every in-flight browser-use task.
+    Instead of one fixed-interval loop per request, each task is polled on its own adaptive
+    schedule: rarely while it is young, more often as it nears the expected duration (learned
+    from finished tasks), with jitter. A 429/503 with Retry-After pauses all polling.
+    Waiters get the final task details through a future.
+    With push enabled, status events delivered through `notify` (browser-use webhooks) drive
+    completion and polling drops to a slow safety net for missed events.
+    """
+
+    def __init__(self, fetch, min_interval: Optional[float] = None, max_interval: Optional[float] = None,
+                 expected_duration: Optional[float] = None, max_errors: int = 5,
+                 push_enabled: Optional[bool] = None, safety_interval: Optional[float] = None,
+                 on_rate_limited: Optional[Callable[[float], Awaitable[None]]] = None):
+        self.fetch = fetch
+        self.min_interval = min_interval or float(os.getenv('TASK_POLL_MIN_INTERVAL', '2'))
+        self.max_interval = max_interval or float(os.getenv('TASK_POLL_MAX_INTERVAL', '15'))
+        self.expected_duration = expected_duration or float(os.getenv('TASK_EXPECTED_SECONDS', '120'))
+        self.max_errors = max_errors
+        # Told about every Retry-After pause, so other callers of the service back off too
+        self.on_rate_limited = on_rate_limited
+        if push_enabled is None:
+            push_enabled = bool(os.getenv('BROWSER_USE_WEBHOOK_SECRET'))
+        self.push_enabled = push_enabled
+        self.safety_interval = safety_interval or float(os.getenv('TASK_PUSH_SAFETY_INTERVAL', '60'))
+        self.watches: Dict[str, _Watch] = {}
+        self.backoff_until = 0.0
+        self.polls_total = 0
+        self.completed_tasks = 0
+        self.polls_for_completed = 0
+        self.rate_limited = 0
+        self.events_total = 0
+        self.pushed_completions = 0
+        # Terminal events for tasks nobody waits on yet (the event beat create_task's response)
+        self._early_events: 'OrderedDict[str, str]' = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    def next_interval(self, age: float) -> float:
+        if self.push_enabled:
+            return self.safety_interval * random.uniform(0.8, 1.2)
+        remaining = self.expected_duration - age
+        if remaining > 0:
+            interval = remaining / 4
+        else:
+            # Overdue tasks back off again slowly so stragglers do not dominate traffic
+            interval = self.min_interval + (-remaining) / 10
+        interval = max(self.min_interval, min(self.max_interval, interval))
+        return interval * random.uniform(0.8, 1.2)
+
+    async def wait(self, task_id: str, api_key: str, timeout: float,
+                   on_status: Optional[Callable[[str], None]] = None, poll_now: bool = False) -> dict:
+        """
+        Wait for a terminal status; `on_status(status)` is called whenever a poll sees a new status.
+        `poll_now` polls at once, for tasks that may have finished long ago (resumed jobs).
+        If every waiter is cancelled (client gone, job timeout), the task is no longer polled.
+        """
+        watch = self.watches.get(task_id)
+        if watch is None:
+            watch = _Watch(task_id, api_key, timeout)
+            # The first poll waits a little: a task is never done right after creation
+            watch.next_poll = watch.started + self.next_interval(0)
+            if self._early_events.pop(task_id, None) is not None or poll_now:
+                watch.pushed_terminal = True
+                watch.next_poll = watch.started
+            self.watches[task_id] = watch
+            self._ensure_running()
+        if on_status is not None:
+            watch.listeners.append(on_status)
+        watch.waiters += 1
+        try:
+            return await asyncio.shield(watch.future)
+        finally:
+            watch.waiters -= 1
+            if on_status is not None and on_status in watch.listeners:
+                watch.listeners.remove(on_status)
+            if not watch.waiters and not watch.future.done():
+                self._drop(watch)
+
+    def notify(self, task_id: str, status: Optional[str], details: Optional[dict] = None) -> bool:
+        """
+        Apply a pushed status event. A terminal event resolves the waiter at once when `details`
+        carries the task output, otherwise it triggers one immediate fetch of the details.
+        Returns whether a waiting task matched.
+        """
+        self.events_total += 1
+        watch = self.watches.get(task_id)
+        if watch is None:
+            if status in TERMINAL_STATUSES:
+                self._early_events[task_id] = status
+                while len(self._early_events) > 1000:
+                    self._early_events.popitem(last=False)
+            return False
+        self._set_status(watch, status)
+        if status in TERMINAL_STATUSES:
+            self.pushed_completions += 1
+            if details is not None and 'steps' in details:
+                self._resolve(watch, details)
+            else:
+                watch.pushed_terminal = True
+                watch.next_poll = time.monotonic()
+                self._ensure_running()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self.watches),
+            'polls_total': self.polls_total,
+            'completed_tasks': self.completed_tasks,
+            'polls_per_completed_task': (self.polls_for_completed / self.completed_tasks) if self.completed_tasks else None,
+            'expected_duration_seconds': round(self.expected_duration, 2),
+            'rate_limited': self.rate_limited,
+            'push_enabled': self.push_enabled,
+            'events_total': self.events_total,
+            'pushed_completions': self.pushed_completions,
+        }
+
+    def _ensure_running(self):
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    def _drop(self, watch: _Watch):
+        if self.watches.get(watch.task_id) is watch:
+            del self.watches[watch.task_id]
+        watch.future.cancel()
+        # The loop exits once no watches remain
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _set_status(self, watch: _Watch, status: Optional[str]):
+        if status != watch.status:
+            watch.status = status
+            for listener in watch.listeners:
+                listener(status)
+
+    def _resolve(self, watch: _Watch, details: Optional[dict] = None, error: Optional[Exception] = None):
+        self.watches.pop(watch.task_id, None)
+        if watch.future.done():
+            return
+        if error is not None:
+            watch.future.set_exception(error)
+            return
+        self.completed_tasks += 1
+        self.polls_for_completed += watch.polls
+        # Exponential moving average of observed durations drives the schedule
+        duration = time.monotonic() - watch.started
+        self.expected_duration = 0.8 * self.expected_duration + 0.2 * duration
+        watch.future.set_result(details)
+
+    async def _poll(self, watch: _Watch):
+        # Each poll runs in its own task (gather), so this does not leak into other watches
+        http_calls_var.set(watch.http_calls)
+        request_id_var.set(watch.request_id)
+        watch.polls += 1
+        self.polls_total += 1
+        try:
+            details = await self.fetch(watch.task_id, watch.api_key)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (429, 503):
+                self.rate_limited += 1
+                delay = parse_retry_after(e.response.headers.get('Retry-After')) or self.max_interval
+                self.backoff_until = max(self.backoff_until, time.monotonic() + delay)
+                if self.on_rate_limited is not None:
+                    await self.on_rate_limited(delay)
+                log_message(f"browser-use rate limited, pausing polls for {delay:.1f}s", level='warning')
+                watch.next_poll = self.backoff_until
+                return
+            self._resolve(watch, error=e)
+            return
+        except Exception as e:
+            watch.errors += 1
+            if watch.errors >= self.max_errors:
+                self._resolve(watch, error=e)
+            else:
+                watch.next_poll = time.monotonic() + self.next_interval(time.monotonic() - watch.started)
+            return
+        watch.errors = 0
+        status = details.get('status')
+        log_message(f"Task {watch.task_id} status: {status}")
+        self._set_status(watch, status)
+        if status in TERMINAL_STATUSES:
+            self._resolve(watch, details)
+        elif watch.pushed_terminal:
+            # The event got ahead of the task API; retry soon rather than at the safety interval
+            watch.next_poll = time.monotonic() + self.min_interval
+        else:
+            now = time.monotonic()
+            watch.next_poll = now + self.next_interval(now - watch.started)
+
+    async def _run(self):
+        while self.watches:
+            now = time.monotonic()
+            for watch in list(self.watches.values()):
+                if now > watch.deadline:
+                    minutes = (watch.deadline - watch.started) / 60
+                    self._resolve(watch, error=Exception(f"Task timed out after {minutes:g} minutes"))
+            if now >= self.backoff_until:
+                due = [w for w in self.watches.values() if w.next_poll <= now]
+                if due:
+                    await asyncio.gather(*(self._poll(w) for w in due))
+                    continue
+            if not self.watches:
+                break
+            wake_at = max(self.backoff_until, min(w.next_poll for w in self.watches.values()))
+            wake_at = min(wake_at, min(w.deadline for w in self.watches.values()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, wake_at - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
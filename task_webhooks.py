@@ -0,0 +1,60 @@
+"""
+Verification and parsing of browser-use webhook events.
+
+browser-use signs each event with HMAC-SHA256 over "{timestamp}.{body}", where the body is the raw
+request body exactly as delivered, so every field of the event (its type included) is covered. The
+hex digest is sent in X-Browser-Use-Signature and the timestamp in X-Browser-Use-Timestamp. Events
+older than the tolerance are rejected as replays.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+WEBHOOK_SECRET = os.getenv('BROWSER_USE_WEBHOOK_SECRET', '')
+WEBHOOK_TOLERANCE = float(os.getenv('BROWSER_USE_WEBHOOK_TOLERANCE', '300'))
+
+SIGNATURE_HEADER = 'X-Browser-Use-Signature'
+TIMESTAMP_HEADER = 'X-Browser-Use-Timestamp'
+STATUS_EVENT = 'agent.task.status_update'
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+def sign_body(secret: str, timestamp: str, body: bytes) -> str:
+    message = timestamp.encode('utf-8') + b'.' + body
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def _parse_timestamp(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise InvalidWebhook(f'Unreadable timestamp: {value!r}')
+
+
+def verify_event(body: bytes, signature: Optional[str], timestamp: Optional[str],
+                 secret: str = WEBHOOK_SECRET, tolerance: float = WEBHOOK_TOLERANCE) -> dict:
+    """Check the signature and age of a webhook delivery and return the decoded event."""
+    if not signature or not timestamp:
+        raise InvalidWebhook('Missing signature or timestamp header')
+    if tolerance > 0 and abs(time.time() - _parse_timestamp(timestamp)) > tolerance:
+        raise InvalidWebhook('Timestamp outside the allowed window')
+    if not hmac.compare_digest(sign_body(secret, timestamp, body), signature):
+        raise InvalidWebhook('Signature mismatch')
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise InvalidWebhook('Body is not valid JSON')
+    if not isinstance(event, dict) or not isinstance(event.get('payload'), dict):
+        raise InvalidWebhook('Event has no payload')
+    return event
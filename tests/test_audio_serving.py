@@ -0,0 +1,149 @@
+import email.utils
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from audio_serving import local_audio_path, parse_range, serve_audio_file
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 10239)),
+    ('bytes=10000-20000', (10000, 10239)),
+    ('bytes=-500', (9740, 10239)),
+    ('bytes=-20000', (0, 10239)),
+    ('bytes=5-5', (5, 5)),
+    (' bytes=0-0 ', (0, 0)),
+    # Unsupported forms fall back to the whole file
+    ('bytes=0-1,5-6', None),
+    ('bytes=-', None),
+    ('items=0-10', None),
+    ('bytes=a-b', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(DATA)) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=10240-', 'bytes=20000-30000', 'bytes=50-10', 'bytes=-0'])
+def test_unsatisfiable_ranges_raise(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(DATA))
+
+
+def test_local_audio_path_rejects_unsafe_ids(tmp_path):
+    (tmp_path / 'abc_1.mp3').write_bytes(b'x')
+    assert local_audio_path('abc_1', str(tmp_path)) == str(tmp_path / 'abc_1.mp3')
+    assert local_audio_path('abc_1.mp3', str(tmp_path)) == str(tmp_path / 'abc_1.mp3')
+    assert local_audio_path('../abc_1', str(tmp_path)) is None
+    assert local_audio_path('missing', str(tmp_path)) is None
+
+
+@pytest.fixture
+def audio(tmp_path):
+    path = tmp_path / 'item.mp3'
+    path.write_bytes(DATA)
+    app = FastAPI()
+
+    @app.api_route('/audio', methods=['GET', 'HEAD'])
+    async def get_audio(request: Request):
+        return serve_audio_file(request, str(path))
+
+    return TestClient(app), path
+
+
+def test_full_response_has_validators(audio):
+    client, path = audio
+    response = client.get('/audio')
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.headers['content-length'] == str(len(DATA))
+    assert response.headers['etag'].startswith('"')
+    assert response.headers['last-modified'] == email.utils.formatdate(os.stat(path).st_mtime, usegmt=True)
+
+
+def test_range_response(audio):
+    client, _ = audio
+    response = client.get('/audio', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers['content-range'] == f'bytes 100-199/{len(DATA)}'
+    assert response.headers['content-length'] == '100'
+
+
+def test_suffix_range_response(audio):
+    client, _ = audio
+    response = client.get('/audio', headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.content == DATA[-10:]
+
+
+def test_multi_range_serves_the_whole_file(audio):
+    client, _ = audio
+    response = client.get('/audio', headers={'Range': 'bytes=0-1,5-6'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_unsatisfiable_range(audio):
+    client, _ = audio
+    response = client.get('/audio', headers={'Range': f'bytes={len(DATA)}-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{len(DATA)}'
+
+
+@pytest.mark.parametrize('if_none_match', ['{etag}', 'W/{etag}', '"other", {etag}', '*'])
+def test_if_none_match_returns_304(audio, if_none_match):
+    client, _ = audio
+    etag = client.head('/audio').headers['etag']
+    response = client.get('/audio', headers={'If-None-Match': if_none_match.format(etag=etag)})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+
+def test_if_none_match_with_another_etag_serves_the_file(audio):
+    client, _ = audio
+    response = client.get('/audio', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(audio):
+    client, _ = audio
+    last_modified = client.head('/audio').headers['last-modified']
+    response = client.get('/audio', headers={'If-None-Match': '"stale"', 'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+
+
+def test_if_modified_since(audio):
+    client, path = audio
+    last_modified = client.head('/audio').headers['last-modified']
+    assert client.get('/audio', headers={'If-Modified-Since': last_modified}).status_code == 304
+    earlier = email.utils.formatdate(os.stat(path).st_mtime - 3600, usegmt=True)
+    assert client.get('/audio', headers={'If-Modified-Since': earlier}).status_code == 200
+    assert client.get('/audio', headers={'If-Modified-Since': 'not a date'}).status_code == 200
+
+
+def test_if_range_with_a_stale_etag_serves_the_whole_file(audio):
+    client, _ = audio
+    etag = client.head('/audio').headers['etag']
+    current = client.get('/audio', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert current.status_code == 206
+    stale = client.get('/audio', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == DATA
+
+
+def test_head_has_headers_but_no_body(audio):
+    client, _ = audio
+    response = client.head('/audio', headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.headers['content-length'] == '10'
+    assert response.content == b''
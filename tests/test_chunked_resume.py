@@ -0,0 +1,80 @@
+import asyncio
+
+import pipeline
+from models import ScriptRequest
+
+SCRIPT = '\n\n'.join(f'Paragraph {i} has a few words in it.' for i in range(3))
+
+
+class FakeGeneration:
+    """Stands in for generate_audio: one task per call, failing once if asked to."""
+
+    def __init__(self, fail_on=None):
+        self.created = []
+        self.resumed = []
+        self.fail_on = fail_on
+
+    async def __call__(self, script, voice_id, api_key, email, password, advance, resume=None):
+        if resume and resume.get('task_id'):
+            self.resumed.append(resume['task_id'])
+            task_id = resume['task_id']
+        else:
+            task_id = f'task-{len(self.created)}'
+            self.created.append(script)
+            advance('task_queued', task_id=task_id, task_created_at=1.0)
+            if script == self.fail_on:
+                self.fail_on = None
+                raise Exception('browser crashed')
+        details = {'status': 'finished', 'output': script}
+        return task_id, details, f'hist{task_id.replace("-", "")}'
+
+
+def _run(monkeypatch, generation, resume=None):
+    checkpoints = []
+
+    def advance(stage, task_id=None, **info):
+        if 'chunks' in info:
+            checkpoints.append(info['chunks'])
+
+    async def chunk_audio(history_item_id):
+        return f'/cache/{history_item_id}.mp3'
+
+    monkeypatch.setattr(pipeline, 'generate_audio', generation)
+    monkeypatch.setattr(pipeline, '_chunk_audio', chunk_audio)
+    monkeypatch.setattr(pipeline, 'concat_mp3_files', lambda paths, out: float(len(paths)))
+    monkeypatch.setattr(pipeline.uploads_cache, 'add_file', lambda *args: '/cache/combined.mp3')
+    monkeypatch.delenv('S3_BUCKET_NAME', raising=False)
+    request = ScriptRequest(script=SCRIPT, chunked=True, max_chunk_chars=50, use_cache=False)
+    response = asyncio.run(pipeline._run_chunked(request, 'key', None, 50, 'api', 'e', 'p', advance, resume))
+    return response, checkpoints
+
+
+def test_every_finished_chunk_is_checkpointed(monkeypatch):
+    response, checkpoints = _run(monkeypatch, FakeGeneration())
+    chunks = checkpoints[-1]
+    assert len(chunks) == 3
+    assert all(chunk['done'] for chunk in chunks)
+    assert [chunk['history_item_id'] for chunk in chunks] == response.chunk_history_item_ids
+    assert all(chunk['path'] == f"/cache/{chunk['history_item_id']}.mp3" for chunk in chunks)
+
+
+def test_resume_skips_finished_chunks_and_collects_started_tasks(monkeypatch):
+    _, checkpoints = _run(monkeypatch, FakeGeneration())
+    chunks = checkpoints[-1]
+    # Restart with the first chunk finished and the second task created but not collected
+    resume = {'chunks': [chunks[0], {'task_id': chunks[1]['task_id'], 'task_created_at': 1.0}, {}]}
+    generation = FakeGeneration()
+    response, _ = _run(monkeypatch, generation, resume)
+    assert len(generation.created) == 1
+    assert generation.resumed == [chunks[1]['task_id']]
+    assert response.chunk_task_ids[0] == chunks[0]['task_id']
+
+
+def test_failed_attempt_starts_a_new_task(monkeypatch):
+    chunks = pipeline.split_script(SCRIPT, 50)
+    generation = FakeGeneration(fail_on=chunks[1])
+    monkeypatch.setattr(pipeline, 'CHUNK_RETRIES', 1)
+    response, _ = _run(monkeypatch, generation)
+    assert len(generation.created) == 4
+    assert generation.resumed == []
+    assert len(response.chunk_task_ids) == 3
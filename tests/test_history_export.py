@@ -0,0 +1,50 @@
+import asyncio
+import io
+import zipfile
+
+import history_export
+from history_export import HistoryExporter
+
+
+def _zip_stream(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    data = buffer.getvalue()
+
+    async def chunks(ids):
+        for start in range(0, len(data), 1000):
+            yield data[start:start + 1000]
+    return chunks
+
+
+def _export(monkeypatch, entries, ids):
+    stored, downloaded = {}, []
+    monkeypatch.setattr(history_export, 'iter_elevenlabs_history_zip', _zip_stream(entries))
+    exporter = HistoryExporter(index=None, cache=None, local=True, s3_bucket=None)
+
+    async def store(history_item_id, chunks, missing):
+        stored[history_item_id] = b''.join([chunk async for chunk in chunks])
+
+    async def download_one(history_item_id, missing):
+        downloaded.append(history_item_id)
+
+    monkeypatch.setattr(exporter, '_store', store)
+    monkeypatch.setattr(exporter, '_download_one', download_one)
+    asyncio.run(exporter._download_zip({i: {'local': True, 's3': False} for i in ids}))
+    return stored, downloaded
+
+
+def test_entries_are_matched_by_exact_id(monkeypatch):
+    entries = [('bbb.mp3', b'audio b'), ('aaa.mp3', b'audio a'), ('aaa-old.mp3', b'not a')]
+    stored, downloaded = _export(monkeypatch, entries, ['aaa', 'bbb', 'ccc'])
+    assert stored == {'aaa': b'audio a', 'bbb': b'audio b'}
+    assert downloaded == ['ccc']
+
+
+def test_entries_without_ids_are_not_matched_by_position(monkeypatch):
+    entries = [('001.mp3', b'first'), ('002.mp3', b'second')]
+    stored, downloaded = _export(monkeypatch, entries, ['aaa', 'bbb'])
+    assert stored == {}
+    assert downloaded == ['aaa', 'bbb']
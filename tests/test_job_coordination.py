@@ -0,0 +1,80 @@
+import asyncio
+
+import jobs
+from coordination import Coordinator
+from job_store import JobStore
+from jobs import JobManager
+from models import ScriptRequest, ScriptResponse
+
+
+def _worker(tmp_path, runner):
+    coordinator = Coordinator(path=str(tmp_path / 'coordination.db'), enabled=True)
+    store = JobStore(path=str(tmp_path / 'jobs.db'), flush_interval=0.05)
+    manager = JobManager(runner, workers=2, key_func=lambda request: request.script, store=store,
+                         coordinator=coordinator)
+    return coordinator, manager
+
+
+async def _run_two_workers(tmp_path, runner, submissions):
+    workers = [_worker(tmp_path, runner) for _ in range(2)]
+    for coordinator, manager in workers:
+        await coordinator.start()
+        await manager.start()
+    try:
+        submitted = []
+        for index, request in submissions:
+            submitted.append(await workers[index][1].submit(request))
+        await asyncio.wait_for(asyncio.gather(*(job.done.wait() for job in submitted)), timeout=10)
+        return submitted
+    finally:
+        for coordinator, manager in workers:
+            await manager.stop()
+            await coordinator.stop()
+
+
+def test_identical_requests_on_two_workers_run_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'FOLLOW_INTERVAL', 0.05)
+    runs = []
+
+    async def runner(request, advance, resume=None):
+        runs.append(request.script)
+        await asyncio.sleep(0.3)
+        return ScriptResponse(enhanced_script=request.script.upper(), task_id='t1', status='finished',
+                              message='done')
+
+    request = ScriptRequest(script='hello there')
+    submitted = asyncio.run(_run_two_workers(tmp_path, runner, [(0, request), (1, request), (1, request)]))
+    assert runs == ['hello there']
+    assert len({job.id for job in submitted}) == 1
+    assert all(job.result.enhanced_script == 'HELLO THERE' for job in submitted)
+
+
+def test_different_requests_run_on_their_own_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'FOLLOW_INTERVAL', 0.05)
+    runs = []
+
+    async def runner(request, advance, resume=None):
+        runs.append(request.script)
+        return ScriptResponse(enhanced_script=request.script, task_id='t1', status='finished', message='done')
+
+    submissions = [(0, ScriptRequest(script='one')), (1, ScriptRequest(script='two'))]
+    asyncio.run(_run_two_workers(tmp_path, runner, submissions))
+    assert sorted(runs) == ['one', 'two']
+
+
+def test_key_is_free_again_once_the_job_finished(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'FOLLOW_INTERVAL', 0.05)
+    runs = []
+
+    async def runner(request, advance, resume=None):
+        runs.append(request.script)
+        return ScriptResponse(enhanced_script=request.script, task_id='t1', status='finished', message='done')
+
+    async def scenario():
+        first = await _run_two_workers(tmp_path, runner, [(0, ScriptRequest(script='again'))])
+        second = await _run_two_workers(tmp_path, runner, [(1, ScriptRequest(script='again'))])
+        return first + second
+
+    submitted = asyncio.run(scenario())
+    assert runs == ['again', 'again']
+    assert submitted[0].id != submitted[1].id
@@ -0,0 +1,194 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+import s3_storage
+from s3_storage import MIN_PART_SIZE, S3MultipartWriter, S3Uploader, upload_stream_to_s3
+
+
+def _client_error(code: str, status: int) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+                       'UploadPart')
+
+
+class StubS3:
+    """Records calls like a boto3 S3 client; `failures[method]` lists errors to raise first."""
+
+    def __init__(self, failures=None):
+        self.calls = []
+        self.failures = failures or {}
+        self.parts = {}
+        self.objects = {}
+
+    def _record(self, method, **params):
+        self.calls.append((method, params))
+        pending = self.failures.get(method)
+        if pending:
+            raise pending.pop(0)
+
+    def methods(self):
+        return [method for method, _ in self.calls]
+
+    def create_multipart_upload(self, **params):
+        self._record('create_multipart_upload', **params)
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, **params):
+        self._record('upload_part', **params)
+        self.parts[params['PartNumber']] = params['Body']
+        return {'ETag': f"etag-{params['PartNumber']}"}
+
+    def complete_multipart_upload(self, **params):
+        self._record('complete_multipart_upload', **params)
+        numbers = [part['PartNumber'] for part in params['MultipartUpload']['Parts']]
+        self.objects[params['Key']] = b''.join(self.parts[number] for number in numbers)
+
+    def abort_multipart_upload(self, **params):
+        self._record('abort_multipart_upload', **params)
+
+    def put_object(self, **params):
+        self._record('put_object', **params)
+        self.objects[params['Key']] = params['Body']
+
+    def head_object(self, **params):
+        self._record('head_object', **params)
+        if params['Key'] not in self.objects:
+            raise _client_error('404', 404)
+
+    def upload_file(self, file_path, bucket, key, Config=None, ExtraArgs=None):
+        self._record('upload_file', Key=key)
+        with open(file_path, 'rb') as f:
+            self.objects[key] = f.read()
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self._record('generate_presigned_url', **Params)
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def _upload(client, data: bytes, write_size: int = 1024 * 1024, **options):
+    async def run():
+        writer = S3MultipartWriter('bucket', 'key.mp3', part_size=MIN_PART_SIZE, s3_client=client,
+                                   retry_delay=0, **options)
+        await writer.start()
+        for start in range(0, len(data), write_size):
+            await writer.write(data[start:start + write_size])
+        await writer.complete()
+        return writer
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('size, parts', [
+    (MIN_PART_SIZE, [MIN_PART_SIZE]),
+    (MIN_PART_SIZE + 1, [MIN_PART_SIZE, 1]),
+    (2 * MIN_PART_SIZE, [MIN_PART_SIZE, MIN_PART_SIZE]),
+    (2 * MIN_PART_SIZE + 123, [MIN_PART_SIZE, MIN_PART_SIZE, 123]),
+])
+def test_parts_split_at_part_size(size, parts):
+    client = StubS3()
+    data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    writer = _upload(client, data, write_size=700_001)
+    assert [len(client.parts[number]) for number in sorted(client.parts)] == parts
+    assert client.objects['key.mp3'] == data
+    assert writer.bytes_written == size
+    assert 'put_object' not in client.methods()
+
+
+@pytest.mark.parametrize('size', [0, 1, MIN_PART_SIZE - 1])
+def test_payload_under_one_part_uses_single_put(size):
+    client = StubS3()
+    _upload(client, b'x' * size)
+    assert client.methods() == ['put_object']
+    assert client.objects['key.mp3'] == b'x' * size
+
+
+def test_transient_errors_are_retried():
+    client = StubS3(failures={
+        'upload_part': [_client_error('SlowDown', 503), _client_error('InternalError', 500)],
+        'complete_multipart_upload': [_client_error('RequestTimeout', 400)],
+    })
+    data = b'a' * (MIN_PART_SIZE + 10)
+    writer = _upload(client, data)
+    assert writer.retried == 3
+    assert client.objects['key.mp3'] == data
+
+
+def test_permanent_error_is_not_retried():
+    client = StubS3(failures={'put_object': [_client_error('AccessDenied', 403)]})
+    with pytest.raises(ClientError):
+        _upload(client, b'small')
+    assert client.methods() == ['put_object']
+
+
+def test_retries_give_up_after_limit():
+    client = StubS3(failures={'put_object': [_client_error('SlowDown', 503)] * 3})
+    with pytest.raises(ClientError):
+        _upload(client, b'small', retries=2)
+    assert client.methods() == ['put_object'] * 3
+
+
+@pytest.fixture
+def shared_client(monkeypatch):
+    client = StubS3()
+    uploader = S3Uploader()
+    uploader._client = client
+    monkeypatch.setattr(s3_storage, 's3_uploader', uploader)
+    return client
+
+
+async def _stream(data: bytes, fail_after: int = None):
+    for index, start in enumerate(range(0, len(data), 1024 * 1024)):
+        if fail_after is not None and index == fail_after:
+            raise IOError('source stream broke')
+        yield data[start:start + 1024 * 1024]
+
+
+def test_failed_part_aborts_the_upload(shared_client):
+    shared_client.failures['upload_part'] = [_client_error('AccessDenied', 403)]
+    url = asyncio.run(upload_stream_to_s3(_stream(b'b' * (2 * MIN_PART_SIZE)), 'bucket', 'key.mp3',
+                                          part_size=MIN_PART_SIZE))
+    assert url is None
+    assert shared_client.methods()[-1] == 'abort_multipart_upload'
+    assert 'complete_multipart_upload' not in shared_client.methods()
+
+
+def test_broken_source_aborts_the_upload(shared_client):
+    url = asyncio.run(upload_stream_to_s3(_stream(b'c' * (2 * MIN_PART_SIZE), fail_after=7), 'bucket',
+                                          'key.mp3', part_size=MIN_PART_SIZE))
+    assert url is None
+    assert shared_client.methods()[-1] == 'abort_multipart_upload'
+
+
+def test_stream_upload_returns_presigned_url(shared_client):
+    url = asyncio.run(upload_stream_to_s3(_stream(b'd' * 1000), 'bucket', 'key.mp3'))
+    assert url.startswith('https://s3.test/bucket/key.mp3')
+    assert shared_client.objects['key.mp3'] == b'd' * 1000
+
+
+def test_uploader_skips_existing_objects_and_reuses_presigned_urls(tmp_path):
+    client = StubS3()
+    uploader = S3Uploader()
+    uploader._client = client
+    path = tmp_path / 'audio.mp3'
+    path.write_bytes(b'mp3')
+    first = uploader.upload_file(str(path), 'bucket', 'audio.mp3')
+    second = uploader.upload_file(str(path), 'bucket', 'audio.mp3')
+    assert first == second
+    assert client.methods().count('upload_file') == 1
+    assert client.methods().count('generate_presigned_url') == 1
+    assert uploader.stats()['skipped_uploads'] == 1
+
+
+def test_writer_builds_shared_client_off_the_event_loop(monkeypatch):
+    client = StubS3()
+    uploader = S3Uploader()
+    monkeypatch.setattr(s3_storage, 's3_uploader', uploader)
+    monkeypatch.setattr(s3_storage, 'make_s3_client', lambda: client)
+
+    async def run():
+        writer = S3MultipartWriter('bucket', 'key.mp3')
+        assert uploader._client is None
+        await writer.start()
+        return writer
+
+    assert asyncio.run(run()).s3_client is client
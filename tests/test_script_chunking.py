@@ -0,0 +1,48 @@
+import re
+
+import pytest
+
+from script_chunking import split_script
+
+LONG_SCRIPT = '\n\n'.join(
+    ' '.join(
+        f'Sentence {p}.{s} says "hello there" (quietly) to everyone in the room{"!" if s % 3 else "."}'
+        for s in range(12)
+    )
+    for p in range(20)
+)
+
+
+def _words(text: str) -> str:
+    return ' '.join(text.split())
+
+
+@pytest.mark.parametrize('max_chars', [60, 250, 1000, 2500])
+def test_round_trip_long_script(max_chars):
+    chunks = split_script(LONG_SCRIPT, max_chars)
+    assert _words(' '.join(chunks)) == _words(LONG_SCRIPT)
+    assert all(0 < len(chunk) <= max_chars for chunk in chunks)
+
+
+def test_closing_quotes_and_brackets_stay_with_their_sentence():
+    script = 'He said "Stop." Then left. (He meant it!) She asked \'why?\' [No answer.] Done.'
+    chunks = split_script(script, 20)
+    assert _words(' '.join(chunks)) == _words(script)
+    assert 'He said "Stop."' in chunks
+    assert '(He meant it!)' in chunks
+
+
+def test_paragraph_breaks_survive_packing():
+    assert split_script('One.\n\nTwo.', 100) == ['One.\n\nTwo.']
+
+
+def test_word_longer_than_max_chars_is_hard_split():
+    word = 'x' * 25
+    chunks = split_script(f'Short start. {word} end.', 10)
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert re.sub(r'\s+', '', ''.join(chunks)) == f'Shortstart.{word}end.'
+
+
+def test_rejects_non_positive_max_chars():
+    with pytest.raises(ValueError):
+        split_script('Hello.', 0)
@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+
+from rate_limits import ServiceLimiter
+from task_poller import TaskPoller
+
+
+def test_rate_limited_poll_pauses_the_service_limiter():
+    limiter = ServiceLimiter('browser_use', rate=5, burst=5, max_concurrency=0)
+    calls = []
+
+    async def fetch(task_id, api_key):
+        calls.append(task_id)
+        if len(calls) == 1:
+            request = httpx.Request('GET', 'https://example.invalid/task')
+            response = httpx.Response(429, headers={'Retry-After': '0.2'}, request=request)
+            raise httpx.HTTPStatusError('rate limited', request=request, response=response)
+        return {'status': 'finished'}
+
+    async def scenario():
+        poller = TaskPoller(fetch, min_interval=0.01, max_interval=0.05, push_enabled=False,
+                            on_rate_limited=limiter.pause)
+        details = await poller.wait('task-1', 'key', timeout=5, poll_now=True)
+        return poller, details
+
+    poller, details = asyncio.run(scenario())
+    assert details['status'] == 'finished'
+    assert poller.rate_limited == 1
+    assert limiter.paused_until > 0
+    assert limiter.tokens == 0
+
+
+def test_cancelled_waiter_stops_the_polling():
+    calls = []
+
+    async def fetch(task_id, api_key):
+        calls.append(task_id)
+        return {'status': 'running'}
+
+    async def scenario():
+        poller = TaskPoller(fetch, min_interval=0.01, max_interval=0.02, push_enabled=False)
+        waiter = asyncio.create_task(poller.wait('task-1', 'key', timeout=60, poll_now=True))
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        polls = len(calls)
+        await asyncio.sleep(0.1)
+        return poller, polls
+
+    poller, polls = asyncio.run(scenario())
+    assert polls > 0
+    assert len(calls) == polls
+    assert poller.watches == {}
+    assert poller._runner.done()
+
+
+def test_watch_stays_while_another_request_waits():
+    async def fetch(task_id, api_key):
+        return {'status': 'running'}
+
+    async def scenario():
+        poller = TaskPoller(fetch, min_interval=0.01, max_interval=0.02, push_enabled=False)
+        first = asyncio.create_task(poller.wait('task-1', 'key', timeout=60))
+        second = asyncio.create_task(poller.wait('task-1', 'key', timeout=60))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        still_watched = 'task-1' in poller.watches
+        poller.notify('task-1', 'finished', {'status': 'finished', 'steps': []})
+        return still_watched, await second
+
+    still_watched, details = asyncio.run(scenario())
+    assert still_watched
+    assert details['status'] == 'finished'
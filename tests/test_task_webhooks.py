@@ -0,0 +1,81 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from task_webhooks import (
+    InvalidWebhook, SIGNATURE_HEADER, STATUS_EVENT, TIMESTAMP_HEADER, sign_body, verify_event,
+)
+
+SECRET = 'test-secret'
+
+
+def _delivery(event: dict, timestamp: str = None):
+    timestamp = timestamp or str(int(time.time()))
+    body = json.dumps(event).encode('utf-8')
+    return body, sign_body(SECRET, timestamp, body), timestamp
+
+
+def _status_event(task_id: str, status: str = 'finished') -> dict:
+    return {'type': STATUS_EVENT, 'payload': {'task_id': task_id, 'status': status}}
+
+
+def test_valid_signature_returns_the_event():
+    body, signature, timestamp = _delivery(_status_event('task-1'))
+    event = verify_event(body, signature, timestamp, secret=SECRET)
+    assert event['payload']['task_id'] == 'task-1'
+
+
+def test_iso_timestamps_are_accepted():
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    body, signature, timestamp = _delivery(_status_event('task-1'), timestamp)
+    assert verify_event(body, signature, timestamp, secret=SECRET)['type'] == STATUS_EVENT
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda body: body.replace(b'finished', b'failed'),
+    # The event type lives outside the payload and is signed as well
+    lambda body: body.replace(STATUS_EVENT.encode(), b'agent.task.other'),
+    lambda body: body + b' ',
+])
+def test_tampered_body_is_rejected(tamper):
+    body, signature, timestamp = _delivery(_status_event('task-1'))
+    with pytest.raises(InvalidWebhook, match='Signature mismatch'):
+        verify_event(tamper(body), signature, timestamp, secret=SECRET)
+
+
+def test_stale_timestamp_is_rejected():
+    body, signature, timestamp = _delivery(_status_event('task-1'), str(int(time.time()) - 3600))
+    with pytest.raises(InvalidWebhook, match='allowed window'):
+        verify_event(body, signature, timestamp, secret=SECRET, tolerance=300)
+
+
+def test_missing_headers_are_rejected():
+    body, signature, timestamp = _delivery(_status_event('task-1'))
+    with pytest.raises(InvalidWebhook):
+        verify_event(body, None, timestamp, secret=SECRET)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, 'WEBHOOK_SECRET', SECRET)
+    return TestClient(api.app)
+
+
+def test_webhook_for_an_unknown_task_is_acknowledged(client):
+    body, signature, timestamp = _delivery(_status_event('unknown-task'))
+    response = client.post('/webhooks/browser-use', content=body,
+                           headers={SIGNATURE_HEADER: signature, TIMESTAMP_HEADER: timestamp})
+    assert response.status_code == 200
+    assert response.json() == {'ok': True, 'matched': False}
+    # Kept in case the task is watched only after its event arrived
+    assert 'unknown-task' in api.task_poller._early_events
+
+
+def test_webhook_with_a_bad_signature_is_refused(client):
+    body, _, timestamp = _delivery(_status_event('task-1'))
+    response = client.post('/webhooks/browser-use', content=body,
+                           headers={SIGNATURE_HEADER: '0' * 64, TIMESTAMP_HEADER: timestamp})
+    assert response.status_code == 401
@@ -0,0 +1,250 @@
+import asyncio
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Optional
+from coordination import open_shared_db
+from mp3_concat import audio_duration
+from metrics import log_message
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _mp3_duration(path: str) -> Optional[float]:
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0.0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return round(audio_duration(mapped), 3)
+    except (OSError, ValueError):
+        return None
+
+
+class UploadsCache:
+    """
+    Size- and age-bounded LRU cache over its own directory (uploads/cache/ by default), so files
+    it did not write, such as the MP3s checked into uploads/, are never evicted. Every stored MP3
+    is tracked in a SQLite index (size, duration, last access, S3 key); files are written to a temp
+    name and renamed into place, so readers never see partial audio. Eviction runs in the
+    background and removes expired entries first, then the least recently used.
+    """
+
+    def __init__(self, directory: Optional[str] = None, index_path: Optional[str] = None,
+                 max_bytes: Optional[int] = None, max_age: Optional[float] = None):
+        self.directory = directory or os.getenv('UPLOADS_CACHE_DIR', os.path.join('uploads', 'cache'))
+        self.index_path = index_path or os.getenv('UPLOADS_INDEX_PATH', os.path.join('data', 'uploads.db'))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('UPLOADS_CACHE_MAX_BYTES', str(1024 ** 3)))
+        self.max_age = max_age if max_age is not None else float(os.getenv('UPLOADS_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_shared_db(self.index_path)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    history_item_id TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    duration REAL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    s3_key TEXT
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)')
+            self._conn.commit()
+        return self._conn
+
+    def path_for(self, history_item_id: str) -> str:
+        if not _SAFE_ID.match(history_item_id):
+            raise ValueError(f'Invalid history item id: {history_item_id!r}')
+        return os.path.join(self.directory, f"{history_item_id}.mp3")
+
+    def _owns(self, path: str) -> bool:
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.directory)
+
+    def _record(self, history_item_id: str, path: str, s3_key: Optional[str] = None):
+        size = os.path.getsize(path)
+        duration = _mp3_duration(path)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute('''
+                INSERT INTO entries (history_item_id, path, size, duration, created_at, last_access, s3_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(history_item_id) DO UPDATE SET
+                    path = excluded.path, size = excluded.size, duration = excluded.duration,
+                    last_access = excluded.last_access, s3_key = COALESCE(excluded.s3_key, entries.s3_key)
+            ''', (history_item_id, path, size, duration, now, now, s3_key))
+            db.commit()
+        if self._wakeup is not None and not self._loop.is_closed():
+            # May run in a worker thread
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def lookup(self, history_item_id: str) -> Optional[str]:
+        """Path of a cached file (refreshing its LRU position), or None on a miss."""
+        with self._lock:
+            row = self._db().execute('SELECT path FROM entries WHERE history_item_id = ?',
+                                     (history_item_id,)).fetchone()
+            if row and os.path.isfile(row[0]):
+                self._db().execute('UPDATE entries SET last_access = ? WHERE history_item_id = ?',
+                                   (time.time(), history_item_id))
+                self._db().commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                # The file vanished behind our back
+                self._db().execute('DELETE FROM entries WHERE history_item_id = ?', (history_item_id,))
+                self._db().commit()
+        try:
+            path = self.path_for(history_item_id)
+        except ValueError:
+            path = None
+        if path and os.path.isfile(path):
+            # Untracked file from before the index existed: adopt it
+            self._record(history_item_id, path)
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def entry(self, history_item_id: str) -> Optional[dict]:
+        with self._lock:
+            cursor = self._db().execute('SELECT * FROM entries WHERE history_item_id = ?', (history_item_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def set_s3_key(self, history_item_id: str, s3_key: str):
+        with self._lock:
+            db = self._db()
+            db.execute('UPDATE entries SET s3_key = ? WHERE history_item_id = ?', (s3_key, history_item_id))
+            db.commit()
+
+    def _temp_path(self, history_item_id: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f".{history_item_id}.{uuid.uuid4().hex}.tmp")
+
+    async def tee(self, history_item_id: str, chunks: AsyncIterator[bytes],
+                  s3_key: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        Pass `chunks` through while writing them to the cache. The file only appears under its
+        final name once the stream completed; on any error the temp file is removed.
+        """
+        final_path = self.path_for(history_item_id)
+        temp_path = self._temp_path(history_item_id)
+        try:
+            with open(temp_path, 'wb') as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(temp_path, final_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        await asyncio.to_thread(self._record, history_item_id, final_path, s3_key)
+
+    def add_file(self, history_item_id: str, source_path: str, s3_key: Optional[str] = None) -> str:
+        """Move an already complete file into the cache (atomically when on the same filesystem)."""
+        final_path = self.path_for(history_item_id)
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            os.replace(source_path, final_path)
+        except OSError:
+            # Different filesystem: copy next to the target first so the rename stays atomic
+            temp_path = self._temp_path(history_item_id)
+            with open(source_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    dst.write(block)
+            os.replace(temp_path, final_path)
+            os.remove(source_path)
+        self._record(history_item_id, final_path, s3_key)
+        return final_path
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until under the size limit."""
+        removed = 0
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            rows = db.execute('SELECT history_item_id, path, size, last_access FROM entries ORDER BY last_access').fetchall()
+            total = sum(row[2] for row in rows)
+            for history_item_id, path, size, last_access in rows:
+                expired = self.max_age > 0 and now - last_access > self.max_age
+                if not expired and total <= self.max_bytes:
+                    continue
+                try:
+                    if self._owns(path):
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                db.execute('DELETE FROM entries WHERE history_item_id = ?', (history_item_id,))
+                total -= size
+                removed += 1
+            db.commit()
+        self.evictions += removed
+        if removed:
+            log_message(f"Uploads cache: evicted {removed} files")
+        return removed
+
+    def scan(self):
+        """
+        Reconcile the index with the directory: adopt untracked MP3s, forget missing files and
+        entries outside the directory (indexed by older versions), leaving those files alone.
+        """
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.tmp') and name.startswith('.'):
+                    # Leftover from a crashed write
+                    os.remove(os.path.join(self.directory, name))
+                elif name.endswith('.mp3') and _SAFE_ID.match(name[:-4]) and self.entry(name[:-4]) is None:
+                    self._record(name[:-4], os.path.join(self.directory, name))
+        with self._lock:
+            db = self._db()
+            for history_item_id, path in db.execute('SELECT history_item_id, path FROM entries').fetchall():
+                if not os.path.isfile(path) or not self._owns(path):
+                    db.execute('DELETE FROM entries WHERE history_item_id = ?', (history_item_id,))
+            db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._db().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    async def run_eviction(self, interval: float = 60):
+        """Background loop: evict periodically and soon after new files are written."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.scan)
+        while True:
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                log_message(f"Uploads cache eviction error: {e}", level='error')
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
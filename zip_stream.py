@@ -0,0 +1,160 @@
+"""
+Forward-only reader for zip archives arriving as an async byte stream.
+
+Entries are read from their local file headers in order, and each entry's data is handed out
+chunk by chunk (inflated on the fly for deflate). Nothing is buffered beyond one network chunk,
+and the central directory at the end is never needed. Stored entries must carry their sizes in
+the local header; deflated entries may use a trailing data descriptor.
+"""
+import struct
+import zlib
+from typing import AsyncIterator, Optional
+
+LOCAL_HEADER = b'PK\x03\x04'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+# Anything else after the entries (central directory, end record) ends the stream
+_LOCAL_HEADER_FORMAT = struct.Struct('<HHHHHIIIHH')
+_STORED, _DEFLATED = 0, 8
+_HAS_DESCRIPTOR = 0x08
+_ZIP64_MARKER = 0xFFFFFFFF
+
+
+class ZipStreamError(Exception):
+    pass
+
+
+class _Reader:
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._eof = False
+
+    async def _fill(self) -> bool:
+        if self._eof:
+            return False
+        try:
+            self._buffer += await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            return False
+        return True
+
+    async def read_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            if not await self._fill():
+                raise ZipStreamError('Archive ended unexpectedly')
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def read_some(self, limit: int) -> bytes:
+        """Up to `limit` bytes (at least one), without waiting for more than one chunk."""
+        if not self._buffer and not await self._fill():
+            raise ZipStreamError('Archive ended unexpectedly')
+        data = bytes(self._buffer[:limit])
+        del self._buffer[:len(data)]
+        return data
+
+    def unread(self, data: bytes):
+        self._buffer[:0] = data
+
+
+class ZipEntry:
+    def __init__(self, reader: _Reader, name: str, method: int, flags: int, crc: int, size: Optional[int]):
+        self.name = name
+        self._reader = reader
+        self._method = method
+        self._flags = flags
+        self._crc = crc
+        # Compressed size, or None when it only follows the data in a descriptor
+        self._size = size
+        self._consumed = False
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """The entry's uncompressed data; must be read before moving to the next entry."""
+        if self._consumed:
+            raise ZipStreamError(f'Entry {self.name} was already read')
+        self._consumed = True
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS) if self._method == _DEFLATED else None
+        crc = 0
+        remaining = self._size
+        while remaining is None or remaining > 0:
+            raw = await self._reader.read_some(remaining if remaining is not None else 64 * 1024)
+            if remaining is not None:
+                remaining -= len(raw)
+            data = inflater.decompress(raw) if inflater is not None else raw
+            if data:
+                crc = zlib.crc32(data, crc)
+                yield data
+            if inflater is not None and inflater.eof:
+                if remaining is None:
+                    # Compressed data ended inside this chunk; the rest belongs to what follows
+                    self._reader.unread(inflater.unused_data)
+                break
+        if inflater is not None:
+            tail = inflater.flush()
+            if tail:
+                crc = zlib.crc32(tail, crc)
+                yield tail
+        if self._flags & _HAS_DESCRIPTOR:
+            await self._read_descriptor()
+        if crc != self._crc:
+            raise ZipStreamError(f'CRC mismatch in {self.name}')
+
+    async def _read_descriptor(self):
+        head = await self._reader.read_exact(4)
+        if head == DATA_DESCRIPTOR:
+            head = await self._reader.read_exact(4)
+        self._crc = struct.unpack('<I', head)[0]
+        await self._reader.read_exact(8)
+        # A zip64 descriptor has 8-byte sizes; tell them apart by what follows
+        peek = await self._reader.read_exact(4)
+        if peek in (LOCAL_HEADER, b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06'):
+            self._reader.unread(peek)
+        else:
+            await self._reader.read_exact(4)
+
+    async def drain(self):
+        if not self._consumed:
+            async for _ in self.chunks():
+                pass
+
+
+def _zip64_sizes(extra: bytes):
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, position)
+        if header_id == 0x0001 and length >= 16:
+            return struct.unpack_from('<QQ', extra, position + 4)
+        position += 4 + length
+    return None
+
+
+async def iter_zip_entries(chunks: AsyncIterator[bytes]) -> AsyncIterator[ZipEntry]:
+    """Yield the entries of a zip stream in archive order. Unread entry data is skipped automatically."""
+    reader = _Reader(chunks)
+    entry: Optional[ZipEntry] = None
+    while True:
+        if entry is not None:
+            await entry.drain()
+        signature = await reader.read_exact(4)
+        if signature != LOCAL_HEADER:
+            return
+        (_, flags, method, _, _, crc, compressed, uncompressed,
+         name_length, extra_length) = _LOCAL_HEADER_FORMAT.unpack(await reader.read_exact(26))
+        name = (await reader.read_exact(name_length)).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = await reader.read_exact(extra_length)
+        if method not in (_STORED, _DEFLATED):
+            raise ZipStreamError(f'Unsupported compression method {method} for {name}')
+        size: Optional[int] = compressed
+        if compressed == _ZIP64_MARKER or uncompressed == _ZIP64_MARKER:
+            sizes = _zip64_sizes(extra)
+            if sizes is None:
+                raise ZipStreamError(f'Missing zip64 sizes for {name}')
+            uncompressed, size = sizes
+        if flags & _HAS_DESCRIPTOR and not size:
+            if method == _STORED:
+                raise ZipStreamError(f'Stored entry {name} has no size in its header; cannot stream it')
+            size = None
+        entry = ZipEntry(reader, name, method, flags, crc, size)
+        yield entry